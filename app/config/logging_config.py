@@ -0,0 +1,143 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import traceback
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional
+from app.config.settings import settings
+
+# 当前请求的ID，由请求日志中间件设置，写入每条日志
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# LogRecord自带的属性，其余属性视为通过extra传入的结构化字段
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+
+class JSONFormatter(logging.Formatter):
+    """每条日志输出为一行JSON，extra传入的字段原样附加"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).astimezone().isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = "".join(traceback.format_exception(*record.exc_info))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """开发时使用的单行文本格式"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        if getattr(record, "request_id", None) is None:
+            record.request_id = "-"
+        return super().format(record)
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """只在调用线程中记录请求ID并入队，格式化与写入都交给后台线程
+
+    队列满时（磁盘阻塞等）丢弃日志并计数，而不是阻塞事件循环。
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 队列在进程内，无需像默认实现那样提前格式化消息
+        record.request_id = request_id_var.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[ContextQueueHandler] = None
+
+
+def _file_handler() -> Optional[logging.Handler]:
+    """按配置创建文件日志处理器，LOG_FILE为空时不写文件"""
+    if not settings.log_file:
+        return None
+    directory = os.path.dirname(settings.log_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if settings.log_rotation == "time":
+        return logging.handlers.TimedRotatingFileHandler(
+            settings.log_file, when=settings.log_rotate_when,
+            backupCount=settings.log_backup_count, encoding="utf-8"
+        )
+    if settings.log_rotation == "size":
+        return logging.handlers.RotatingFileHandler(
+            settings.log_file, maxBytes=settings.log_max_bytes,
+            backupCount=settings.log_backup_count, encoding="utf-8"
+        )
+    return logging.FileHandler(settings.log_file, encoding="utf-8")
+
+
+def setup_logging():
+    """配置根日志：事件循环线程只入队，后台线程负责格式化与写入控制台/文件"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    formatter = JSONFormatter() if settings.log_format == "json" else TextFormatter()
+    handlers = [logging.StreamHandler(sys.stdout)]
+    try:
+        file_handler = _file_handler()
+    except OSError as e:
+        file_handler = None
+        print(f"无法打开日志文件 {settings.log_file}，仅输出到控制台: {e}", file=sys.stderr)
+    if file_handler is not None:
+        handlers.append(file_handler)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    _queue_handler = ContextQueueHandler(queue.Queue(settings.log_queue_size))
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(settings.log_level.upper())
+    # httpx对每个上游请求都记录一条INFO日志，访问日志已覆盖
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging():
+    """写完队列中剩余的日志并停止后台线程"""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
+def dropped_log_records() -> int:
+    """因队列已满而丢弃的日志条数"""
+    return _queue_handler.dropped if _queue_handler is not None else 0
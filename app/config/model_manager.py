@@ -1,60 +1,293 @@
+import asyncio
 import json
+import logging
 import os
-from typing import Dict, List, Optional
+import signal
+from typing import Any, Dict, List, Optional, Tuple
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
 class ModelConfig:
-    """模型配置类"""
+    """模型配置类（不可变，重新加载时整体替换）"""
+    __slots__ = (
+        "name", "provider", "family", "families", "parameter_size", "quantization", "format",
+        "description", "context_length", "capabilities", "response_cache", "single_flight",
+        "embedding_batch_size", "embedding_max_batch_tokens", "hedge", "backends", "timeout",
+        "semantic_cache", "semantic_cache_threshold", "embedding_dimensions_mode"
+    )
+
     def __init__(self, name: str, config: Dict):
-        self.name = name
-        self.provider = config.get('provider', 'unknown')
-        self.family = config.get('family', 'unknown')
-        self.families = config.get('families', [self.family])
-        self.parameter_size = config.get('parameter_size', '7B')
-        self.quantization = config.get('quantization', 'Q4_0')
-        self.format = config.get('format', 'gguf')
-        self.description = config.get('description', '')
-        self.context_length = config.get('context_length', 4096)
-        self.capabilities = config.get('capabilities', ['text', 'chat'])
+        init = object.__setattr__
+        init(self, "name", name)
+        init(self, "provider", config.get('provider', 'unknown'))
+        init(self, "family", config.get('family', 'unknown'))
+        init(self, "families", tuple(config.get('families', [self.family])))
+        init(self, "parameter_size", config.get('parameter_size', '7B'))
+        init(self, "quantization", config.get('quantization', 'Q4_0'))
+        init(self, "format", config.get('format', 'gguf'))
+        init(self, "description", config.get('description', ''))
+        init(self, "context_length", config.get('context_length', 4096))
+        init(self, "capabilities", tuple(config.get('capabilities', ['text', 'chat'])))
+        # 是否对该模型启用精确匹配响应缓存
+        init(self, "response_cache", config.get('response_cache', False))
+        # 是否合并相同的并发请求（采样参数使结果不确定，需按模型开启）
+        init(self, "single_flight", config.get('single_flight', False))
+        # 嵌入批量调用限制，批大小为1表示提供商不支持批量
+        init(self, "embedding_batch_size", config.get('embedding_batch_size', 16))
+        init(self, "embedding_max_batch_tokens", config.get('embedding_max_batch_tokens', 8192))
+        # 非流式请求慢于该模型延迟百分位时发出对冲请求
+        init(self, "hedge", config.get('hedge', False))
+        # 可选的多个上游后端：[{"provider": ..., "model": ..., "weight": ...}]，顺序即回退顺序
+        init(self, "backends", tuple(dict(backend) for backend in config.get('backends', [])))
+        # 请求截止时间（秒），未设置时使用REQUEST_TIMEOUT
+        init(self, "timeout", config.get('timeout'))
+        # 是否启用语义缓存，及命中所需的余弦相似度（未设置时使用SEMANTIC_CACHE_THRESHOLD）
+        init(self, "semantic_cache", config.get('semantic_cache', False))
+        init(self, "semantic_cache_threshold", config.get('semantic_cache_threshold'))
+        # 请求指定dimensions时的处理方式：upstream传给提供商，truncate在本地截断并重新归一化（Matryoshka模型）
+        init(self, "embedding_dimensions_mode", config.get('embedding_dimensions_mode'))
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError(f"ModelConfig is immutable, cannot set '{name}'")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为配置文件格式"""
+        return {
+            "provider": self.provider,
+            "family": self.family,
+            "families": list(self.families),
+            "parameter_size": self.parameter_size,
+            "quantization": self.quantization,
+            "format": self.format,
+            "description": self.description,
+            "context_length": self.context_length,
+            "capabilities": list(self.capabilities),
+            "response_cache": self.response_cache,
+            "single_flight": self.single_flight,
+            "embedding_batch_size": self.embedding_batch_size,
+            "embedding_max_batch_tokens": self.embedding_max_batch_tokens,
+            "hedge": self.hedge,
+            "backends": [dict(backend) for backend in self.backends],
+            "timeout": self.timeout,
+            "semantic_cache": self.semantic_cache,
+            "semantic_cache_threshold": self.semantic_cache_threshold,
+            "embedding_dimensions_mode": self.embedding_dimensions_mode
+        }
+
+# 按模型开关的功能，取值必须为布尔值
+BOOLEAN_FIELDS = ("response_cache", "single_flight", "hedge", "semantic_cache")
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _validate_model(model_name: str, config: Dict):
+    """校验单个模型配置（已合并默认设置），格式错误时抛出ValueError
+
+    重新加载时校验失败则保留当前目录，因此请求时才会用到的字段同样在此检查类型与范围。
+    """
+    if not isinstance(config, dict):
+        raise ValueError(f"模型 {model_name} 的配置必须是对象")
+    for key in ("families", "capabilities", "backends"):
+        if key in config and not isinstance(config[key], list):
+            raise ValueError(f"模型 {model_name} 的 {key} 必须是列表")
+    for key in BOOLEAN_FIELDS:
+        if key in config and not isinstance(config[key], bool):
+            raise ValueError(f"模型 {model_name} 的 {key} 必须是true或false")
+    batch_size = config.get("embedding_batch_size", 1)
+    if not isinstance(batch_size, int) or isinstance(batch_size, bool) or batch_size < 1:
+        raise ValueError(f"模型 {model_name} 的 embedding_batch_size 必须是正整数")
+    max_batch_tokens = config.get("embedding_max_batch_tokens", 0)
+    if not isinstance(max_batch_tokens, int) or isinstance(max_batch_tokens, bool) or max_batch_tokens < 0:
+        raise ValueError(f"模型 {model_name} 的 embedding_max_batch_tokens 必须是非负整数")
+    timeout = config.get("timeout")
+    if timeout is not None and (not _is_number(timeout) or timeout < 0):
+        raise ValueError(f"模型 {model_name} 的 timeout 必须是非负数")
+    threshold = config.get("semantic_cache_threshold")
+    if threshold is not None and (not _is_number(threshold) or not 0 < threshold <= 1):
+        raise ValueError(f"模型 {model_name} 的 semantic_cache_threshold 必须在(0, 1]之间")
+    if config.get("embedding_dimensions_mode") not in (None, "upstream", "truncate"):
+        raise ValueError(f"模型 {model_name} 的 embedding_dimensions_mode 必须是upstream或truncate")
+    for backend in config.get("backends", []):
+        if not isinstance(backend, dict) or not backend.get("provider") or not backend.get("model"):
+            raise ValueError(f"模型 {model_name} 的后端必须包含provider和model")
+        if not _is_number(backend.get("weight", 1)) or backend.get("weight", 1) <= 0:
+            raise ValueError(f"模型 {model_name} 的后端权重必须为正数")
+
+class _Snapshot:
+    """某一时刻的完整模型目录及其倒排索引，创建后不再修改"""
+    __slots__ = ("models", "default_settings", "by_provider", "by_capability", "by_family", "version")
+
+    def __init__(self, models: Dict[str, ModelConfig], default_settings: Dict, version: int):
+        self.models = models
+        self.default_settings = default_settings
+        self.version = version
+        by_provider: Dict[str, List[str]] = {}
+        by_capability: Dict[str, List[str]] = {}
+        by_family: Dict[str, List[str]] = {}
+        for name, config in models.items():
+            by_provider.setdefault(config.provider, []).append(name)
+            for capability in config.capabilities:
+                by_capability.setdefault(capability, []).append(name)
+            for family in dict.fromkeys((config.family,) + config.families):
+                by_family.setdefault(family, []).append(name)
+        self.by_provider = {key: tuple(names) for key, names in by_provider.items()}
+        self.by_capability = {key: tuple(names) for key, names in by_capability.items()}
+        self.by_family = {key: tuple(names) for key, names in by_family.items()}
 
 class ModelManager:
-    """模型配置管理器"""
-    
+    """模型配置管理器
+
+    所有读取都基于当前快照；加载、增删模型时构建新快照并一次性替换，
+    正在处理的请求不会看到加载了一半的目录。配置文件在第一次读取时才加载，
+    导入模块本身不做文件I/O。
+    """
+
     def __init__(self, config_path: Optional[str] = None):
         if config_path is None:
             # 默认配置文件路径
             config_path = Path(__file__).parent / 'models_config.json'
-        
+
         self.config_path = config_path
-        self._models: Dict[str, ModelConfig] = {}
-        self._default_settings = {}
-        self.load_config()
-    
-    def load_config(self):
-        """加载模型配置文件"""
+        self._current: Optional[_Snapshot] = None
+        self._config_mtime: Optional[float] = None
+        self._watch_task: Optional[asyncio.Task] = None
+
+    @property
+    def _snapshot(self) -> _Snapshot:
+        snapshot = self._current
+        if snapshot is None:
+            self.load_config()
+            snapshot = self._current
+        return snapshot
+
+    @property
+    def version(self) -> int:
+        """配置每次变化（加载、增删模型）时递增，供预计算的响应判断是否过期"""
+        return self._snapshot.version
+
+    def _parse_config(self, strict: bool = True) -> Tuple[Dict[str, ModelConfig], Dict, Optional[float]]:
+        """读取并校验配置文件，返回(模型配置, 默认设置, 文件修改时间)；不修改当前状态
+
+        strict为False时跳过校验失败的模型条目并记录错误，其余模型照常加载；
+        default_settings或models本身不是对象时总是抛出ValueError。
+        """
+        mtime = os.path.getmtime(self.config_path)
+        with open(self.config_path, 'r', encoding='utf-8') as f:
+            config_data = json.load(f)
+
+        # 加载默认设置
+        default_settings = config_data.get('default_settings', {})
+        if not isinstance(default_settings, dict):
+            raise ValueError("default_settings 必须是对象")
+
+        # 加载模型配置
+        models_data = config_data.get('models', {})
+        if not isinstance(models_data, dict):
+            raise ValueError("models 必须是对象")
+        models = {}
+        for model_name, model_config in models_data.items():
+            # 合并默认设置后整体校验，默认设置中的无效值同样拒绝
+            if isinstance(model_config, dict):
+                model_config = {**default_settings, **model_config}
+            try:
+                _validate_model(model_name, model_config)
+            except ValueError as e:
+                if strict:
+                    raise
+                logger.error("模型 %s 的配置无效，已跳过: %s", model_name, e)
+                continue
+            models[model_name] = ModelConfig(model_name, model_config)
+        return models, default_settings, mtime
+
+    def _swap(self, models: Dict[str, ModelConfig], default_settings: Dict):
+        version = self._current.version if self._current is not None else 0
+        self._current = _Snapshot(models, default_settings, version + 1)
+
+    def _read_config(self) -> Tuple[Dict[str, ModelConfig], Dict, Optional[float]]:
+        """读取首次加载的配置，返回(模型配置, 默认设置, 文件修改时间)；不修改当前状态
+
+        文件不存在或无法解析时使用默认配置；单个模型条目无效时只跳过该条目，
+        default_settings或models本身不是对象时抛出ValueError，不以默认配置替代。
+        """
         try:
-            with open(self.config_path, 'r', encoding='utf-8') as f:
-                config_data = json.load(f)
-            
-            # 加载默认设置
-            self._default_settings = config_data.get('default_settings', {})
-            
-            # 加载模型配置
-            models_data = config_data.get('models', {})
-            for model_name, model_config in models_data.items():
-                # 合并默认设置
-                merged_config = {**self._default_settings, **model_config}
-                self._models[model_name] = ModelConfig(model_name, merged_config)
-                
+            return self._parse_config(strict=False)
         except FileNotFoundError:
-            print(f"警告: 模型配置文件 {self.config_path} 不存在，使用默认配置")
-            self._load_default_config()
-        except json.JSONDecodeError as e:
-            print(f"错误: 模型配置文件格式错误: {e}")
-            self._load_default_config()
-    
-    def _load_default_config(self):
-        """加载默认配置（当配置文件不存在或损坏时使用）"""
+            logger.warning("模型配置文件 %s 不存在，使用默认配置", self.config_path)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            logger.error("模型配置文件 %s 无法解析，使用默认配置: %s", self.config_path, e)
+        models, default_settings = self._default_config()
+        return models, default_settings, None
+
+    def load_config(self):
+        """加载模型配置文件，规则见_read_config"""
+        models, default_settings, self._config_mtime = self._read_config()
+        self._swap(models, default_settings)
+
+    async def load_async(self):
+        """尚未加载时在线程池中读取配置文件，再在事件循环中替换快照
+
+        供启动预热使用：文件I/O不阻塞事件循环，快照及依赖它的缓存只在事件循环中修改。
+        """
+        if self._current is not None:
+            return
+        models, default_settings, mtime = await asyncio.to_thread(self._read_config)
+        # 读取期间请求可能已经同步加载了配置
+        if self._current is None:
+            self._config_mtime = mtime
+            self._swap(models, default_settings)
+
+    async def reload_async(self):
+        """重新加载配置文件，无需重启服务；新文件无效时保留当前配置并抛出异常
+
+        在线程池中读取和校验配置文件，再在事件循环中替换快照。
+        """
+        models, default_settings, mtime = await asyncio.to_thread(self._parse_config)
+        self._config_mtime = mtime
+        self._swap(models, default_settings)
+        logger.info("Reloaded %s models from %s", len(models), self.config_path)
+
+    async def _reload_logged(self):
+        try:
+            await self.reload_async()
+        except Exception as e:
+            logger.error("模型配置重新加载失败，继续使用当前配置: %s", e)
+
+    async def _watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                mtime = await asyncio.to_thread(os.path.getmtime, self.config_path)
+            except OSError:
+                continue
+            if mtime != self._config_mtime:
+                # 无论成功与否都记录，避免对同一个无效文件反复报错
+                self._config_mtime = mtime
+                await self._reload_logged()
+
+    def start_watching(self, interval: float):
+        """监视配置文件修改时间并自动重新加载，同时响应SIGHUP；interval为0时只响应SIGHUP"""
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.ensure_future(self._reload_logged()))
+        except (AttributeError, NotImplementedError, RuntimeError):
+            # Windows不支持SIGHUP，或不在主线程中运行
+            pass
+        if interval > 0 and self._watch_task is None:
+            self._watch_task = asyncio.ensure_future(self._watch(interval))
+
+    async def stop_watching(self):
+        """停止监视配置文件"""
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+    def _default_config(self) -> Tuple[Dict[str, ModelConfig], Dict]:
+        """默认配置（当配置文件不存在或无法解析时使用），返回(模型配置, 默认设置)"""
         default_models = [
             "gpt-4", "gpt-4-turbo", "gpt-3.5-turbo",
             "claude-3-opus", "claude-3-sonnet", "claude-3-haiku",
@@ -65,14 +298,15 @@ class ModelManager:
             "gemini/gemini-pro", "gemini/gemini-pro-vision",
             "ollama/llama2", "ollama/codellama"
         ]
-        
-        self._default_settings = {
+
+        default_settings = {
             "format": "gguf",
             "quantization": "Q4_0",
             "context_length": 4096,
             "capabilities": ["text", "chat"]
         }
-        
+
+        models = {}
         for model_name in default_models:
             config = {
                 "provider": model_name.split('/')[0] if '/' in model_name else "openai",
@@ -81,61 +315,62 @@ class ModelManager:
                 "parameter_size": "7B",
                 "description": f"Default configuration for {model_name}"
             }
-            merged_config = {**self._default_settings, **config}
-            self._models[model_name] = ModelConfig(model_name, merged_config)
-    
+            merged_config = {**default_settings, **config}
+            models[model_name] = ModelConfig(model_name, merged_config)
+        return models, default_settings
+
     def get_available_models(self) -> List[str]:
         """获取所有可用模型名称列表"""
-        return list(self._models.keys())
-    
+        return list(self._snapshot.models.keys())
+
     def get_model_config(self, model_name: str) -> Optional[ModelConfig]:
         """获取指定模型的配置"""
-        return self._models.get(model_name)
-    
+        return self._snapshot.models.get(model_name)
+
     def get_models_by_provider(self, provider: str) -> List[str]:
         """根据提供商获取模型列表"""
-        return [name for name, config in self._models.items() 
-                if config.provider == provider]
-    
+        return list(self._snapshot.by_provider.get(provider, ()))
+
     def get_models_by_capability(self, capability: str) -> List[str]:
         """根据能力获取模型列表"""
-        return [name for name, config in self._models.items() 
-                if capability in config.capabilities]
-    
+        return list(self._snapshot.by_capability.get(capability, ()))
+
+    def get_models_by_family(self, family: str) -> List[str]:
+        """根据模型家族获取模型列表"""
+        return list(self._snapshot.by_family.get(family, ()))
+
     def add_model(self, model_name: str, config: Dict):
         """动态添加模型配置"""
-        merged_config = {**self._default_settings, **config}
-        self._models[model_name] = ModelConfig(model_name, merged_config)
-    
+        snapshot = self._snapshot
+        merged_config = {**snapshot.default_settings, **config} if isinstance(config, dict) else config
+        _validate_model(model_name, merged_config)
+        models = dict(snapshot.models)
+        models[model_name] = ModelConfig(model_name, merged_config)
+        self._swap(models, snapshot.default_settings)
+
     def remove_model(self, model_name: str) -> bool:
         """移除模型配置"""
-        if model_name in self._models:
-            del self._models[model_name]
-            return True
-        return False
-    
+        snapshot = self._snapshot
+        if model_name not in snapshot.models:
+            return False
+        models = dict(snapshot.models)
+        del models[model_name]
+        self._swap(models, snapshot.default_settings)
+        return True
+
     def save_config(self):
         """保存当前配置到文件"""
+        snapshot = self._snapshot
         config_data = {
-            "default_settings": self._default_settings,
-            "models": {}
+            "default_settings": snapshot.default_settings,
+            "models": {name: config.to_dict() for name, config in snapshot.models.items()}
         }
-        
-        for model_name, model_config in self._models.items():
-            config_data["models"][model_name] = {
-                "provider": model_config.provider,
-                "family": model_config.family,
-                "families": model_config.families,
-                "parameter_size": model_config.parameter_size,
-                "quantization": model_config.quantization,
-                "format": model_config.format,
-                "description": model_config.description,
-                "context_length": model_config.context_length,
-                "capabilities": model_config.capabilities
-            }
-        
-        with open(self.config_path, 'w', encoding='utf-8') as f:
+
+        # 先写临时文件再替换，避免监视器读到写了一半的文件
+        tmp_path = f"{self.config_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
             json.dump(config_data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.config_path)
 
 # 全局模型管理器实例
-model_manager = ModelManager()
\ No newline at end of file
+model_manager = ModelManager()
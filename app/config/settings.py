@@ -7,16 +7,145 @@ class Settings(BaseSettings):
     app_version: str = "0.1.0"
     host: str = os.getenv("HOST", "0.0.0.0")
     port: int = os.getenv("PORT", 11434)  # 使用Ollama默认端口
+    # 工作进程数（python -m app.server），0表示按CPU核数
+    workers: int = 1
+    # 多进程模式下共享限速与熔断状态的文件，由启动器设置
+    shared_state_path: str = ""
+    shared_state_slots: int = 4096
     
-    # 模型提供商API密钥
+    # 模型提供商API密钥（可用逗号分隔配置多个）
     dashscope_api_key: str = os.getenv("DASHSCOPE_API_KEY", "")
     deepseek_api_key: str = os.getenv("DEEPSEEK_API_KEY", "")
     siliconflow_api_key: str = os.getenv("SILICONFLOW_API_KEY", "")
     volcengine_api_key: str = os.getenv("VOLCENGINE_API_KEY", "")
     
+    # 提供商接口地址覆盖（为空时使用默认地址），可指向代理或基准测试用的模拟提供商
+    dashscope_api_base: str = ""
+    deepseek_api_base: str = ""
+    siliconflow_api_base: str = ""
+    volcengine_api_base: str = ""
+    
+    # 提供商配额：每分钟请求数/token数（0表示不限），每个API密钥分别计量
+    dashscope_rpm: int = 0
+    dashscope_tpm: int = 0
+    deepseek_rpm: int = 0
+    deepseek_tpm: int = 0
+    siliconflow_rpm: int = 0
+    siliconflow_tpm: int = 0
+    volcengine_rpm: int = 0
+    volcengine_tpm: int = 0
+    rate_limit_headroom: float = 0.9  # 按配额的该比例匀速发送
+    rate_limit_burst_seconds: float = 10.0  # 令牌桶容量（按补充速率折算的秒数）
+    rate_limit_default_completion_tokens: int = 256  # 未指定max_tokens时预估的输出token数
+    
     # 日志级别
     log_level: str = "INFO"
     
+    # 日志输出：json（每行一条结构化日志）或text；由后台线程写入，队列满时丢弃
+    log_format: str = "json"
+    log_file: str = "/app/logs/app.log"  # 为空时只输出到控制台
+    log_rotation: str = "size"  # size按大小轮转，time按时间轮转，none不轮转
+    log_max_bytes: int = 50 * 1024 * 1024
+    log_rotate_when: str = "midnight"  # 按时间轮转的周期（同TimedRotatingFileHandler的when）
+    log_backup_count: int = 5
+    log_queue_size: int = 10000
+    
+    # 访问日志采样比例，可按路由覆盖，如 "/api/tags=0.01,/api/embed=0.1"
+    access_log_sample_rate: float = 1.0
+    access_log_sample_rates: str = ""
+    # 慢于该值（秒）的请求总是以WARNING记录，0表示不记录
+    slow_request_threshold: float = 10.0
+    
+    # 响应缓存（需在models_config.json中按模型开启response_cache）
+    response_cache_max_entries: int = 1024
+    response_cache_max_bytes: int = 64 * 1024 * 1024
+    response_cache_ttl: int = 600  # 秒
+    
+    # 语义缓存（需在models_config.json中按模型开启semantic_cache）：用该嵌入模型向量化最后一条用户消息，
+    # 与同一上下文下的历史提问余弦相似度达到阈值时复用回答；未配置嵌入模型时不启用
+    semantic_cache_embedding_model: str = ""
+    semantic_cache_threshold: float = 0.95  # 可按模型用semantic_cache_threshold覆盖
+    semantic_cache_max_entries: int = 10000  # 每个模型
+    semantic_cache_max_bytes: int = 64 * 1024 * 1024  # 每个模型，含向量与回答
+    semantic_cache_ttl: int = 3600  # 秒
+    semantic_cache_max_prompt_chars: int = 2000  # 更长的提问细节多，不做语义匹配
+    semantic_cache_embed_timeout: float = 2.0  # 查询时等待嵌入的时间（秒），超时按未命中处理
+    # 按该比例抽样命中的请求，在后台请求上游并比较两个回答的相似度，低于verify_threshold记为误命中并淘汰
+    semantic_cache_verify_ratio: float = 0.0
+    semantic_cache_verify_threshold: float = 0.8
+    
+    # 持久化嵌入向量缓存
+    embedding_cache_enabled: bool = False
+    embedding_cache_dir: str = "/app/cache/embeddings"
+    embedding_cache_max_bytes: int = 1024 * 1024 * 1024
+    embedding_cache_read_only: bool = False  # 只读工作进程共享其他进程写入的缓存
+    
+    # 单个/api/embed请求并发发往上游的批次数
+    embedding_max_concurrency: int = 4
+    
+    # 上游连接池（每个提供商base URL一个）
+    upstream_max_connections: int = 100
+    upstream_max_keepalive_connections: int = 20
+    upstream_keepalive_expiry: float = 60.0  # 空闲连接保持时间（秒）
+    upstream_http2: bool = True
+    # 启动时解析DNS并预先建立到各已配置提供商的连接，完成后/api/ready才报告就绪
+    upstream_prewarm: bool = True
+    upstream_prewarm_timeout: float = 5.0
+    
+    # 对话前缀长度（字符）达到该值时固定使用同一API密钥，以命中提供商上下文缓存
+    prefix_affinity_min_chars: int = 1024
+    
+    # 准入控制：按提供商/模型的自适应并发上限与优先级排队
+    admission_enabled: bool = True
+    admission_provider_concurrency: int = 64  # 初始并发上限
+    admission_model_concurrency: int = 32
+    admission_max_concurrency: int = 256  # 自适应增长的上限
+    admission_max_queue: int = 1000
+    admission_max_wait: float = 30.0  # 排队超时（秒），超时返回503
+    admission_latency_tolerance: float = 2.0  # 近期延迟超过基线该倍数时收缩并发
+    
+    # 非流式请求对冲（需在models_config.json中按模型开启hedge）
+    hedge_percentile: float = 95.0  # 主请求超过该模型延迟的此百分位仍未返回时发出对冲请求
+    hedge_min_samples: int = 20  # 延迟样本不足时不对冲
+    hedge_min_delay: float = 0.05  # 秒
+    
+    # 可重试错误（429/502/503/408）的抖动退避重试，受全局重试预算约束
+    retry_max_attempts: int = 3  # 含首次请求
+    retry_base_delay: float = 0.2  # 秒
+    retry_max_delay: float = 2.0
+    retry_budget_ratio: float = 0.1  # 重试与对冲合计不超过请求数的该比例
+    retry_budget_min_per_second: float = 1.0  # 低流量时每秒至少允许的重试数
+    retry_budget_max_tokens: float = 100.0
+    
+    # 按提供商的熔断器：窗口内错误率超过阈值时快速失败，冷却后放行少量试探请求
+    circuit_breaker_enabled: bool = True
+    circuit_window: float = 60.0  # 统计窗口（秒）
+    circuit_min_requests: int = 20  # 窗口内请求数达到该值才判断错误率
+    circuit_failure_rate: float = 0.5
+    circuit_open_seconds: float = 30.0  # 打开后等待多久进入半开
+    circuit_half_open_max_calls: int = 3  # 半开状态的试探请求数，全部成功后关闭
+    circuit_slow_call_seconds: float = 60.0  # 响应（流式为首token）慢于该值计为失败，0表示不判断
+    ps_keep_alive: float = 300.0  # 最近调用过的模型在/api/ps中保留的时间（秒）
+    
+    # models_config.json修改检测间隔（秒），0表示仅在收到SIGHUP时重新加载
+    models_config_watch_interval: float = 2.0
+    
+    # 多后端路由：按该概率随机选择后端以持续探测其延迟，其余请求选择得分最好的后端
+    routing_explore_ratio: float = 0.05
+    
+    # 流式增量合并（0表示逐token发送），可在请求options中覆盖
+    stream_coalesce_ms: int = 0
+    stream_coalesce_bytes: int = 0
+    # 流式请求要求上游在末尾返回usage（stream_options.include_usage），未返回时在本地计数
+    stream_include_usage: bool = True
+    
+    # 请求超时（秒，0表示不限）：整体截止时间可由X-Request-Timeout请求头、options.timeout
+    # 或models_config.json中模型的timeout覆盖，各阶段超时不超过剩余时间
+    request_timeout: float = 600.0
+    upstream_connect_timeout: float = 10.0  # 建立上游连接
+    first_token_timeout: float = 60.0  # 发出请求到流式首token
+    inter_token_timeout: float = 30.0  # 流式相邻两个token之间
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
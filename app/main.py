@@ -1,26 +1,20 @@
 import logging
-import os
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from app.routers import generate, embeddings, models
+from app.routers import generate, embeddings, models, stats
 from app.config.settings import settings
 from app.services.error_handler import handle_litellm_error
+from app.services.embedding_cache import embedding_cache
+from app.services.http_pool import upstream_pool
+from app.services.llm_adapter import llm_adapter
+from app.config.model_manager import model_manager
+from app.config.logging_config import setup_logging, shutdown_logging
+from app.services.request_log import RequestLogMiddleware
+from app.services.warmup import startup_warmup
 import uvicorn
 
-# 确保日志目录存在
-os.makedirs("/app/logs", exist_ok=True)
-
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(),  # 控制台输出
-        logging.FileHandler("/app/logs/app.log", encoding='utf-8')  # 文件输出
-    ]
-)
 logger = logging.getLogger(__name__)
 
 # 创建FastAPI应用
@@ -41,28 +35,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求ID与采样的访问日志
+app.add_middleware(RequestLogMiddleware)
+
 # 注册路由
 app.include_router(generate.router, tags=["Text Generation"])
 app.include_router(embeddings.router, tags=["Embeddings"])
 app.include_router(models.router, tags=["Models"])
+app.include_router(stats.router, tags=["Stats"])
 
 # 全局异常处理
 @app.exception_handler(422)
 async def validation_exception_handler(request: Request, exc):
     """处理请求验证异常"""
-    logger.error(f"Validation error: {exc}")
+    logger.warning("Validation error: %s", exc)
     return JSONResponse(
         status_code=422,
         content={
             "error": "Validation error",
-            "details": str(exc)
+            # 路由中主动抛出的422（如无效的超时参数）带有详细说明
+            "details": getattr(exc, "detail", None) or str(exc)
         }
     )
 
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     """处理通用异常"""
-    logger.error(f"Unhandled exception: {exc}")
+    logger.exception("Unhandled exception: %s", exc)
     return JSONResponse(
         status_code=500,
         content={
@@ -75,14 +74,29 @@ async def general_exception_handler(request: Request, exc: Exception):
 @app.on_event("startup")
 async def startup_event():
     """应用启动时的初始化"""
+    # 日志在启动时配置（而非导入时），写文件在后台线程中进行
+    setup_logging()
     logger.info(f"Starting {settings.app_name} v{settings.app_version}")
     logger.info("Service supports all LiteLLM compatible models")
+    api_bases = llm_adapter.get_configured_api_bases()
+    await upstream_pool.start(api_bases)
+    # 在后台导入LiteLLM并预热上游连接，完成后/api/ready返回200
+    startup_warmup.start(api_bases)
+    # 配置文件修改或收到SIGHUP时在后台重新加载模型目录
+    model_manager.start_watching(settings.models_config_watch_interval)
 
 # 关闭事件
 @app.on_event("shutdown")
 async def shutdown_event():
     """应用关闭时的清理"""
     logger.info(f"Shutting down {settings.app_name}")
+    await startup_warmup.stop()
+    await model_manager.stop_watching()
+    await upstream_pool.aclose()
+    # 等待嵌入缓存的后台写入完成后再关闭
+    await embedding_cache.flush()
+    embedding_cache.close()
+    shutdown_logging()
 
 if __name__ == "__main__":
     uvicorn.run(
@@ -90,5 +104,7 @@ if __name__ == "__main__":
         host=settings.host,
         port=settings.port,
         reload=True,
-        log_level="info"
+        log_level="info",
+        # 访问日志由RequestLogMiddleware记录
+        access_log=False
     )
\ No newline at end of file
@@ -33,6 +33,7 @@ class GenerateResponse(BaseModel):
     prompt_eval_duration: Optional[int] = None
     eval_count: Optional[int] = None
     eval_duration: Optional[int] = None
+    prompt_cache_hit_count: Optional[int] = None  # 提供商上下文缓存命中的prompt token数
 
 class GenerateStreamResponse(BaseModel):
     """Ollama流式生成响应模型"""
@@ -48,6 +49,7 @@ class GenerateStreamResponse(BaseModel):
     prompt_eval_duration: Optional[int] = None
     eval_count: Optional[int] = None
     eval_duration: Optional[int] = None
+    prompt_cache_hit_count: Optional[int] = None  # 提供商上下文缓存命中的prompt token数
 
 class Message(BaseModel):
     """聊天消息模型"""
@@ -86,6 +88,7 @@ class ChatResponse(BaseModel):
     prompt_eval_duration: Optional[int] = None
     eval_count: Optional[int] = None
     eval_duration: Optional[int] = None
+    prompt_cache_hit_count: Optional[int] = None  # 提供商上下文缓存命中的prompt token数
 
 class EmbeddingRequest(BaseModel):
     """Ollama嵌入请求模型（已废弃，使用EmbedRequest）"""
@@ -95,7 +98,10 @@ class EmbeddingRequest(BaseModel):
     keep_alive: Optional[Union[int, str]] = None
 
 class EmbeddingResponse(BaseModel):
-    """Ollama嵌入响应模型（已废弃，使用EmbedResponse）"""
+    """Ollama嵌入响应模型（已废弃，使用EmbedResponse）
+
+    仅用于生成接口文档，响应由embedding_encoding直接编码，不逐个元素校验向量。
+    """
     embedding: List[float]
 
 class EmbedRequest(BaseModel):
@@ -103,11 +109,14 @@ class EmbedRequest(BaseModel):
     model: str
     input: Union[str, List[str]]
     truncate: Optional[bool] = None
+    # 输出维度（按模型配置传给上游或在本地截断）与输出类型（float32/float16/int8/binary）
+    dimensions: Optional[int] = None
+    dtype: Optional[str] = None
     options: Optional[Dict[str, Any]] = None
     keep_alive: Optional[Union[int, str]] = None
 
 class EmbedResponse(BaseModel):
-    """Ollama新版嵌入响应模型"""
+    """Ollama新版嵌入响应模型（仅用于接口文档，见embedding_encoding）"""
     model: str
     embeddings: List[List[float]]
     total_duration: Optional[int] = None
@@ -136,6 +145,9 @@ class RunningModelInfo(BaseModel):
     details: Dict[str, Any]
     expires_at: str
     size_vram: int
+    # 适配器扩展字段：提供商熔断状态与该模型近期错误率
+    breaker_state: Optional[str] = None
+    error_rate: Optional[float] = None
 
 class RunningModelsResponse(BaseModel):
     """运行中模型列表响应"""
@@ -1,60 +1,95 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from typing import Optional
 from app.models.ollama_models import (
     EmbeddingRequest, EmbeddingResponse,
     EmbedRequest, EmbedResponse
 )
 from app.services.llm_adapter import llm_adapter
+from app.services.disconnect import cancel_on_disconnect
+from app.services.embedding_cache import embedding_cache
+from app.services.embedding_encoding import (
+    negotiate_encoding, encode_embeddings, BINARY_MEDIA_TYPE, EMBEDDING_DTYPES, DTYPE_FLOAT32
+)
+from app.services.error_handler import handle_validation_error
 import logging
+import time
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-@router.post("/api/embeddings", response_model=EmbeddingResponse)
-async def create_embeddings(request: EmbeddingRequest):
+# 响应直接返回编码好的Response，response_model只用于生成接口文档，不逐个元素校验向量
+BINARY_RESPONSE = {200: {"content": {BINARY_MEDIA_TYPE: {}}}}
+
+@router.post("/api/embeddings", response_model=EmbeddingResponse, responses=BINARY_RESPONSE)
+async def create_embeddings(request: EmbeddingRequest, http_request: Request):
     """生成嵌入向量（已废弃，建议使用/api/embed）"""
     try:
-        logger.info(f"Embedding request for model: {request.model}")
+        logger.debug("Embedding request for model: %s", request.model)
         
-        response = await llm_adapter.create_embeddings(request)
-        return response
+        embedding = await cancel_on_disconnect(http_request, llm_adapter.create_embeddings(request))
+        return encode_embeddings(embedding, negotiate_encoding(http_request.headers.get("accept")),
+                                 field="embedding", single=True)
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Embedding error: {str(e)}")
+        logger.error("Embedding error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/api/embed", response_model=EmbedResponse)
-async def create_embed(request: EmbedRequest):
-    """生成嵌入向量（新版API）"""
+@router.post("/api/embed", response_model=EmbedResponse, responses=BINARY_RESPONSE)
+async def create_embed(request: EmbedRequest, http_request: Request):
+    """生成嵌入向量（新版API）
+
+    默认返回JSON数组；Accept为 application/json; encoding=base64 时每个向量编码为小端float32的
+    base64字符串，为 application/octet-stream 时返回带长度前缀的二进制float32矩阵。
+    dimensions截短输出维度，dtype为float16、int8或binary时在返回前整体量化。
+    """
     try:
-        logger.info(f"Embed request for model: {request.model}")
+        logger.debug("Embed request for model: %s", request.model)
+        
+        dtype = request.dtype or DTYPE_FLOAT32
+        if dtype not in EMBEDDING_DTYPES:
+            raise handle_validation_error(f"Invalid dtype: {dtype!r}, expected one of {', '.join(EMBEDDING_DTYPES)}")
+        if request.dimensions is not None and request.dimensions <= 0:
+            raise handle_validation_error(f"Invalid dimensions: {request.dimensions}")
         
-        # 将新格式转换为旧格式以兼容现有服务
         if isinstance(request.input, str):
             inputs = [request.input]
         else:
             inputs = request.input
         
-        embeddings = []
-        for input_text in inputs:
-            # 创建兼容的EmbeddingRequest
-            embedding_request = EmbeddingRequest(
-                model=request.model,
-                prompt=input_text,
-                options=request.options,
-                keep_alive=request.keep_alive
-            )
-            
-            embedding_response = await llm_adapter.create_embeddings(embedding_request)
-            embeddings.append(embedding_response.embedding)
+        start_time = time.time()
+        
+        options = dict(request.options or {})
+        if request.dimensions is not None:
+            options.pop("dimensions", None)
+        
+        # 按模型配置分批并发调用上游
+        embeddings = await cancel_on_disconnect(http_request, llm_adapter.generate_embeddings(
+            model=request.model,
+            inputs=inputs,
+            dimensions=request.dimensions,
+            **options
+        ))
         
         # 构造新格式的响应
-        embed_response = EmbedResponse(
+        return encode_embeddings(
+            embeddings,
+            negotiate_encoding(http_request.headers.get("accept")),
+            dtype=dtype,
             model=request.model,
-            embeddings=embeddings
+            total_duration=int((time.time() - start_time) * 1_000_000_000)
         )
         
-        return embed_response
-        
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Embed error: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        logger.error("Embed error: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/api/embed/cache")
+async def invalidate_embed_cache(model: Optional[str] = None):
+    """失效嵌入向量缓存，指定model时只清除该模型的条目"""
+    removed = await embedding_cache.invalidate(model)
+    logger.info("Invalidated %d cached embeddings for model: %s", removed, model or "all")
+    return {"model": model, "removed": removed}
\ No newline at end of file
@@ -5,6 +5,8 @@ from app.models.ollama_models import (
     ChatRequest, ChatResponse, Message
 )
 from app.services.llm_adapter import llm_adapter
+from app.services.disconnect import cancel_on_disconnect
+from app.services.deadline import apply_timeout_header
 import json
 import logging
 
@@ -12,25 +14,24 @@ router = APIRouter()
 logger = logging.getLogger(__name__)
 
 @router.post("/api/generate", response_model=GenerateResponse)
-async def generate_text(request: GenerateRequest):
+async def generate_text(request: GenerateRequest, http_request: Request):
     """生成文本接口 - 兼容Ollama格式"""
     try:
-        logger.info(f"Generating text with model: {request.model}, stream: {request.stream}")
+        logger.debug("Generating text with model: %s, stream: %s", request.model, request.stream)
         
         # 处理流式请求
         if request.stream:
-            async def stream_generator():
-                async for chunk in await llm_adapter.generate_completion(
-                    model=request.model,
-                    prompt=request.prompt,
-                    system=request.system,
-                    stream=True,
-                    **(request.options or {})
-                ):
-                    yield chunk
+            # 排队和等待首帧期间客户端断开时取消上游调用，响应开始后由StreamingResponse监听断开
+            frames = await cancel_on_disconnect(http_request, llm_adapter.generate_completion(
+                model=request.model,
+                prompt=request.prompt,
+                system=request.system,
+                stream=True,
+                **apply_timeout_header(http_request, request.options)
+            ))
             
             return StreamingResponse(
-                stream_generator(),
+                frames,
                 media_type="text/event-stream",
                 headers={
                     "Cache-Control": "no-cache",
@@ -39,21 +40,21 @@ async def generate_text(request: GenerateRequest):
                 }
             )
         
-        # 处理非流式请求
-        response = await llm_adapter.generate_completion(
+        # 处理非流式请求，客户端断开时取消上游调用
+        response = await cancel_on_disconnect(http_request, llm_adapter.generate_completion(
             model=request.model,
             prompt=request.prompt,
             system=request.system,
             stream=False,
-            **(request.options or {})
-        )
+            **apply_timeout_header(http_request, request.options)
+        ))
         
         return response
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error generating text: {str(e)}")
+        logger.exception("Error generating text: %s", e)
         raise HTTPException(
             status_code=500,
             detail={
@@ -63,50 +64,36 @@ async def generate_text(request: GenerateRequest):
         )
 
 @router.post("/api/chat", response_model=ChatResponse)
-async def chat_completion(request: ChatRequest):
+async def chat_completion(request: ChatRequest, http_request: Request):
     """聊天完成接口"""
     try:
-        logger.info(f"Chat completion request for model: {request.model}")
-        
-        # 将ChatRequest转换为GenerateRequest以兼容现有服务
-        # 分离system消息和其他消息
-        system_message = None
-        prompt_parts = []
+        logger.debug("Chat completion request for model: %s", request.model)
         
+        # 按原始顺序保留完整的结构化消息，保证对话前缀逐字节稳定以命中提供商上下文缓存
+        messages = []
         for message in request.messages:
-            if message.role == "system":
-                system_message = message.content
-            elif message.role == "user":
-                prompt_parts.append(f"User: {message.content}")
-            elif message.role == "assistant":
-                prompt_parts.append(f"Assistant: {message.content}")
-        
-        combined_prompt = "\n".join(prompt_parts)
-        
-        # 创建兼容的GenerateRequest
-        generate_request = GenerateRequest(
-            model=request.model,
-            prompt=combined_prompt,
-            system=system_message,
-            format=request.format,
-            options=request.options,
-            stream=request.stream,
-            keep_alive=request.keep_alive
-        )
+            upstream_message = {"role": message.role, "content": message.content}
+            if message.tool_calls:
+                upstream_message["tool_calls"] = message.tool_calls
+            messages.append(upstream_message)
         
         if request.stream:
             return StreamingResponse(
-                llm_adapter.generate_stream(generate_request),
+                await cancel_on_disconnect(http_request, llm_adapter.chat_completion(
+                    model=request.model,
+                    messages=messages,
+                    stream=True,
+                    **apply_timeout_header(http_request, request.options)
+                )),
                 media_type="application/x-ndjson"
             )
         else:
-            response = await llm_adapter.generate_completion(
-                model=generate_request.model,
-                prompt=generate_request.prompt,
-                system=generate_request.system,
+            response = await cancel_on_disconnect(http_request, llm_adapter.chat_completion(
+                model=request.model,
+                messages=messages,
                 stream=False,
-                **(generate_request.options or {})
-            )
+                **apply_timeout_header(http_request, request.options)
+            ))
             
             # 将GenerateResponse转换为ChatResponse
             chat_response = ChatResponse(
@@ -123,13 +110,14 @@ async def chat_completion(request: ChatRequest):
                 prompt_eval_count=response.prompt_eval_count,
                 prompt_eval_duration=response.prompt_eval_duration,
                 eval_count=response.eval_count,
-                eval_duration=response.eval_duration
+                eval_duration=response.eval_duration,
+                prompt_cache_hit_count=response.prompt_cache_hit_count
             )
             return chat_response
             
+    except HTTPException:
+        raise
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        logger.error(f"Chat completion error: {str(e)}")
-        logger.error(f"Full traceback: {error_details}")
+        # 堆栈由日志后台线程格式化，不占用事件循环
+        logger.exception("Chat completion error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
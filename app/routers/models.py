@@ -1,143 +1,48 @@
-from fastapi import APIRouter
-from app.models.ollama_models import TagsResponse, ModelInfo, RunningModelsResponse, RunningModelInfo
-from app.services.llm_adapter import llm_adapter
+from fastapi import APIRouter, Request, Response
+from fastapi.responses import JSONResponse
+from app.models.ollama_models import TagsResponse, RunningModelsResponse
 from app.config.settings import settings
 from app.config.model_manager import model_manager
-from datetime import datetime, timedelta
-import hashlib
+from app.services.model_catalog import model_catalog
+from app.services.warmup import startup_warmup
+from app.services.error_handler import handle_validation_error
 
 router = APIRouter()
 
+def _etag_response(request: Request, body: bytes, etag: str) -> Response:
+    """返回预编码的JSON响应，客户端缓存仍有效时返回304"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or
+                          etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
 @router.get("/api/tags", response_model=TagsResponse)
-async def list_local_models():
+async def list_local_models(request: Request):
     """列出本地模型 - 兼容Ollama格式"""
-    models = []
-    
-    # 获取可用模型列表，模拟为本地模型
-    available_models = llm_adapter.get_available_models()
-    
-    for model_name in available_models:
-        # 模拟模型大小（基于模型名称生成一致的大小）
-        model_size = hash(model_name) % 5000000000 + 500000000  # 0.5-5GB范围
-        
-        # 生成digest（匹配Ollama格式）
-        digest = hashlib.sha256(model_name.encode()).hexdigest()
-        
-        # 模拟修改时间（随机过去几天）
-        days_ago = hash(model_name) % 30 + 1
-        modified_at = (datetime.now() - timedelta(days=days_ago)).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "-07:00"
-        
-        # 从模型管理器获取模型配置
-        model_config = model_manager.get_model_config(model_name)
-        if model_config:
-            family = model_config.family
-            families = model_config.families
-            parameter_size = model_config.parameter_size
-            quantization = model_config.quantization
-        else:
-            # 如果配置中没有找到，使用默认值
-            family = "unknown"
-            families = ["unknown"]
-            parameter_size = "7B"
-            quantization = "Q4_0"
-        
-        # 添加:latest后缀（如果没有版本标签）
-        display_name = model_name + ":latest" if ":" not in model_name else model_name
-        
-        model_info = ModelInfo(
-            name=display_name,
-            model=display_name,
-            modified_at=modified_at,
-            size=model_size,
-            digest=digest,
-            details={
-                "parent_model": "",
-                "format": "gguf",
-                "family": family,
-                "families": families,
-                "parameter_size": parameter_size,
-                "quantization_level": quantization
-            }
-        )
-        models.append(model_info)
-    
-    return TagsResponse(models=models)
+    # 响应体在模型配置变化时才重新生成
+    body, etag = model_catalog.tags()
+    return _etag_response(request, body, etag)
 
 @router.get("/api/ps", response_model=RunningModelsResponse)
-async def list_running_models():
+async def list_running_models(request: Request):
     """列出当前加载到内存中的模型 - 兼容Ollama格式"""
-    running_models = []
-    
-    # 获取可用模型列表，模拟一些模型正在运行
-    available_models = llm_adapter.get_available_models()
-    
-    # 模拟所有可用模型都在运行（实际场景中，这里应该查询真实的运行状态）
-    for i, model_name in enumerate(available_models):
-        provider = model_name.split('/')[0] if '/' in model_name else "openai"
-        
-        # 从模型管理器获取模型大小
-        model_config = model_manager.get_model_config(model_name)
-        if model_config:
-            # 根据参数大小字符串估算字节大小
-            param_size = model_config.parameter_size
-            if "175B" in param_size:
-                model_size = 175000000000
-            elif "100B" in param_size:
-                model_size = 100000000000
-            elif "72B" in param_size:
-                model_size = 72000000000
-            elif "70B" in param_size:
-                model_size = 70000000000
-            elif "34B" in param_size:
-                model_size = 34000000000
-            elif "32B" in param_size:
-                model_size = 32000000000
-            else:
-                model_size = 7000000000  # 默认7B
-        else:
-            model_size = 7000000000    # 默认7B参数
-        
-        # 模拟过期时间（5分钟后）
-        expires_at = (datetime.now() + timedelta(minutes=5)).isoformat()
-        
-        # 生成更短的digest（匹配Ollama格式）
-        digest = hashlib.sha256(model_name.encode()).hexdigest()[:64]
-        
-        # 格式化过期时间（包含时区信息）
-        expires_at_formatted = (datetime.now() + timedelta(minutes=5)).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "-07:00"
-        
-        # 从模型管理器获取模型配置
-        if model_config:
-            family = model_config.family
-            families = model_config.families
-            parameter_size = model_config.parameter_size
-            quantization = model_config.quantization
-        else:
-            # 如果配置中没有找到，使用默认值
-            family = "unknown"
-            families = ["unknown"]
-            parameter_size = "7B"
-            quantization = "Q4_0"
+    # 仅列出保活时间内调用过的模型，并附带其提供商的熔断状态
+    body, etag = model_catalog.running()
+    return _etag_response(request, body, etag)
 
-        running_model = RunningModelInfo(
-            name=model_name,
-            model=model_name,
-            size=model_size,
-            digest=digest,
-            details={
-                "parent_model": "",
-                "format": "gguf",
-                "family": family,
-                "families": families,
-                "parameter_size": parameter_size,
-                "quantization_level": quantization
-            },
-            expires_at=expires_at_formatted,
-            size_vram=model_size
-        )
-        running_models.append(running_model)
-    
-    return RunningModelsResponse(models=running_models)
+@router.post("/api/models/reload")
+async def reload_models():
+    """重新加载models_config.json（含各模型的后端列表），无需重启服务"""
+    try:
+        await model_manager.reload_async()
+    except (OSError, ValueError) as e:
+        # 新配置无效时继续使用当前配置
+        raise handle_validation_error(e)
+    return {
+        "status": "ok",
+        "models": len(model_manager.get_available_models())
+    }
 
 @router.get("/api/version")
 async def get_version():
@@ -162,4 +67,10 @@ async def health_check():
         "status": "ok",
         "message": "Ollama Adapter is running",
         "version": settings.app_version
-    }
\ No newline at end of file
+    }
+
+@router.get("/api/ready")
+async def readiness_check():
+    """就绪检查接口：启动预热（导入、模型目录、上游连接）完成前返回503"""
+    status = startup_warmup.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
\ No newline at end of file
@@ -0,0 +1,43 @@
+import os
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.services.response_cache import response_cache
+from app.services.semantic_cache import semantic_cache
+from app.services.embedding_cache import embedding_cache
+from app.services.http_pool import upstream_pool
+from app.services.single_flight import single_flight
+from app.services.admission import admission_controller
+from app.services.rate_limiter import rate_limiter
+from app.services.hedging import latency_tracker, retry_budget
+from app.services.circuit_breaker import circuit_breakers
+from app.services.backend_router import backend_router
+from app.services.metrics import registry
+from app.config.logging_config import dropped_log_records
+
+router = APIRouter()
+
+@router.get("/api/stats")
+async def get_stats():
+    """获取适配器内部运行统计（缓存命中率等）"""
+    # 多进程模式下各项统计只反映处理本次请求的工作进程
+    return {
+        "process": {"pid": os.getpid()},
+        "response_cache": response_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "upstream_pool": upstream_pool.stats(),
+        "single_flight": single_flight.stats(),
+        "admission": admission_controller.stats(),
+        "rate_limiter": rate_limiter.stats(),
+        "retry_budget": retry_budget.stats(),
+        "latency": latency_tracker.stats(),
+        "circuit_breakers": circuit_breakers.stats(),
+        "routing": backend_router.stats(),
+        "logging": {"dropped_records": dropped_log_records()}
+    }
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus格式的请求计数、延迟、首token延迟与吞吐指标"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,155 @@
+"""生产环境启动器
+
+    python -m app.server [--workers 4] [--host 0.0.0.0] [--port 11434]
+
+工作进程数默认取 WORKERS 配置（0表示CPU核数）。多进程时每个工作进程以
+SO_REUSEPORT 各自监听同一端口，由内核分配连接；不支持SO_REUSEPORT的平台上由
+主进程监听后把套接字交给工作进程。限速令牌桶与熔断状态通过共享内存文件在
+工作进程间共享，工作进程意外退出时自动重启。
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import tempfile
+import time
+from typing import Dict, Optional
+import uvicorn
+from app.config.settings import settings
+
+logger = logging.getLogger("app.server")
+
+# 工作进程连续快速退出时的重启间隔（秒）
+RESTART_DELAY = 1.0
+
+
+def _bind_socket(host: str, port: int, reuse_port: bool) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _server(**kwargs) -> uvicorn.Server:
+    # loop/http为auto时在已安装时使用uvloop与httptools；访问日志由RequestLogMiddleware记录
+    return uvicorn.Server(uvicorn.Config(
+        "app.main:app",
+        loop="auto",
+        http="auto",
+        access_log=False,
+        log_level=settings.log_level.lower(),
+        **kwargs
+    ))
+
+
+def _run_worker(host: str, port: int, sock: Optional[socket.socket]):
+    """工作进程入口"""
+    if sock is None:
+        sock = _bind_socket(host, port, reuse_port=True)
+    _server().run(sockets=[sock])
+
+
+class Supervisor:
+    """启动并看护多个工作进程"""
+
+    def __init__(self, workers: int, host: str, port: int):
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.reuse_port = hasattr(socket, "SO_REUSEPORT")
+        self.context = multiprocessing.get_context("spawn")
+        self.processes: Dict[int, multiprocessing.Process] = {}
+        self.shared_state_path = ""
+        self.socket: Optional[socket.socket] = None
+        self.should_exit = False
+
+    def _create_shared_state(self):
+        """创建清零的共享状态文件，工作进程通过SHARED_STATE_PATH打开"""
+        directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        self.shared_state_path = os.path.join(directory, f"ollama-adapter-{os.getpid()}.state")
+        # 清空上次遗留的状态，文件大小由第一个打开它的工作进程设置
+        open(self.shared_state_path, "wb").close()
+        os.environ["SHARED_STATE_PATH"] = self.shared_state_path
+
+    def _start(self, index: int):
+        # 持久化嵌入缓存只允许一个写入者，其余工作进程只读共享
+        if settings.embedding_cache_enabled and index > 0:
+            os.environ["EMBEDDING_CACHE_READ_ONLY"] = "true"
+        else:
+            os.environ["EMBEDDING_CACHE_READ_ONLY"] = str(settings.embedding_cache_read_only).lower()
+        process = self.context.Process(
+            target=_run_worker,
+            args=(self.host, self.port, self.socket),
+            name=f"worker-{index}"
+        )
+        process.start()
+        self.processes[index] = process
+        logger.info("Started worker %d (pid %d)", index, process.pid)
+
+    def _handle_signal(self, signum, frame):
+        self.should_exit = True
+
+    def run(self):
+        self._create_shared_state()
+        if not self.reuse_port:
+            self.socket = _bind_socket(self.host, self.port, reuse_port=False)
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, self._handle_signal)
+        logger.info("Starting %d workers on %s:%d (SO_REUSEPORT: %s)",
+                    self.workers, self.host, self.port, self.reuse_port)
+        try:
+            for index in range(self.workers):
+                self._start(index)
+            while not self.should_exit:
+                time.sleep(0.5)
+                for index, process in list(self.processes.items()):
+                    if not process.is_alive() and not self.should_exit:
+                        logger.warning("Worker %d (pid %d) exited with code %s, restarting",
+                                       index, process.pid, process.exitcode)
+                        time.sleep(RESTART_DELAY)
+                        self._start(index)
+        finally:
+            self._shutdown()
+
+    def _shutdown(self):
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes.values():
+            process.join(timeout=30)
+            if process.is_alive():
+                process.kill()
+        if self.socket is not None:
+            self.socket.close()
+        try:
+            os.remove(self.shared_state_path)
+        except OSError:
+            pass
+        logger.info("All workers stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ollama Adapter 生产环境启动器")
+    parser.add_argument("--workers", type=int, default=settings.workers, help="工作进程数，0表示CPU核数")
+    parser.add_argument("--host", default=settings.host)
+    parser.add_argument("--port", type=int, default=int(settings.port))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    workers = args.workers or os.cpu_count() or 1
+    if workers == 1:
+        # 单进程时直接在当前进程中运行，不需要共享状态
+        _server(host=args.host, port=args.port).run()
+        return
+    Supervisor(workers, args.host, args.port).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,14 @@
 """服务模块"""
 
 from .llm_adapter import llm_adapter
-from .error_handler import handle_litellm_error, handle_validation_error, handle_model_not_found
+from .error_handler import handle_litellm_error, handle_validation_error, handle_model_not_found, handle_overloaded, handle_circuit_open, handle_client_disconnect
 
 __all__ = [
     "llm_adapter",
     "handle_litellm_error",
     "handle_validation_error", 
-    "handle_model_not_found"
+    "handle_model_not_found",
+    "handle_overloaded",
+    "handle_circuit_open",
+    "handle_client_disconnect"
 ]
\ No newline at end of file
@@ -0,0 +1,260 @@
+import asyncio
+import bisect
+import itertools
+import math
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from app.config.settings import settings
+from app.services.lazy_import import litellm
+from app.services.error_handler import handle_overloaded, UpstreamTimeout, STAGE_DEADLINE
+from app.services.providers import provider_key, target_key
+
+# 请求优先级，数值越小越先调度
+PRIORITY_INTERACTIVE = 0  # /api/chat
+PRIORITY_DEFAULT = 1      # /api/generate
+PRIORITY_BULK = 2         # /api/embed
+
+
+class AdaptiveLimit:
+    """AIMD自适应并发上限
+
+    成功且延迟正常时加性增长，遇到限流或延迟显著高于基线时乘性下降。
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int, latency_tolerance: float):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        # 长期基线和短期延迟的指数加权平均（秒）
+        self.baseline_latency: Optional[float] = None
+        self.recent_latency: Optional[float] = None
+        self.rate_limited = 0
+
+    def available(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    def on_success(self, latency: float):
+        if self.baseline_latency is None:
+            self.baseline_latency = self.recent_latency = latency
+        else:
+            self.baseline_latency += 0.05 * (latency - self.baseline_latency)
+            self.recent_latency += 0.3 * (latency - self.recent_latency)
+
+        if self.recent_latency > self.baseline_latency * self.latency_tolerance:
+            self.limit = max(self.min_limit, self.limit * 0.9)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def on_overload(self, factor: float):
+        self.limit = max(self.min_limit, self.limit * factor)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "baseline_latency": self.baseline_latency,
+            "recent_latency": self.recent_latency,
+            "rate_limited": self.rate_limited
+        }
+
+
+class _Waiter:
+    __slots__ = ("model", "future", "enqueued_at")
+
+    def __init__(self, model: str):
+        self.model = model
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+
+
+class Permit:
+    """一次上游调用占用的并发名额，作为异步上下文管理器使用"""
+
+    def __init__(self, controller: "AdmissionController", provider: str, model: str, priority: int):
+        self.controller = controller
+        self.provider = provider
+        self.model = model
+        self.priority = priority
+        self.started_at = 0.0
+        self.latency: Optional[float] = None
+        self._granted = False
+
+    def mark_first_token(self):
+        """流式请求以首个token的延迟作为自适应调整的样本"""
+        if self.latency is None:
+            self.latency = time.monotonic() - self.started_at
+
+    async def __aenter__(self) -> "Permit":
+        await self.controller._acquire(self)
+        self._granted = True
+        self.started_at = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._granted:
+            self._granted = False
+            latency = self.latency if self.latency is not None else time.monotonic() - self.started_at
+            self.controller._release(self, exc, latency)
+
+
+class AdmissionController:
+    """按提供商和模型的准入控制：自适应并发上限 + 优先级队列 + 超时卸载"""
+
+    def __init__(self, enabled: bool, provider_concurrency: int, model_concurrency: int,
+                 max_concurrency: int, max_queue: int, max_wait: float, latency_tolerance: float):
+        self.enabled = enabled
+        self.provider_concurrency = provider_concurrency
+        self.model_concurrency = model_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.latency_tolerance = latency_tolerance
+        self._provider_limits: Dict[str, AdaptiveLimit] = {}
+        self._model_limits: Dict[str, AdaptiveLimit] = {}
+        # 每个提供商一个按(优先级, 序号)排序的等待队列
+        self._queues: Dict[str, List[Tuple[int, int, _Waiter]]] = {}
+        self._seq = itertools.count()
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+        self.total_wait = 0.0
+        self.max_observed_wait = 0.0
+
+    def admit(self, provider: str, model: str, priority: int = PRIORITY_DEFAULT) -> Permit:
+        """创建准入名额，用法：async with admission_controller.admit(...) as permit
+
+        model为后端寻址名。未配置的提供商与后端共用OTHER的并发上限和队列，
+        按客户端传入名称创建的条目数不会无限增长。
+        """
+        return Permit(self, provider_key(provider), target_key(model), priority)
+
+    def _limit(self, limits: Dict[str, AdaptiveLimit], key: str, initial: int) -> AdaptiveLimit:
+        limit = limits.get(key)
+        if limit is None:
+            limit = AdaptiveLimit(initial, 1, self.max_concurrency, self.latency_tolerance)
+            limits[key] = limit
+        return limit
+
+    async def _acquire(self, permit: Permit):
+        if not self.enabled:
+            return
+
+        provider_limit = self._limit(self._provider_limits, permit.provider, self.provider_concurrency)
+        model_limit = self._limit(self._model_limits, permit.model, self.model_concurrency)
+        queue = self._queues.setdefault(permit.provider, [])
+
+        if not queue and provider_limit.available() and model_limit.available():
+            self._grant(permit.provider, permit.model)
+            self._record_wait(0.0)
+            return
+
+        if len(queue) >= self.max_queue:
+            self.shed += 1
+            raise handle_overloaded(self._retry_after(provider_limit), f"Admission queue for '{permit.provider}' is full")
+
+        waiter = _Waiter(permit.model)
+        entry = (permit.priority, next(self._seq), waiter)
+        bisect.insort(queue, entry)
+        self.queued += 1
+        # 排在前面的请求可能只是被各自模型的上限阻塞
+        self._dispatch(permit.provider)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self._abandon(permit, queue, entry)
+            self.shed += 1
+            raise handle_overloaded(
+                self._retry_after(provider_limit),
+                f"Timed out after {self.max_wait}s waiting for '{permit.provider}' capacity"
+            )
+        except asyncio.CancelledError:
+            self._abandon(permit, queue, entry)
+            raise
+        self._record_wait(time.monotonic() - waiter.enqueued_at)
+
+    def _abandon(self, permit: Permit, queue: List[Tuple[int, int, _Waiter]], entry: Tuple[int, int, _Waiter]):
+        """等待方离开队列；若名额已分配则立即归还"""
+        waiter = entry[2]
+        if waiter.future.done() and not waiter.future.cancelled():
+            self._provider_limits[permit.provider].in_flight -= 1
+            self._model_limits[permit.model].in_flight -= 1
+            self._dispatch(permit.provider)
+        else:
+            waiter.future.cancel()
+            queue.remove(entry)
+
+    def _grant(self, provider: str, model: str):
+        self._provider_limits[provider].in_flight += 1
+        self._model_limits[model].in_flight += 1
+        self.admitted += 1
+
+    def _record_wait(self, wait: float):
+        self.total_wait += wait
+        self.max_observed_wait = max(self.max_observed_wait, wait)
+
+    def _release(self, permit: Permit, error: Optional[BaseException], latency: float):
+        if not self.enabled:
+            return
+
+        provider_limit = self._provider_limits[permit.provider]
+        model_limit = self._model_limits[permit.model]
+        provider_limit.in_flight -= 1
+        model_limit.in_flight -= 1
+
+        for limit in (provider_limit, model_limit):
+            if isinstance(error, litellm.RateLimitError):
+                limit.rate_limited += 1
+                limit.on_overload(0.5)
+            elif isinstance(error, (litellm.ServiceUnavailableError, litellm.Timeout)) or (
+                    isinstance(error, UpstreamTimeout) and error.stage != STAGE_DEADLINE):
+                limit.on_overload(0.75)
+            elif error is None:
+                limit.on_success(latency)
+
+        self._dispatch(permit.provider)
+
+    def _dispatch(self, provider: str):
+        """按优先级为队列中的等待方分配空闲名额"""
+        queue = self._queues.get(provider)
+        provider_limit = self._provider_limits[provider]
+        index = 0
+        while queue and index < len(queue) and provider_limit.available():
+            waiter = queue[index][2]
+            if self._model_limits[waiter.model].available():
+                queue.pop(index)
+                self._grant(provider, waiter.model)
+                waiter.future.set_result(None)
+            else:
+                index += 1
+
+    def _retry_after(self, limit: AdaptiveLimit) -> int:
+        return max(1, math.ceil(limit.recent_latency or 1))
+
+    def stats(self) -> Dict[str, Any]:
+        """准入控制统计"""
+        admitted = self.admitted or 1
+        return {
+            "enabled": self.enabled,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": self.shed,
+            "average_wait": self.total_wait / admitted,
+            "max_wait": self.max_observed_wait,
+            "queue_depth": {provider: len(queue) for provider, queue in self._queues.items()},
+            "providers": {provider: limit.stats() for provider, limit in self._provider_limits.items()},
+            "models": {model: limit.stats() for model, limit in self._model_limits.items()}
+        }
+
+
+# 全局准入控制实例
+admission_controller = AdmissionController(
+    enabled=settings.admission_enabled,
+    provider_concurrency=settings.admission_provider_concurrency,
+    model_concurrency=settings.admission_model_concurrency,
+    max_concurrency=settings.admission_max_concurrency,
+    max_queue=settings.admission_max_queue,
+    max_wait=settings.admission_max_wait,
+    latency_tolerance=settings.admission_latency_tolerance
+)
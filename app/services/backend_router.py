@@ -0,0 +1,130 @@
+import hashlib
+import math
+import random
+from typing import Any, Dict, List, Optional
+from fastapi import HTTPException
+from app.config.settings import settings
+from app.config.model_manager import model_manager
+from app.services.error_handler import is_retryable_error
+from app.services.circuit_breaker import circuit_breakers
+from app.services.providers import OTHER, backend_specs, backend_target, target_key
+
+
+class Backend:
+    """模型的一个上游后端（提供商 + 提供商侧模型名）"""
+    __slots__ = ("provider", "model", "weight", "target")
+
+    def __init__(self, provider: str, model: str, weight: float = 1.0):
+        self.provider = provider
+        self.model = model
+        self.weight = weight
+        # 按已有的"提供商/模型"格式寻址，复用单后端的模型解析逻辑
+        self.target = backend_target(provider, model)
+
+
+class BackendScore:
+    """后端近期延迟与错误率的指数加权平均"""
+    __slots__ = ("latency", "error_rate", "requests", "failures")
+
+    def __init__(self):
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def record(self, latency: float, failed: bool):
+        self.requests += 1
+        if failed:
+            self.failures += 1
+        else:
+            self.latency = latency if self.latency is None else self.latency + 0.2 * (latency - self.latency)
+        self.error_rate += 0.2 * ((1.0 if failed else 0.0) - self.error_rate)
+
+    def score(self, weight: float) -> float:
+        """越小越好；没有样本的后端优先被探测"""
+        if self.latency is None:
+            return 0.0
+        return self.latency * (1 + 10 * self.error_rate) / max(weight, 0.01)
+
+
+def is_fallback_error(error: Exception) -> bool:
+    """限流、上游故障或该后端熔断/过载时切换到下一个后端"""
+    if isinstance(error, HTTPException):
+        return error.status_code == 503
+    return is_retryable_error(error)
+
+
+class BackendRouter:
+    """为一个Ollama模型名在多个加权后端间按近期表现路由，并提供有序回退链"""
+
+    def __init__(self, explore_ratio: float):
+        self.explore_ratio = explore_ratio
+        # 按后端寻址名记录，配置重新加载后仍保留
+        self._scores: Dict[str, BackendScore] = {}
+        self.fallbacks = 0
+
+    def backends(self, model: str) -> List[Backend]:
+        """模型配置的后端列表；未配置backends时由模型名前缀推导出唯一后端"""
+        return [Backend(provider, model_name, weight)
+                for provider, model_name, weight in backend_specs(model, model_manager.get_model_config(model))]
+
+    def _score(self, backend: Backend) -> BackendScore:
+        score = self._scores.get(backend.target)
+        if score is None:
+            score = self._scores[backend.target] = BackendScore()
+        return score
+
+    def plan(self, model: str, affinity: Optional[str] = None) -> List[Backend]:
+        """本次请求的尝试顺序：首选后端在前，其余按配置顺序作为回退
+
+        有前缀亲和性指纹时按指纹固定首选后端（加权最高随机权重哈希），该后端熔断打开前
+        同一对话的各轮请求都发往它，以保留提供商的上下文缓存；否则选择得分最好的后端。
+        """
+        backends = self.backends(model)
+        if len(backends) == 1:
+            return backends
+
+        # 熔断打开的后端放到最后，仍可作为最终回退
+        healthy = [b for b in backends if circuit_breakers.get(b.provider).available()]
+        candidates = healthy or backends
+        if affinity:
+            primary = max(candidates, key=lambda b: self._affinity_rank(affinity, b))
+        elif random.random() < self.explore_ratio:
+            primary = random.choices(candidates, weights=[b.weight for b in candidates])[0]
+        else:
+            primary = min(candidates, key=lambda b: self._score(b).score(b.weight))
+        rest = [b for b in backends if b is not primary]
+        rest.sort(key=lambda b: b not in healthy)
+        return [primary] + rest
+
+    @staticmethod
+    def _affinity_rank(affinity: str, backend: Backend) -> float:
+        """指纹与后端的加权随机权重：各指纹按权重比例分布到后端，某个后端不可用时只有它的对话改投"""
+        digest = hashlib.blake2b(f"{affinity}:{backend.target}".encode("utf-8"), digest_size=8).digest()
+        # 映射到(0, 1)开区间
+        uniform = (int.from_bytes(digest, "big") + 1) / (2 ** 64 + 1)
+        return -max(backend.weight, 0.01) / math.log(uniform)
+
+    def record(self, backend: Backend, latency: float, failed: bool):
+        # 未配置的后端（客户端传入的任意模型名）不保存得分
+        if target_key(backend.target) == OTHER:
+            return
+        self._score(backend).record(latency, failed)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "fallbacks": self.fallbacks,
+            "backends": {
+                target: {
+                    "latency": score.latency,
+                    "error_rate": round(score.error_rate, 4),
+                    "requests": score.requests,
+                    "failures": score.failures
+                }
+                for target, score in self._scores.items()
+            }
+        }
+
+
+# 全局后端路由实例
+backend_router = BackendRouter(explore_ratio=settings.routing_explore_ratio)
@@ -0,0 +1,238 @@
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from app.config.settings import settings
+from app.services.error_handler import handle_litellm_error, handle_circuit_open, UpstreamTimeout, STAGE_DEADLINE
+from app.services.shared_state import shared_table
+from app.services.providers import model_key, provider_key
+
+# 计为上游故障的错误类别；限流由准入控制和限速器处理，不触发熔断
+FAILURE_STATUS_CODES = {500, 502, 503, 504, 408}
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class OutcomeWindow:
+    """滑动时间窗口内的请求结果统计"""
+
+    def __init__(self, window: float):
+        self.window = window
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self.last_used: Optional[float] = None
+
+    def add(self, failed: bool):
+        now = time.time()
+        self._outcomes.append((now, failed))
+        self.last_used = now
+
+    def _trim(self):
+        cutoff = time.time() - self.window
+        while self._outcomes and self._outcomes[0][0] < cutoff:
+            self._outcomes.popleft()
+
+    def counts(self) -> Tuple[int, int]:
+        """返回(请求数, 失败数)"""
+        self._trim()
+        return len(self._outcomes), sum(1 for _, failed in self._outcomes if failed)
+
+    def error_rate(self) -> float:
+        total, failures = self.counts()
+        return failures / total if total else 0.0
+
+    def clear(self):
+        self._outcomes.clear()
+
+
+class CircuitBreaker:
+    """单个提供商的熔断器：closed -> open -> half_open -> closed
+
+    多进程模式下，任一工作进程熔断时把打开截止时间写入共享状态表，其他进程
+    随即跟随打开；错误率窗口与半开试探仍在各进程内统计。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.window = OutcomeWindow(settings.circuit_window)
+        self.opened_at = 0.0
+        self.trials = 0
+        self.trial_successes = 0
+        self.times_opened = 0
+
+    def _follow_shared(self):
+        """其他工作进程已熔断时同步为打开状态"""
+        values = shared_table.get(f"circuit:{self.name}")
+        if values is not None and values[0] > time.monotonic():
+            self.state = OPEN
+            self.opened_at = values[0] - settings.circuit_open_seconds
+
+    def available(self) -> bool:
+        """不改变状态地判断是否可能放行请求，用于路由时跳过熔断中的后端"""
+        if self.state == CLOSED and shared_table is not None:
+            self._follow_shared()
+        if self.state == OPEN:
+            return time.monotonic() - self.opened_at >= settings.circuit_open_seconds
+        if self.state == HALF_OPEN:
+            return self.trials < settings.circuit_half_open_max_calls
+        return True
+
+    def allow(self) -> bool:
+        """是否放行请求；半开状态下只放行有限的试探请求"""
+        if self.state == CLOSED and shared_table is not None:
+            self._follow_shared()
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < settings.circuit_open_seconds:
+                return False
+            self.state = HALF_OPEN
+            self.trials = 0
+            self.trial_successes = 0
+        if self.state == HALF_OPEN:
+            if self.trials >= settings.circuit_half_open_max_calls:
+                return False
+            self.trials += 1
+        return True
+
+    def record(self, failed: bool):
+        self.window.add(failed)
+        if self.state == HALF_OPEN:
+            if failed:
+                self._open()
+            else:
+                self.trial_successes += 1
+                if self.trial_successes >= settings.circuit_half_open_max_calls:
+                    self.state = CLOSED
+                    self.window.clear()
+        elif self.state == CLOSED and failed:
+            total, failures = self.window.counts()
+            if total >= settings.circuit_min_requests and failures / total >= settings.circuit_failure_rate:
+                self._open()
+
+    def release_trial(self):
+        """试探请求未到达上游（被取消或本地拒绝）时归还名额"""
+        if self.state == HALF_OPEN and self.trials > 0:
+            self.trials -= 1
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        if shared_table is not None:
+            open_until = self.opened_at + settings.circuit_open_seconds
+            shared_table.update(f"circuit:{self.name}", lambda values: ((open_until, 0.0, 0.0), None))
+
+    def retry_after(self) -> int:
+        remaining = settings.circuit_open_seconds - (time.monotonic() - self.opened_at)
+        return max(1, int(remaining + 0.999))
+
+    def stats(self) -> Dict[str, Any]:
+        total, failures = self.window.counts()
+        return {
+            "state": self.state,
+            "requests": total,
+            "failures": failures,
+            "error_rate": failures / total if total else 0.0,
+            "times_opened": self.times_opened
+        }
+
+
+class BreakerGuard:
+    """一次上游调用的熔断保护，作为上下文管理器使用"""
+
+    def __init__(self, registry: "CircuitBreakerRegistry", provider: str, model: str):
+        self.registry = registry
+        self.breaker = registry.get(provider)
+        self.model = model
+        self.started_at: Optional[float] = None
+        self.latency: Optional[float] = None
+
+    def begin(self):
+        """上游请求即将发出"""
+        self.started_at = time.monotonic()
+
+    def mark_first_token(self):
+        """流式请求以首个token的延迟判断是否过慢"""
+        if self.latency is None and self.started_at is not None:
+            self.latency = time.monotonic() - self.started_at
+
+    def __enter__(self) -> "BreakerGuard":
+        if self.registry.enabled and not self.breaker.allow():
+            raise handle_circuit_open(self.breaker.name, self.breaker.retry_after())
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.registry.enabled:
+            return
+        if self.started_at is None or isinstance(exc, HTTPException) or (
+                exc is not None and not isinstance(exc, Exception)) or (
+                isinstance(exc, UpstreamTimeout) and exc.stage == STAGE_DEADLINE):
+            # 未发出上游请求、本地拒绝、被取消或客户端给定的截止时间已到，不计入统计
+            self.breaker.release_trial()
+            return
+        if exc is not None:
+            failed = handle_litellm_error(exc).status_code in FAILURE_STATUS_CODES
+        else:
+            latency = self.latency if self.latency is not None else time.monotonic() - self.started_at
+            failed = bool(settings.circuit_slow_call_seconds) and latency > settings.circuit_slow_call_seconds
+        self.breaker.record(failed)
+        self.registry.model_window(self.model).add(failed)
+
+
+class CircuitBreakerRegistry:
+    """按提供商的熔断器集合，同时记录各模型的近期错误率
+
+    提供商与模型名来自客户端请求，只为已配置的名称单独建立条目，其余共用OTHER条目。
+    """
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._models: Dict[str, OutcomeWindow] = {}
+
+    def get(self, provider: str) -> CircuitBreaker:
+        """提供商的熔断器；未配置的提供商共用同一个熔断器"""
+        provider = provider_key(provider)
+        breaker = self._breakers.get(provider)
+        if breaker is None:
+            breaker = self._breakers[provider] = CircuitBreaker(provider)
+        return breaker
+
+    def model_window(self, model: str) -> OutcomeWindow:
+        """模型的近期结果窗口；未配置的模型共用同一个窗口"""
+        model = model_key(model)
+        window = self._models.get(model)
+        if window is None:
+            window = self._models[model] = OutcomeWindow(settings.circuit_window)
+        return window
+
+    def guard(self, provider: str, model: str) -> BreakerGuard:
+        """用法：with circuit_breakers.guard(provider, model) as guard"""
+        return BreakerGuard(self, provider, model)
+
+    def model_health(self, model: str, providers: List[str]) -> Optional[Dict[str, Any]]:
+        """模型的熔断状态与近期错误率，从未调用过时返回None
+
+        模型有多个后端时取其中最健康的状态，只要有一个后端可用模型就可用。
+        """
+        window = self._models.get(model)
+        if window is None:
+            return None
+        states = {self.get(provider).state for provider in providers}
+        state = next(s for s in (CLOSED, HALF_OPEN, OPEN) if s in states)
+        return {
+            "last_used": window.last_used,
+            "breaker_state": state,
+            "error_rate": window.error_rate()
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "providers": {name: breaker.stats() for name, breaker in self._breakers.items()}
+        }
+
+
+# 全局熔断器实例
+circuit_breakers = CircuitBreakerRegistry(enabled=settings.circuit_breaker_enabled)
@@ -0,0 +1,90 @@
+import asyncio
+import math
+from contextvars import ContextVar
+from typing import Dict, Optional
+from fastapi import Request
+from app.config.settings import settings
+from app.config.model_manager import model_manager
+from app.services.error_handler import handle_validation_error, STAGE_DEADLINE
+
+# 客户端可通过该请求头或options中的timeout指定整体超时（秒）
+TIMEOUT_HEADER = "X-Request-Timeout"
+TIMEOUT_OPTION = "timeout"
+
+
+def _parse_timeout(value) -> float:
+    try:
+        timeout = float(value)
+    except (TypeError, ValueError):
+        raise handle_validation_error(f"Invalid timeout: {value!r}")
+    if not math.isfinite(timeout) or timeout < 0:
+        raise handle_validation_error(f"Invalid timeout: {value!r}")
+    return timeout
+
+
+def apply_timeout_header(request: Request, options: Optional[Dict]) -> Dict:
+    """把X-Request-Timeout请求头合并进options，请求头优先"""
+    options = dict(options or {})
+    header = request.headers.get(TIMEOUT_HEADER)
+    if header is not None:
+        options[TIMEOUT_OPTION] = _parse_timeout(header)
+    return options
+
+
+class Deadline:
+    """一次请求的截止时间，为上游各阶段计算不晚于它的超时时刻
+
+    时刻均为事件循环时钟（loop.time()），可直接传给asyncio.timeout_at。
+    """
+    __slots__ = ("timeout", "expires_at", "_loop")
+
+    def __init__(self, timeout: float):
+        self._loop = asyncio.get_running_loop()
+        self.timeout = timeout
+        self.expires_at = self._loop.time() + timeout if timeout else None
+
+    def at(self, timeout: float) -> Optional[float]:
+        """timeout秒后与截止时间中较早的时刻，timeout为0表示只受截止时间约束"""
+        if not timeout:
+            return self.expires_at
+        when = self._loop.time() + timeout
+        return when if self.expires_at is None else min(when, self.expires_at)
+
+    def remaining(self, timeout: float = 0) -> Optional[float]:
+        """距at(timeout)的秒数，不受限时为None"""
+        when = self.at(timeout)
+        return None if when is None else max(0.0, when - self._loop.time())
+
+    def stage(self, when: Optional[float], stage: str) -> str:
+        """超时发生在when时，区分是整体截止还是阶段超时"""
+        return STAGE_DEADLINE if when is not None and when == self.expires_at else stage
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and self._loop.time() >= self.expires_at
+
+
+_current: ContextVar[Optional[Deadline]] = ContextVar("request_deadline", default=None)
+
+
+def start_deadline(model: str, options: Dict) -> Deadline:
+    """按options.timeout、模型配置、REQUEST_TIMEOUT的顺序确定超时并开始计时
+
+    options中的timeout被取出，不传给上游。同一上下文中的后续调用可通过current_deadline()取得。
+    """
+    timeout = options.pop(TIMEOUT_OPTION, None)
+    if timeout is not None:
+        timeout = _parse_timeout(timeout)
+    else:
+        model_config = model_manager.get_model_config(model)
+        if model_config is not None and model_config.timeout is not None:
+            timeout = model_config.timeout
+        else:
+            timeout = settings.request_timeout
+    deadline = Deadline(timeout)
+    _current.set(deadline)
+    return deadline
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
@@ -0,0 +1,43 @@
+import asyncio
+from typing import Awaitable, TypeVar
+from fastapi import Request
+from app.services.error_handler import handle_client_disconnect
+
+T = TypeVar("T")
+
+
+async def _wait_disconnect(request: Request):
+    # 请求体已由FastAPI读完，此后receive()只在连接断开时返回
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T]) -> T:
+    """等待awaitable完成，客户端先断开连接时立即取消它并返回499
+
+    uvicorn不会因客户端断开而取消非流式请求，上游调用会一直运行到模型生成结束。
+    这里在后台监听断开事件并取消当前任务，取消沿调用链传到LiteLLM，关闭上游连接并
+    释放限速、准入名额。awaitable在当前任务中执行，请求指标等上下文变量照常可见。
+    流式请求在响应开始后由StreamingResponse自行监听断开，这里只覆盖排队和等待首帧阶段。
+    """
+    task = asyncio.current_task()
+    disconnected = False
+
+    def on_disconnect(watcher: asyncio.Task):
+        nonlocal disconnected
+        if not watcher.cancelled() and watcher.exception() is None:
+            disconnected = True
+            task.cancel()
+
+    watcher = asyncio.ensure_future(_wait_disconnect(request))
+    watcher.add_done_callback(on_disconnect)
+    try:
+        return await awaitable
+    except asyncio.CancelledError:
+        if not disconnected:
+            raise
+        task.uncancel()
+        raise handle_client_disconnect() from None
+    finally:
+        watcher.remove_done_callback(on_disconnect)
+        watcher.cancel()
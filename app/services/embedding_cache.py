@@ -0,0 +1,398 @@
+import asyncio
+import hashlib
+import json
+import logging
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from app.config.settings import settings
+from app.services.lazy_import import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 每条记录头部保存的内容摘要长度，用于校验槽位未被并发复用
+DIGEST_SIZE = 16
+# last_used 的最小更新间隔（秒），避免每次命中都写索引
+TOUCH_INTERVAL = 60
+# 索引文件尚未创建时，间隔该时间（秒）再检查，期间查找直接按未命中处理
+REOPEN_INTERVAL = 5
+# 等待后台写入的条目上限，写入跟不上时丢弃新条目
+MAX_PENDING_WRITES = 10000
+
+
+def make_embedding_key(model: str, text: str, options: Optional[Dict[str, Any]] = None) -> bytes:
+    """根据模型、生成参数和输入文本计算内容寻址键"""
+    normalized_options = {k: v for k, v in (options or {}).items() if v is not None}
+    prefix = json.dumps([model, normalized_options], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(prefix.encode("utf-8") + b"\0" + text.encode("utf-8")).digest()
+
+
+class _VectorFile:
+    """按维度划分的定长槽位数据文件，读取走mmap"""
+
+    def __init__(self, path: str, dim: int, writable: bool):
+        self.path = path
+        self.dim = dim
+        self.record_size = DIGEST_SIZE + dim * 4
+        flags = os.O_RDWR | os.O_CREAT if writable else os.O_RDONLY
+        self.fd = os.open(path, flags, 0o644)
+        self._mm: Optional[mmap.mmap] = None
+
+    def _mapped(self, end: int) -> Optional[mmap.mmap]:
+        """确保映射覆盖到end，文件被其他进程扩展后重新映射"""
+        if self._mm is None or len(self._mm) < end:
+            size = os.fstat(self.fd).st_size
+            if size < end:
+                return None
+            if self._mm is not None:
+                self._mm.close()
+            self._mm = mmap.mmap(self.fd, size, prot=mmap.PROT_READ)
+        return self._mm
+
+    def read(self, slot: int, digest: bytes) -> Optional["np.ndarray"]:
+        offset = slot * self.record_size
+        mm = self._mapped(offset + self.record_size)
+        if mm is None or mm[offset:offset + DIGEST_SIZE] != digest:
+            return None
+        vector = np.frombuffer(mm[offset + DIGEST_SIZE:offset + self.record_size], dtype=np.float32)
+        # 读取期间槽位被覆盖时丢弃结果
+        if mm[offset:offset + DIGEST_SIZE] != digest:
+            return None
+        return vector
+
+    def write(self, slot: int, digest: bytes, vector: "np.ndarray"):
+        offset = slot * self.record_size
+        end = offset + self.record_size
+        if os.fstat(self.fd).st_size < end:
+            os.ftruncate(self.fd, end)
+        # 先清空摘要再写数据，最后写摘要，读者据此识别未完成的写入
+        os.pwrite(self.fd, b"\0" * DIGEST_SIZE, offset)
+        os.pwrite(self.fd, np.asarray(vector, dtype=np.float32).tobytes(), offset + DIGEST_SIZE)
+        os.pwrite(self.fd, digest, offset)
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        os.close(self.fd)
+
+
+class EmbeddingCache:
+    """持久化嵌入向量缓存
+
+    向量以float32存放在按维度划分的mmap数据文件中，SQLite索引记录
+    键到槽位的映射。多个工作进程可以共享同一目录，只读进程仅做查找。
+    查找在事件循环中经只读连接完成；写入（含last_used更新）先进入队列，
+    由后台任务在线程池中按批写入，每批一个事务，不阻塞事件循环。
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, read_only: bool = False, enabled: bool = True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.read_only = read_only
+        self.enabled = enabled
+        self._index_path = os.path.join(cache_dir, "index.db")
+        # 写连接只在后台写入线程（及失效、关闭）中使用，事务需串行化
+        self._conn: Optional[sqlite3.Connection] = None
+        self._files: Dict[int, _VectorFile] = {}
+        self._lock = threading.Lock()
+        # 只读连接只在事件循环中使用
+        self._read_conn: Optional[sqlite3.Connection] = None
+        self._read_files: Dict[int, _VectorFile] = {}
+        self._reopen_at = 0.0
+        # 等待写入与正在写入的条目（键 -> (模型, 向量)），写入完成前查找同样可以命中
+        self._pending: Dict[bytes, Tuple[str, "np.ndarray"]] = {}
+        self._writing: Dict[bytes, Tuple[str, "np.ndarray"]] = {}
+        self._touches: Dict[bytes, float] = {}
+        self._writer: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.dropped_writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        """延迟打开写连接并创建索引，避免导入时创建目录"""
+        if self._conn is not None:
+            return self._conn
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        conn = sqlite3.connect(self._index_path, isolation_level=None, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key BLOB PRIMARY KEY,
+                model TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                slot INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_model ON entries(model)")
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used)")
+        conn.execute("CREATE TABLE IF NOT EXISTS free_slots (dim INTEGER NOT NULL, slot INTEGER NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS slot_counts (dim INTEGER PRIMARY KEY, next_slot INTEGER NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('used_bytes', 0)")
+        self._conn = conn
+        return conn
+
+    def _reader(self) -> Optional[sqlite3.Connection]:
+        """只读索引连接；索引尚未创建（首次写入之前）时返回None，每REOPEN_INTERVAL秒重新检查一次"""
+        if self._read_conn is not None:
+            return self._read_conn
+
+        now = time.monotonic()
+        if now < self._reopen_at:
+            return None
+        if not os.path.exists(self._index_path):
+            logger.debug("Embedding cache index %s does not exist yet", self._index_path)
+            self._reopen_at = now + REOPEN_INTERVAL
+            return None
+        self._read_conn = sqlite3.connect(
+            f"file:{self._index_path}?mode=ro", uri=True, isolation_level=None, check_same_thread=False
+        )
+        return self._read_conn
+
+    def _file(self, dim: int) -> _VectorFile:
+        vector_file = self._files.get(dim)
+        if vector_file is None:
+            path = os.path.join(self.cache_dir, f"vectors_{dim}.f32")
+            vector_file = _VectorFile(path, dim, writable=True)
+            self._files[dim] = vector_file
+        return vector_file
+
+    def _read_file(self, dim: int) -> _VectorFile:
+        vector_file = self._read_files.get(dim)
+        if vector_file is None:
+            path = os.path.join(self.cache_dir, f"vectors_{dim}.f32")
+            vector_file = _VectorFile(path, dim, writable=False)
+            self._read_files[dim] = vector_file
+        return vector_file
+
+    def get(self, model: str, text: str, options: Optional[Dict[str, Any]] = None) -> Optional["np.ndarray"]:
+        """查找缓存的float32向量，未命中返回None"""
+        if not self.enabled:
+            return None
+
+        key = make_embedding_key(model, text, options)
+        pending = self._pending.get(key) or self._writing.get(key)
+        if pending is not None:
+            self.hits += 1
+            return pending[1]
+
+        vector = None
+        try:
+            conn = self._reader()
+            row = conn.execute("SELECT dim, slot, last_used FROM entries WHERE key = ?", (key,)).fetchone() if conn else None
+            if row:
+                vector = self._read_file(row[0]).read(row[1], key[:DIGEST_SIZE])
+                now = time.time()
+                if vector is not None and not self.read_only and now - row[2] > TOUCH_INTERVAL:
+                    # last_used随下一批写入更新
+                    self._touches[key] = now
+                    self._schedule_write()
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("Embedding cache lookup failed: %s", e)
+
+        if vector is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return vector
+
+    def put(self, model: str, text: str, vector: "np.ndarray", options: Optional[Dict[str, Any]] = None):
+        """写入单个向量，见put_many"""
+        self.put_many(model, [text], [vector], options)
+
+    def put_many(self, model: str, texts: List[str], vectors, options: Optional[Dict[str, Any]] = None):
+        """把一批向量交给后台写入，超出容量时按最近最少使用淘汰
+
+        需在事件循环中调用；写入在线程池中进行，同一批（及排队期间到达的其他批）合并为一个事务。
+        """
+        if not self.enabled or self.read_only:
+            return
+
+        for text, vector in zip(texts, vectors):
+            if not len(vector):
+                continue
+            if len(self._pending) >= MAX_PENDING_WRITES:
+                self.dropped_writes += 1
+                continue
+            self._pending[make_embedding_key(model, text, options)] = (model, vector)
+        self._schedule_write()
+
+    def _schedule_write(self):
+        if (self._pending or self._touches) and (self._writer is None or self._writer.done()):
+            self._writer = asyncio.get_running_loop().create_task(self._drain())
+
+    async def _drain(self):
+        """后台写入任务：每轮取出当前排队的全部条目，在线程池中以一个事务写入"""
+        while self._pending or self._touches:
+            self._writing, self._pending = self._pending, {}
+            touches, self._touches = self._touches, {}
+            try:
+                await asyncio.to_thread(self._write, self._writing, touches)
+            finally:
+                self._writing = {}
+
+    async def flush(self):
+        """等待排队的写入完成"""
+        while self._writer is not None and not self._writer.done():
+            await asyncio.shield(self._writer)
+
+    def _write(self, records: Dict[bytes, Tuple[str, "np.ndarray"]], touches: Dict[bytes, float]):
+        with self._lock:
+            try:
+                conn = self._connect()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    written = 0
+                    for key, (model, vector) in records.items():
+                        if conn.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone():
+                            continue
+                        dim = len(vector)
+                        slot = self._allocate_slot(conn, dim)
+                        self._file(dim).write(slot, key[:DIGEST_SIZE], vector)
+                        conn.execute(
+                            "INSERT INTO entries (key, model, dim, slot, last_used) VALUES (?, ?, ?, ?, ?)",
+                            (key, model, dim, slot, time.time())
+                        )
+                        self._adjust_used(conn, dim * 4 + DIGEST_SIZE)
+                        written += 1
+                    if touches:
+                        conn.executemany("UPDATE entries SET last_used = ? WHERE key = ?",
+                                         [(used, key) for key, used in touches.items()])
+                    self._evict(conn)
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                self.writes += written
+                # 索引已创建，查找不再等待REOPEN_INTERVAL
+                self._reopen_at = 0.0
+            except (sqlite3.Error, OSError) as e:
+                logger.warning("Embedding cache write failed: %s", e)
+
+    def _allocate_slot(self, conn: sqlite3.Connection, dim: int) -> int:
+        """优先复用同维度的空闲槽位，否则追加新槽位"""
+        row = conn.execute("SELECT rowid, slot FROM free_slots WHERE dim = ? LIMIT 1", (dim,)).fetchone()
+        if row:
+            conn.execute("DELETE FROM free_slots WHERE rowid = ?", (row[0],))
+            return row[1]
+
+        row = conn.execute("SELECT next_slot FROM slot_counts WHERE dim = ?", (dim,)).fetchone()
+        slot = row[0] if row else 0
+        conn.execute(
+            "INSERT OR REPLACE INTO slot_counts (dim, next_slot) VALUES (?, ?)",
+            (dim, slot + 1)
+        )
+        return slot
+
+    def _used_bytes(self, conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT value FROM meta WHERE name = 'used_bytes'").fetchone()[0]
+
+    def _adjust_used(self, conn: sqlite3.Connection, delta: int):
+        conn.execute("UPDATE meta SET value = value + ? WHERE name = 'used_bytes'", (delta,))
+
+    def _evict(self, conn: sqlite3.Connection):
+        """总字节数超过上限时淘汰到上限的90%"""
+        used = self._used_bytes(conn)
+        if used <= self.max_bytes:
+            return
+
+        target = int(self.max_bytes * 0.9)
+        while used > target:
+            rows = conn.execute(
+                "SELECT key, dim, slot FROM entries ORDER BY last_used LIMIT 256"
+            ).fetchall()
+            if not rows:
+                break
+            for key, dim, slot in rows:
+                if used <= target:
+                    break
+                self._release(conn, key, dim, slot)
+                used -= dim * 4 + DIGEST_SIZE
+                self.evictions += 1
+
+    def _release(self, conn: sqlite3.Connection, key: bytes, dim: int, slot: int):
+        conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        conn.execute("INSERT INTO free_slots (dim, slot) VALUES (?, ?)", (dim, slot))
+        self._adjust_used(conn, -(dim * 4 + DIGEST_SIZE))
+
+    async def invalidate(self, model: Optional[str] = None) -> int:
+        """按模型失效缓存，model为None时清空全部，返回删除的索引条目数"""
+        if not self.enabled or self.read_only:
+            return 0
+
+        # 尚未写入的条目直接丢弃；正在写入的条目在写入完成后由_invalidate删除
+        self._pending = {key: record for key, record in self._pending.items()
+                         if model is not None and record[0] != model}
+        return await asyncio.to_thread(self._invalidate, model)
+
+    def _invalidate(self, model: Optional[str]) -> int:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if model is None:
+                    rows = conn.execute("SELECT key, dim, slot FROM entries").fetchall()
+                else:
+                    rows = conn.execute("SELECT key, dim, slot FROM entries WHERE model = ?", (model,)).fetchall()
+                for key, dim, slot in rows:
+                    self._release(conn, key, dim, slot)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        result = {
+            "enabled": self.enabled,
+            "read_only": self.read_only,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "pending_writes": len(self._pending) + len(self._writing),
+            "dropped_writes": self.dropped_writes,
+            "evictions": self.evictions
+        }
+        conn = self._reader() if self.enabled else None
+        if conn is not None:
+            try:
+                result["entries"] = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+                result["bytes"] = self._used_bytes(conn)
+            except sqlite3.Error as e:
+                logger.warning("Embedding cache stats failed: %s", e)
+        return result
+
+    def close(self):
+        """关闭数据文件和索引（应先await flush()）"""
+        for vector_file in self._read_files.values():
+            vector_file.close()
+        self._read_files.clear()
+        if self._read_conn is not None:
+            self._read_conn.close()
+            self._read_conn = None
+        with self._lock:
+            for vector_file in self._files.values():
+                vector_file.close()
+            self._files.clear()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# 全局嵌入向量缓存实例
+embedding_cache = EmbeddingCache(
+    cache_dir=settings.embedding_cache_dir,
+    max_bytes=settings.embedding_cache_max_bytes,
+    read_only=settings.embedding_cache_read_only,
+    enabled=settings.embedding_cache_enabled
+)
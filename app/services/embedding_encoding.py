@@ -0,0 +1,134 @@
+import base64
+import struct
+from typing import Any, Dict, Optional, Tuple
+from fastapi import Response
+import pydantic_core
+from app.services.lazy_import import numpy as np
+
+# orjson可直接序列化NumPy数组（float32按最短表示输出），缺失时转换为列表后由pydantic-core序列化
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+ENCODING_JSON = "json"
+ENCODING_BASE64 = "base64"
+ENCODING_BINARY = "binary"
+
+JSON_MEDIA_TYPE = "application/json"
+# 二进制响应：<uint32 向量数><uint32 维度> 后接按行排列的向量数据（int8时其后为每个向量的float32缩放系数）
+BINARY_MEDIA_TYPE = "application/octet-stream"
+BINARY_HEADER = struct.Struct("<II")
+
+# 输出类型：int8按向量对称量化（值 ≈ int8 * scale），binary按符号位打包（第一维为首字节最高位）
+DTYPE_FLOAT32 = "float32"
+DTYPE_FLOAT16 = "float16"
+DTYPE_INT8 = "int8"
+DTYPE_BINARY = "binary"
+EMBEDDING_DTYPES = (DTYPE_FLOAT32, DTYPE_FLOAT16, DTYPE_INT8, DTYPE_BINARY)
+
+
+def negotiate_encoding(accept: Optional[str]) -> str:
+    """按Accept请求头选择嵌入响应编码
+
+    application/octet-stream 为二进制，application/json; encoding=base64 为每个向量一个
+    base64字符串，其余（含未指定）为JSON数组。多个媒体类型按q值从高到低选择第一个支持的。
+    """
+    if not accept:
+        return ENCODING_JSON
+    candidates = []
+    for position, media_range in enumerate(accept.split(",")):
+        media_type, *params = [part.strip().lower() for part in media_range.split(";")]
+        options = dict(param.partition("=")[::2] for param in params)
+        try:
+            quality = float(options.get("q", 1))
+        except ValueError:
+            quality = 0
+        if quality > 0:
+            candidates.append((-quality, position, media_type, options))
+    for _, _, media_type, options in sorted(candidates):
+        if media_type == BINARY_MEDIA_TYPE:
+            return ENCODING_BINARY
+        if media_type == JSON_MEDIA_TYPE and options.get("encoding") == ENCODING_BASE64:
+            return ENCODING_BASE64
+        if media_type in (JSON_MEDIA_TYPE, "application/*", "*/*"):
+            return ENCODING_JSON
+    return ENCODING_JSON
+
+
+def decode_vector(data) -> "np.ndarray":
+    """把上游返回的向量（float列表或小端float32的base64字符串）转换为float32数组"""
+    if isinstance(data, str):
+        return np.frombuffer(base64.b64decode(data), dtype="<f4")
+    return np.asarray(data, dtype=np.float32)
+
+
+def as_matrix(embeddings) -> "np.ndarray":
+    """转换为按行排列的二维小端float32数组"""
+    matrix = np.ascontiguousarray(embeddings, dtype="<f4")
+    return matrix.reshape(1, -1) if matrix.ndim == 1 else matrix
+
+
+def truncate_dimensions(matrix: "np.ndarray", dimensions: int) -> "np.ndarray":
+    """Matryoshka截断：保留前dimensions维并重新归一化为单位长度"""
+    truncated = matrix[:, :dimensions]
+    norms = np.linalg.norm(truncated, axis=1, keepdims=True)
+    return truncated / np.where(norms > 0, norms, 1).astype(truncated.dtype)
+
+
+def quantize(matrix: "np.ndarray", dtype: str) -> Tuple["np.ndarray", Optional["np.ndarray"]]:
+    """按输出类型转换整个矩阵，返回(数据, int8时每个向量的缩放系数)"""
+    if dtype == DTYPE_FLOAT16:
+        return matrix.astype("<f2"), None
+    if dtype == DTYPE_INT8:
+        scales = np.abs(matrix).max(axis=1) / 127 if matrix.size else np.ones(len(matrix))
+        scales = np.where(scales > 0, scales, 1).astype("<f4")
+        return np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8), scales
+    if dtype == DTYPE_BINARY:
+        return np.packbits(matrix > 0, axis=1), None
+    return matrix, None
+
+
+def dumps(payload: Dict[str, Any]) -> bytes:
+    """序列化含NumPy数组的响应体，不逐个元素校验"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    return pydantic_core.to_json({
+        key: value.tolist() if isinstance(value, np.ndarray) else value for key, value in payload.items()
+    })
+
+
+def encode_embeddings(embeddings, encoding: str, field: str = "embeddings", single: bool = False,
+                      dtype: str = DTYPE_FLOAT32, **fields) -> Response:
+    """编码嵌入响应
+
+    embeddings为二维float32数组（single为True时为单个向量，对应旧版/api/embeddings的embedding字段），
+    fields为响应中的其他字段。二进制编码时这些字段以X-Embedding-*响应头返回。
+    dtype不是float32时先整体量化，JSON与base64响应附带dtype（int8另附scales）字段。
+    """
+    matrix = as_matrix(embeddings)
+    data, scales = quantize(matrix, dtype)
+    if encoding == ENCODING_BINARY:
+        count, dim = matrix.shape
+        headers = {"X-Embedding-Dtype": dtype}
+        headers.update({f"X-Embedding-{key.replace('_', '-').title()}": str(value)
+                        for key, value in fields.items() if value is not None})
+        body = BINARY_HEADER.pack(count, dim) + data.tobytes()
+        if scales is not None:
+            body += scales.tobytes()
+        return Response(body, media_type=BINARY_MEDIA_TYPE, headers=headers)
+
+    if encoding == ENCODING_BASE64:
+        vectors = [base64.b64encode(row.tobytes()).decode("ascii") for row in data]
+        payload = {**fields, field: vectors[0] if single and vectors else vectors, "encoding": ENCODING_BASE64}
+    else:
+        # orjson不支持float16数组，JSON中按float32输出量化后的值
+        if data.dtype == np.float16:
+            data = data.astype(np.float32)
+        payload = {**fields, field: data[0] if single and len(data) else data}
+    if dtype != DTYPE_FLOAT32:
+        payload["dtype"] = dtype
+    if scales is not None:
+        payload["scales"] = scales
+    return Response(dumps(payload), media_type=JSON_MEDIA_TYPE)
@@ -1,11 +1,43 @@
 from fastapi import HTTPException
 from typing import Any
-import litellm
 from app.models.ollama_models import ErrorResponse
+from app.services.lazy_import import litellm
+
+# 可重试的错误类别：限流、上游连接失败、服务不可用、超时
+RETRYABLE_STATUS_CODES = {408, 429, 502, 503, 504}
+
+# 上游超时发生的阶段
+STAGE_CONNECT = "connect"
+STAGE_FIRST_TOKEN = "first_token"
+STAGE_INTER_TOKEN = "inter_token"
+STAGE_DEADLINE = "deadline"
+
+class UpstreamTimeout(Exception):
+    """上游在连接、首token或相邻token之间超时，或请求整体截止时间已到"""
+    
+    def __init__(self, stage: str, provider: str):
+        super().__init__(f"Upstream {provider} timed out ({stage})")
+        self.stage = stage
+        self.provider = provider
 
 def handle_litellm_error(error: Exception) -> HTTPException:
     """处理LiteLLM异常并转换为Ollama风格的错误"""
     
+    # 已转换过的HTTP异常（如准入控制的过载响应）直接返回
+    if isinstance(error, HTTPException):
+        return error
+    
+    # 上游挂起或请求超过截止时间
+    if isinstance(error, UpstreamTimeout):
+        return HTTPException(
+            status_code=504,
+            detail=ErrorResponse(
+                error="Upstream timeout",
+                code=504,
+                details=str(error)
+            ).model_dump()
+        )
+    
     # LiteLLM认证错误
     if isinstance(error, litellm.AuthenticationError):
         return HTTPException(
@@ -126,6 +158,15 @@ def handle_litellm_error(error: Exception) -> HTTPException:
         ).model_dump()
     )
 
+def is_retryable_error(error: Exception) -> bool:
+    """判断上游错误是否可重试；本地产生的HTTP异常（如过载卸载）不重试"""
+    if isinstance(error, HTTPException):
+        return False
+    # 截止时间已到时重试没有意义
+    if isinstance(error, UpstreamTimeout):
+        return error.stage != STAGE_DEADLINE
+    return handle_litellm_error(error).status_code in RETRYABLE_STATUS_CODES
+
 def handle_validation_error(error: Any) -> HTTPException:
     """处理请求验证错误"""
     return HTTPException(
@@ -146,4 +187,50 @@ def handle_model_not_found(model_name: str) -> HTTPException:
             code=404,
             details=f"Available models: {', '.join(['qwen2:7b', 'qwen2:14b', 'qwen2:72b', 'deepseek-chat', 'deepseek-coder'])}"
         ).model_dump()
+    )
+
+def handle_overloaded(retry_after: int, details: str) -> HTTPException:
+    """处理过载卸载，返回503并提示客户端重试时间"""
+    return HTTPException(
+        status_code=503,
+        detail=ErrorResponse(
+            error="Server overloaded",
+            code=503,
+            details=details
+        ).model_dump(),
+        headers={"Retry-After": str(retry_after)}
+    )
+
+def handle_circuit_open(provider: str, retry_after: int) -> HTTPException:
+    """处理熔断打开时的快速失败"""
+    return HTTPException(
+        status_code=503,
+        detail=ErrorResponse(
+            error="Provider unavailable",
+            code=503,
+            details=f"Circuit breaker for '{provider}' is open"
+        ).model_dump(),
+        headers={"Retry-After": str(retry_after)}
+    )
+
+def handle_client_disconnect() -> HTTPException:
+    """客户端在响应完成前断开连接，按nginx惯例记为499"""
+    return HTTPException(
+        status_code=499,
+        detail=ErrorResponse(
+            error="Client closed request",
+            code=499,
+            details="The client disconnected before the response was ready"
+        ).model_dump()
+    )
+
+def handle_deadline_exceeded(details: str) -> HTTPException:
+    """请求在发往上游之前（限速等待或排队中）已超过截止时间"""
+    return HTTPException(
+        status_code=504,
+        detail=ErrorResponse(
+            error="Deadline exceeded",
+            code=504,
+            details=details
+        ).model_dump()
     )
\ No newline at end of file
@@ -0,0 +1,116 @@
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+from app.config.settings import settings
+
+
+class LatencyTracker:
+    """按模型记录近期成功请求的延迟，用于计算对冲等待时间"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, model: str, latency: float):
+        samples = self._samples.get(model)
+        if samples is None:
+            samples = self._samples[model] = deque(maxlen=self.window)
+        samples.append(latency)
+
+    def percentile(self, model: str, percentile: float) -> Optional[float]:
+        """返回该模型延迟的百分位数，样本不足时返回None"""
+        samples = self._samples.get(model)
+        if not samples or len(samples) < settings.hedge_min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """主请求超过该时间仍未返回时发出对冲请求"""
+        delay = self.percentile(model, settings.hedge_percentile)
+        if delay is None:
+            return None
+        return max(settings.hedge_min_delay, delay)
+
+    def stats(self) -> Dict[str, Any]:
+        result = {}
+        for model, samples in self._samples.items():
+            ordered = sorted(samples)
+            result[model] = {
+                "samples": len(ordered),
+                "p50": ordered[len(ordered) // 2],
+                "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            }
+        return result
+
+
+class RetryBudget:
+    """全局重试预算
+
+    每个请求存入ratio个令牌，每次重试或对冲取出一个；另按min_per_second补充，
+    保证低流量时也能重试。上游整体故障时预算很快耗尽，重试不会放大故障。
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, max_tokens: float):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.updated = time.monotonic()
+        self.requests = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.exhausted = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.max_tokens, self.tokens + (now - self.updated) * self.min_per_second)
+        self.updated = now
+
+    def deposit(self):
+        """记录一次新请求"""
+        self._refill()
+        self.requests += 1
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self, hedge: bool = False) -> bool:
+        """申请一次重试/对冲，预算不足时返回False"""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            if hedge:
+                self.hedges += 1
+            else:
+                self.retries += 1
+            return True
+        self.exhausted += 1
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        self._refill()
+        return {
+            "available": round(self.tokens, 2),
+            "requests": self.requests,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "exhausted": self.exhausted
+        }
+
+
+def backoff_delay(attempt: int) -> float:
+    """第attempt次重试前的等待时间（指数退避 + 完全抖动）"""
+    ceiling = min(settings.retry_max_delay, settings.retry_base_delay * (2 ** (attempt - 1)))
+    return random.uniform(0, ceiling)
+
+
+# 全局实例
+latency_tracker = LatencyTracker()
+retry_budget = RetryBudget(
+    ratio=settings.retry_budget_ratio,
+    min_per_second=settings.retry_budget_min_per_second,
+    max_tokens=settings.retry_budget_max_tokens
+)
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import socket
+import time
+from typing import Any, Dict, Iterable, Tuple
+import httpx
+from app.config.settings import settings
+from app.services.lazy_import import openai
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2需要安装h2，缺失时退回HTTP/1.1长连接
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class _CountingStream(httpx.AsyncByteStream):
+    """响应体关闭时释放在途计数"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, transport: "_CountingTransport"):
+        self._stream = stream
+        self._transport = transport
+        self._closed = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        if not self._closed:
+            self._closed = True
+            self._transport.active -= 1
+        await self._stream.aclose()
+
+
+class _CountingTransport(httpx.AsyncBaseTransport):
+    """统计在途请求数和超出连接数上限的请求数的传输层包装
+
+    over_limit是开始时在途请求已达max_connections的请求数。HTTP/1.1下这些请求
+    在池中等待空闲连接；HTTP/2下可能复用已有连接的多路流而无需等待，因此不等同于等待次数。
+    """
+
+    def __init__(self, transport: httpx.AsyncHTTPTransport, max_connections: int):
+        self._transport = transport
+        self.max_connections = max_connections
+        self.active = 0
+        self.requests = 0
+        self.over_limit = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        if self.active >= self.max_connections:
+            self.over_limit += 1
+        self.active += 1
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            self.active -= 1
+            raise
+        response.stream = _CountingStream(response.stream, self)
+        return response
+
+    def connection_counts(self) -> Tuple[int, int]:
+        """返回(连接总数, 空闲连接数)，读取httpcore连接池内部状态，取不到时为0"""
+        pool = getattr(self._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return len(connections), idle
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class UpstreamClientPool:
+    """按提供商base URL共享的长连接HTTP客户端池"""
+
+    def __init__(self, max_connections: int, max_keepalive_connections: int,
+                 keepalive_expiry: float, http2: bool):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2_requested = http2
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self._http_clients: Dict[str, httpx.AsyncClient] = {}
+        self._transports: Dict[str, _CountingTransport] = {}
+        self._openai_clients: Dict[Tuple[str, str], Any] = {}
+
+    async def start(self, api_bases: Iterable[str]):
+        """应用启动时为已配置的提供商创建连接池"""
+        if self.http2_requested and not HTTP2_AVAILABLE:
+            logger.warning("UPSTREAM_HTTP2 is enabled but the h2 package is not installed; "
+                           "upstream connections fall back to HTTP/1.1 without multiplexing")
+        for api_base in api_bases:
+            self._get_http_client(api_base)
+        if self._http_clients:
+            logger.info(
+                f"Upstream pools ready for {len(self._http_clients)} providers "
+                f"(http2={self.http2}, max_connections={self.max_connections})"
+            )
+
+    async def prewarm(self, api_base: str, timeout: float) -> Dict[str, Any]:
+        """解析DNS并建立到api_base的连接，连接留在池中供后续请求复用"""
+        url = httpx.URL(api_base)
+        started = time.monotonic()
+        await asyncio.wait_for(
+            asyncio.get_running_loop().getaddrinfo(
+                url.host, url.port or (443 if url.scheme == "https" else 80), type=socket.SOCK_STREAM
+            ),
+            timeout
+        )
+        resolved = time.monotonic()
+        # 不带密钥请求模型列表，任何HTTP响应（包括401）都说明TLS连接已建立
+        response = await self._get_http_client(api_base).get(api_base.rstrip("/") + "/models", timeout=timeout)
+        await response.aclose()
+        return {
+            "dns_ms": round((resolved - started) * 1000, 1),
+            "connect_ms": round((time.monotonic() - resolved) * 1000, 1),
+            "status": response.status_code
+        }
+
+    def _get_http_client(self, api_base: str) -> httpx.AsyncClient:
+        client = self._http_clients.get(api_base)
+        if client is None:
+            transport = _CountingTransport(
+                httpx.AsyncHTTPTransport(
+                    http2=self.http2,
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_keepalive_connections,
+                        keepalive_expiry=self.keepalive_expiry
+                    )
+                ),
+                self.max_connections
+            )
+            # 超时由LiteLLM按请求传入，这里不设置默认超时
+            client = httpx.AsyncClient(transport=transport, timeout=None)
+            self._transports[api_base] = transport
+            self._http_clients[api_base] = client
+        return client
+
+    def get_client(self, api_base: str, api_key: str) -> Any:
+        """获取绑定共享连接池的OpenAI兼容客户端"""
+        key = (api_base, api_key)
+        client = self._openai_clients.get(key)
+        if client is None:
+            client = openai.AsyncOpenAI(
+                api_key=api_key,
+                base_url=api_base,
+                http_client=self._get_http_client(api_base)
+            )
+            self._openai_clients[key] = client
+        return client
+
+    async def aclose(self):
+        """应用关闭时释放所有连接"""
+        for client in self._http_clients.values():
+            await client.aclose()
+        self._http_clients.clear()
+        self._transports.clear()
+        self._openai_clients.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """各提供商连接池统计"""
+        pools = {}
+        for api_base, transport in self._transports.items():
+            connections, idle = transport.connection_counts()
+            pools[api_base] = {
+                "active_requests": transport.active,
+                "connections": connections,
+                "idle_connections": idle,
+                "requests": transport.requests,
+                "requests_over_connection_limit": transport.over_limit
+            }
+        return {
+            "http2": self.http2,
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "keepalive_expiry": self.keepalive_expiry,
+            "pools": pools
+        }
+
+
+# 全局上游连接池实例
+upstream_pool = UpstreamClientPool(
+    max_connections=settings.upstream_max_connections,
+    max_keepalive_connections=settings.upstream_max_keepalive_connections,
+    keepalive_expiry=settings.upstream_keepalive_expiry,
+    http2=settings.upstream_http2
+)
@@ -0,0 +1,47 @@
+import importlib
+from types import ModuleType
+from typing import Any, Callable, Optional
+
+
+class LazyModule:
+    """首次访问属性时才导入的模块代理
+
+    LiteLLM、openai导入耗时数秒，延迟到启动预热阶段（或第一次使用时）再导入，
+    使 `import app.main` 和进程冷启动保持很快。
+    """
+
+    def __init__(self, name: str, on_load: Optional[Callable[[ModuleType], None]] = None):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_on_load", on_load)
+        object.__setattr__(self, "_module", None)
+
+    def load(self) -> ModuleType:
+        """导入并返回真实模块，可在线程池中调用以提前完成导入"""
+        module = self._module
+        if module is None:
+            module = importlib.import_module(self._name)
+            if self._on_load is not None:
+                self._on_load(module)
+            object.__setattr__(self, "_module", module)
+        return module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self.load(), attr)
+
+    def __setattr__(self, attr: str, value: Any):
+        setattr(self.load(), attr, value)
+
+
+def _configure_litellm(module: ModuleType):
+    module.set_verbose = False
+
+
+# 全局延迟导入的模块，导入后所有使用者共享同一个真实模块
+litellm = LazyModule("litellm", on_load=_configure_litellm)
+openai = LazyModule("openai")
+# NumPy只在语义缓存等向量运算中使用，同样不在启动时导入
+numpy = LazyModule("numpy")
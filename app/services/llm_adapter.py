@@ -1,21 +1,134 @@
-import litellm
-from typing import AsyncGenerator, Dict, Any, List
+from fastapi import HTTPException
+from typing import AsyncGenerator, Awaitable, Callable, Dict, Any, List, Optional, Tuple
+import asyncio
+import contextvars
+import itertools
+from contextlib import AsyncExitStack
 import json
+import logging
+import random
 import time
 from datetime import datetime
+import httpx
 from app.config.settings import settings
-from app.models.ollama_models import GenerateResponse, GenerateStreamResponse, EmbeddingResponse
-from app.services.error_handler import handle_litellm_error
+from app.models.ollama_models import GenerateResponse, GenerateStreamResponse
+from app.services.error_handler import (
+    handle_litellm_error, is_retryable_error, handle_deadline_exceeded, handle_validation_error,
+    UpstreamTimeout, STAGE_CONNECT, STAGE_FIRST_TOKEN, STAGE_INTER_TOKEN
+)
+from app.services.deadline import start_deadline, current_deadline
+from app.services.response_cache import response_cache, make_request_key
+from app.services.semantic_cache import semantic_cache, SemanticQuery, normalize_prompt, unit_vector
+from app.services.embedding_cache import embedding_cache
+from app.services.embedding_encoding import decode_vector, truncate_dimensions
+from app.services.http_pool import upstream_pool
+from app.services.stream_encoder import NDJSONStreamEncoder, pop_coalesce_options, CHUNK_SUFFIX
+from app.services.single_flight import single_flight
+from app.services.admission import admission_controller, PRIORITY_INTERACTIVE, PRIORITY_DEFAULT, PRIORITY_BULK
+from app.services.rate_limiter import rate_limiter
+from app.services.hedging import latency_tracker, retry_budget, backoff_delay
+from app.services.circuit_breaker import circuit_breakers
+from app.services.backend_router import backend_router, is_fallback_error, Backend
+from app.services.providers import PROVIDER_ENDPOINTS, provider_api_base
+from app.services.metrics import RequestMetrics, track_request, current_request
+from app.services.lazy_import import litellm, numpy as np
+from app.config.model_manager import model_manager
+
+logger = logging.getLogger(__name__)
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本token数（中文约1字1token，英文约3-4字符1token）"""
+    return max(1, len(text.encode("utf-8")) // 3)
+
+def _ns(seconds: float) -> int:
+    """秒转换为Ollama响应中使用的纳秒"""
+    return int(seconds * 1_000_000_000)
+
+def _upstream_timeout(backend: Backend, stage: str) -> UpstreamTimeout:
+    """记录一次上游超时并返回对应的异常"""
+    metrics = current_request()
+    if metrics is not None:
+        metrics.on_upstream_timeout(stage)
+    return UpstreamTimeout(stage, backend.provider)
+
+class _UpstreamCall:
+    """一次已发出的上游调用，熔断保护和准入名额保持到stack关闭"""
+    __slots__ = ("backend", "api_key", "prompt_tokens", "completion_budget", "reserved", "guard", "permit",
+                 "response", "queued_at", "started_at", "opened_at", "first_token_deadline", "stack")
+
+    def __init__(self, backend: Backend, api_key: str, prompt_tokens: int, completion_budget: int):
+        self.backend = backend
+        self.api_key = api_key
+        self.prompt_tokens = prompt_tokens
+        self.completion_budget = completion_budget
+        self.reserved = False
+        self.guard = None
+        self.permit = None
+        self.response = None
+        # 创建、发出请求（限速与排队结束）、上游返回响应（流式为响应头）的时刻
+        self.queued_at = time.monotonic()
+        self.started_at = 0.0
+        self.opened_at = 0.0
+        # 首token的超时时刻（事件循环时钟），非流式请求为整体截止时间
+        self.first_token_deadline: Optional[float] = None
+        self.stack = AsyncExitStack()
+
+    @property
+    def estimated_tokens(self) -> int:
+        """限速器预约的token数（输入 + 输出上限）"""
+        return self.prompt_tokens + self.completion_budget
+
+    @property
+    def load_duration(self) -> int:
+        """限速等待与准入排队时间（纳秒），对应Ollama的load_duration"""
+        return _ns(self.started_at - self.queued_at)
+
+    def reconcile(self, usage):
+        """用实际usage修正限速器的token预估"""
+        rate_limiter.reconcile(self.backend.provider, self.api_key, self.estimated_tokens,
+                               getattr(usage, "total_tokens", None))
+
+    def refund(self, generated_tokens: int):
+        """调用失败或提前结束时退还未用的限速配额
+
+        尚未发出的请求退还预约的请求数和token数；已发出的按prompt与已生成的token计。
+        """
+        if not self.reserved:
+            return
+        if not self.started_at:
+            rate_limiter.release(self.backend.provider, self.api_key, self.estimated_tokens)
+            return
+        rate_limiter.reconcile(self.backend.provider, self.api_key, self.estimated_tokens,
+                               self.prompt_tokens + generated_tokens)
+
+    def abandon(self, generated_tokens: int):
+        """客户端断开导致调用提前结束：退还配额并记录节省的token"""
+        self.refund(generated_tokens)
+        metrics = current_request()
+        if metrics is not None:
+            metrics.on_upstream_cancelled(self.completion_budget - generated_tokens)
+
+    async def close(self):
+        """关闭上游流式响应的HTTP连接，不等待模型生成结束"""
+        stream = getattr(self.response, "completion_stream", self.response)
+        close = getattr(stream, "close", None)
+        if close is not None and asyncio.iscoroutinefunction(close):
+            await close()
 
 class LLMAdapter:
     """LiteLLM适配器服务"""
     
     def __init__(self):
-        # 配置LiteLLM
-        litellm.set_verbose = False
+        # LiteLLM在首次使用或启动预热时才导入，见lazy_import
         
         # 配置各提供商的API密钥
         self._setup_api_keys()
+        
+        # 无前缀亲和性的请求在多个API密钥间轮询
+        self._key_cursor = itertools.count()
+        
+        # 语义缓存复核等后台任务，保持引用直到完成
+        self._background_tasks = set()
     
     def _setup_api_keys(self):
         """设置各提供商的API密钥"""
@@ -30,32 +143,167 @@ class LLMAdapter:
     
     def _get_litellm_model(self, ollama_model: str) -> str:
         """转换模型名称为LiteLLM格式"""
-        # 将dashscope/和siliconflow/前缀转换为openai/格式
-        if ollama_model.startswith("dashscope/"):
-            return ollama_model.replace("dashscope/", "openai/")
-        elif ollama_model.startswith("siliconflow/"):
-            return ollama_model.replace("siliconflow/", "openai/")
+        # 已知提供商统一通过OpenAI兼容接口调用，以便复用共享连接池
+        provider, _, model_name = ollama_model.partition("/")
+        if model_name and provider in PROVIDER_ENDPOINTS:
+            return f"openai/{model_name}"
         else:
             return ollama_model
     
-    def _get_model_config(self, original_model: str) -> dict:
-        """根据原始模型名称获取API配置"""
+    def _get_model_config(self, original_model: str, affinity: Optional[str] = None) -> dict:
+        """根据原始模型名称获取API配置
+        
+        同一提供商可配置多个以逗号分隔的API密钥，affinity相同的请求固定使用同一个密钥。
+        """
         config = {}
         
-        # 阿里百炼模型配置
-        if original_model.startswith("dashscope/"):
-            if settings.dashscope_api_key:
-                config["api_key"] = settings.dashscope_api_key
-                config["api_base"] = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+        provider = original_model.split('/')[0] if '/' in original_model else None
+        if provider not in PROVIDER_ENDPOINTS:
+            return config
         
-        # 硅基流动模型配置
-        elif original_model.startswith("siliconflow/"):
-            if settings.siliconflow_api_key:
-                config["api_key"] = settings.siliconflow_api_key
-                config["api_base"] = "https://api.siliconflow.cn/v1"
+        api_base = provider_api_base(provider)
+        api_key_setting = PROVIDER_ENDPOINTS[provider][1]
+        config["api_base"] = api_base
+        
+        api_keys = [key.strip() for key in getattr(settings, api_key_setting).split(",") if key.strip()]
+        if api_keys:
+            if affinity:
+                api_key = api_keys[int(affinity[:8], 16) % len(api_keys)]
+            else:
+                api_key = api_keys[next(self._key_cursor) % len(api_keys)]
+            config["api_key"] = api_key
+            # 复用该提供商的共享连接池
+            config["client"] = upstream_pool.get_client(api_base, api_key)
         
         return config
     
+    def _prefix_affinity(self, messages: List[Dict]) -> Optional[str]:
+        """计算对话前缀指纹（截至第一条用户消息），前缀过短时返回None
+        
+        同一对话的后续轮次共享该前缀，固定到同一密钥/端点才能命中提供商的上下文缓存。
+        """
+        prefix = []
+        prefix_chars = 0
+        for message in messages:
+            prefix.append(message)
+            prefix_chars += len(str(message.get("content") or ""))
+            if message.get("role") == "user":
+                break
+        if prefix_chars < settings.prefix_affinity_min_chars:
+            return None
+        return make_request_key("", prefix)
+    
+    def _cached_prompt_tokens(self, usage) -> Optional[int]:
+        """从usage中读取提供商上下文缓存命中的prompt token数"""
+        if usage is None:
+            return None
+        details = getattr(usage, "prompt_tokens_details", None)
+        if isinstance(details, dict):
+            cached = details.get("cached_tokens")
+        else:
+            cached = getattr(details, "cached_tokens", None)
+        if cached is None:
+            # DeepSeek在usage顶层返回缓存命中数
+            cached = getattr(usage, "prompt_cache_hit_tokens", None)
+        return cached
+    
+    def _estimate_prompt_tokens(self, messages: List[Dict]) -> int:
+        """本地估算消息的prompt token数"""
+        return sum(estimate_tokens(str(message.get("content") or "")) for message in messages)
+    
+    def _embedding_options(self, litellm_model: str, options: Dict) -> Dict:
+        """上游嵌入调用的参数
+
+        OpenAI兼容接口显式请求base64编码：SDK不再逐个元素构造float对象，向量直接解码为float32数组。
+        不支持该参数的提供商会忽略它并照常返回float列表。
+        """
+        if litellm_model.startswith("openai/"):
+            options = {"encoding_format": "base64", **options}
+            # LiteLLM只允许text-embedding-3系列设置dimensions，其他OpenAI兼容模型经extra_body透传
+            if "dimensions" in options:
+                options["extra_body"] = {**(options.get("extra_body") or {}), "dimensions": options.pop("dimensions")}
+        return options
+    
+    def _completion_budget(self, options: Dict) -> int:
+        """一次对话请求的输出token上限，未指定时使用默认预估；不是数字时返回422"""
+        for name in ("max_tokens", "num_predict"):
+            value = options.get(name)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                raise handle_validation_error(f"Invalid {name}: {value!r}")
+        completion_tokens = options.get("max_tokens") or options.get("num_predict")
+        if not completion_tokens or completion_tokens < 0:
+            completion_tokens = settings.rate_limit_default_completion_tokens
+        return completion_tokens
+    
+    def get_configured_api_bases(self) -> List[str]:
+        """获取已配置API密钥的提供商接口地址"""
+        return [provider_api_base(provider) for provider, (_, api_key_setting) in PROVIDER_ENDPOINTS.items()
+                if getattr(settings, api_key_setting)]
+    
+    def _get_request_keys(self, model: str, payload: Any, options: Dict,
+                          flight_options: Optional[Dict] = None) -> Tuple[Optional[str], Optional[str]]:
+        """获取(响应缓存键, 请求合并键)，模型未开启对应功能时为None
+
+        flight_options为合并后各调用方共用、但不影响生成结果的设置（如超时与增量合并），
+        只计入请求合并键，设置不同的请求不合并。
+        """
+        model_config = model_manager.get_model_config(model)
+        if model_config is None or not (model_config.response_cache or model_config.single_flight):
+            return None, None
+        request_key = make_request_key(model, payload, options)
+        flight_key = None
+        if model_config.single_flight:
+            flight_key = make_request_key(model, payload, {**options, **flight_options}) if flight_options else request_key
+        return request_key if model_config.response_cache else None, flight_key
+    
+    async def _semantic_lookup(self, model: str, messages: List[Dict], options: Dict) -> Optional[SemanticQuery]:
+        """嵌入最后一条用户消息并查询语义缓存，命中时结果在query.hit中
+
+        模型未开启语义缓存时返回None；嵌入失败或超过SEMANTIC_CACHE_EMBED_TIMEOUT时同样返回None，
+        请求照常发往上游。
+        """
+        query = semantic_cache.query(model, messages, options)
+        if query is None:
+            return None
+        try:
+            async with asyncio.timeout_at(current_deadline().at(settings.semantic_cache_embed_timeout)):
+                [embedding] = await self._embed_inputs(semantic_cache.embedding_model, [query.text])
+        except Exception as e:
+            logger.warning("Semantic cache lookup failed for %s: %s", model, e)
+            semantic_cache.record_error(query)
+            return None
+        if semantic_cache.get(query, embedding) is not None and random.random() < settings.semantic_cache_verify_ratio:
+            self._verify_semantic_hit(model, messages, dict(options), query)
+        return query
+    
+    def _verify_semantic_hit(self, model: str, messages: List[Dict], options: Dict, query: SemanticQuery):
+        """在后台重新请求上游，按两个回答的语义相似度判断这次命中是否为误命中"""
+        async def verify():
+            start_deadline(model, options)
+            try:
+                response = await self._resilient_completion(model, messages, None, time.time(), PRIORITY_BULK, **options)
+                cached_text = normalize_prompt(query.hit.content)
+                fresh_text = normalize_prompt(response.response or "")
+                if cached_text == fresh_text:
+                    similarity = 1.0
+                elif not cached_text or not fresh_text:
+                    similarity = 0.0
+                else:
+                    embeddings = await self._embed_inputs(semantic_cache.embedding_model, [cached_text, fresh_text])
+                    cached_vector, fresh_vector = (unit_vector(embedding) for embedding in embeddings)
+                    if cached_vector is None or fresh_vector is None:
+                        return
+                    similarity = float(cached_vector @ fresh_vector)
+            except Exception as e:
+                logger.warning("Semantic cache verification failed for %s: %s", model, e)
+                return
+            semantic_cache.record_verification(query, similarity, settings.semantic_cache_verify_threshold)
+        
+        # 在空白上下文中运行，不计入当前请求的指标，也不受其截止时间约束
+        task = asyncio.get_running_loop().create_task(verify(), context=contextvars.Context())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
     async def generate_completion(self, 
                                 model: str, 
                                 prompt: str, 
@@ -71,95 +319,519 @@ class LLMAdapter:
             messages.append({"role": "user", "content": prompt})
             
             # 调用LiteLLM
-            if stream:
-                return self._stream_completion(model, messages, **kwargs)
-            else:
-                return await self._complete_completion(model, messages, **kwargs)
+            return await self._run_completion("generate", model, messages, stream, PRIORITY_DEFAULT, **kwargs)
                 
         except Exception as e:
             raise handle_litellm_error(e)
     
-    async def _complete_completion(self, model: str, messages: List[Dict], **kwargs) -> GenerateResponse:
+    async def chat_completion(self,
+                              model: str,
+                              messages: List[Dict],
+                              stream: bool = False,
+                              **kwargs) -> Any:
+        """聊天完成，按原始顺序将结构化消息发送给上游"""
+        try:
+            # 交互式聊天优先于批量请求调度
+            return await self._run_completion("chat", model, messages, stream, PRIORITY_INTERACTIVE, **kwargs)
+                
+        except Exception as e:
+            raise handle_litellm_error(e)
+    
+    async def _run_completion(self, endpoint: str, model: str, messages: List[Dict],
+                              stream: bool, priority: int, **kwargs) -> Any:
+        """执行完成请求并记录指标"""
+        metrics = track_request(endpoint, model, backend_router.backends(model)[0].provider)
+        try:
+            if stream:
+                return await self._prime_stream(
+                    self._metered_stream(metrics, self._stream_completion(model, messages, priority=priority, **kwargs))
+                )
+            response = await self._complete_completion(model, messages, priority=priority, **kwargs)
+            metrics.set_usage(response.prompt_eval_count, response.eval_count)
+            metrics.finish()
+            return response
+        except Exception as e:
+            metrics.finish(handle_litellm_error(e).status_code)
+            raise
+        except BaseException:
+            # 客户端断开连接，见disconnect.cancel_on_disconnect
+            metrics.finish(499)
+            raise
+    
+    async def _metered_stream(self, metrics: RequestMetrics, frames: AsyncGenerator[str, None]):
+        """流结束（完成、出错或客户端断开）时记录请求指标"""
+        try:
+            async for frame in frames:
+                yield frame
+        except Exception as e:
+            metrics.finish(handle_litellm_error(e).status_code)
+            raise
+        except BaseException:
+            # 客户端断开连接
+            metrics.finish(499)
+            raise
+        finally:
+            metrics.finish()
+    
+    async def _prime_stream(self, frames: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+        """预取第一帧，使排队超时等错误在响应开始前以HTTP状态码返回"""
+        first_frame = await frames.__anext__()
+        
+        async def replay():
+            try:
+                yield first_frame
+                async for frame in frames:
+                    yield frame
+            finally:
+                # 客户端断开时响应生成器可能停在yield处，显式关闭以立即释放上游连接
+                await frames.aclose()
+        
+        return replay()
+    
+    async def _complete_completion(self, model: str, messages: List[Dict], *,
+                                   priority: int = PRIORITY_DEFAULT, **kwargs) -> GenerateResponse:
         """非流式完成"""
         start_time = time.time()
+        # 增量合并参数只对流式响应有效，同样校验后取出，不传给上游也不计入缓存键
+        pop_coalesce_options(kwargs)
+        deadline = start_deadline(model, kwargs)
+        
+        # 查询响应缓存，未命中时再按语义查找；合并的请求共用首个请求的截止时间
+        cache_key, flight_key = self._get_request_keys(model, messages, kwargs, {"timeout": deadline.timeout})
+        cached = response_cache.get(cache_key) if cache_key else None
+        semantic = None
+        if cached is None:
+            semantic = await self._semantic_lookup(model, messages, kwargs)
+            cached = semantic.hit if semantic is not None else None
+        if cached:
+            return GenerateResponse(
+                model=model,
+                created_at=datetime.now().isoformat(),
+                response=cached.content,
+                done=True,
+                done_reason=cached.done_reason,
+                total_duration=_ns(time.time() - start_time),
+                eval_count=cached.eval_count,
+                prompt_eval_count=cached.prompt_eval_count
+            )
+        
+        # 相同的并发请求共享一次上游调用
+        if flight_key:
+            response = await single_flight.do(
+                flight_key,
+                lambda: self._resilient_completion(model, messages, cache_key, start_time, priority, **kwargs)
+            )
+        else:
+            response = await self._resilient_completion(model, messages, cache_key, start_time, priority, **kwargs)
+        if semantic is not None and response.response is not None:
+            semantic_cache.put(semantic, response.response, response.done_reason,
+                               response.prompt_eval_count, response.eval_count)
+        return response
+    
+    async def _resilient_completion(self, model: str, messages: List[Dict], cache_key: Optional[str],
+                                    start_time: float, priority: int, **kwargs) -> GenerateResponse:
+        """带重试（及可选对冲）的非流式请求，重试次数受全局重试预算约束"""
+        model_config = model_manager.get_model_config(model)
+        hedge = model_config is not None and model_config.hedge
+        
+        retry_budget.deposit()
+        attempt = 1
+        while True:
+            try:
+                if hedge:
+                    return await self._hedged_completion(model, messages, cache_key, start_time, priority, **kwargs)
+                return await self._request_completion(model, messages, cache_key, start_time, priority, **kwargs)
+            except Exception as e:
+                if (attempt >= settings.retry_max_attempts or not is_retryable_error(e)
+                        or current_deadline().expired or not retry_budget.withdraw()):
+                    raise
+                await asyncio.sleep(backoff_delay(attempt))
+                attempt += 1
+    
+    async def _hedged_completion(self, model: str, messages: List[Dict], cache_key: Optional[str],
+                                 start_time: float, priority: int, **kwargs) -> GenerateResponse:
+        """主请求超过该模型的延迟百分位仍未返回时再发一次，取先完成的结果并取消另一个"""
+        def attempt():
+            return asyncio.ensure_future(
+                self._request_completion(model, messages, cache_key, start_time, priority, **kwargs)
+            )
         
+        primary = attempt()
+        tasks = {primary}
+        try:
+            delay = latency_tracker.hedge_delay(model)
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                # 未取得预算时只等待主请求
+                if not done and retry_budget.withdraw(hedge=True):
+                    tasks.add(attempt())
+            
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            retry_budget.hedge_wins += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def _with_fallback(self, model: str, attempt: Callable[[Backend], Awaitable[Any]],
+                             affinity: Optional[str] = None) -> Any:
+        """按路由计划依次尝试模型的各个后端，限流或故障时切换到下一个"""
+        plan = backend_router.plan(model, affinity)
+        for index, backend in enumerate(plan):
+            attempt_start = time.monotonic()
+            try:
+                result = await attempt(backend)
+            except Exception as e:
+                fallback = is_fallback_error(e)
+                if fallback:
+                    backend_router.record(backend, time.monotonic() - attempt_start, failed=True)
+                if not fallback or index == len(plan) - 1:
+                    raise
+                backend_router.fallbacks += 1
+                continue
+            backend_router.record(backend, time.monotonic() - attempt_start, failed=False)
+            return result
+    
+    async def _open_completion(self, backend: Backend, model: str, messages: List[Dict], affinity: Optional[str],
+                               priority: int, stream: bool, **kwargs) -> _UpstreamCall:
+        """向指定后端发出请求，affinity为对话前缀指纹（见_prefix_affinity）"""
         # 获取模型配置
-        litellm_model = self._get_litellm_model(model)
-        model_config = self._get_model_config(model)
+        litellm_model = self._get_litellm_model(backend.target)
+        model_config = self._get_model_config(backend.target, affinity)
+        call = _UpstreamCall(backend, model_config.get("api_key", ""),
+                             self._estimate_prompt_tokens(messages), self._completion_budget(kwargs))
+        metrics = current_request()
+        if metrics is not None:
+            metrics.set_provider(backend.provider)
+        deadline = current_deadline()
         
-        response = await litellm.acompletion(
-            model=litellm_model,
-            messages=messages,
-            stream=False,
-            **model_config,
-            **kwargs
-        )
+        if stream and settings.stream_include_usage and litellm_model.startswith("openai/"):
+            kwargs.setdefault("stream_options", {"include_usage": True})
+        # 只限制建立连接的时间，等待响应的超时在下面按阶段控制
+        kwargs["timeout"] = httpx.Timeout(None, connect=deadline.remaining(settings.upstream_connect_timeout))
+        
+        # 熔断打开时快速失败；先按配额匀速，再占用并发名额
+        try:
+            call.guard = call.stack.enter_context(circuit_breakers.guard(backend.provider, model))
+            try:
+                # 限速等待和排队同样不能超过截止时间
+                async with asyncio.timeout_at(deadline.expires_at):
+                    call.reserved = True
+                    await rate_limiter.acquire(backend.provider, call.api_key, call.estimated_tokens)
+                    call.permit = await call.stack.enter_async_context(
+                        admission_controller.admit(backend.provider, backend.target, priority)
+                    )
+            except TimeoutError:
+                raise handle_deadline_exceeded(
+                    f"Request deadline of {deadline.timeout}s exceeded before it was sent upstream"
+                ) from None
+            call.started_at = time.monotonic()
+            call.guard.begin()
+            # 流式请求等待响应头计入首token超时，非流式请求在截止时间内等待完整响应
+            call.first_token_deadline = deadline.at(settings.first_token_timeout if stream else 0)
+            try:
+                async with asyncio.timeout_at(call.first_token_deadline):
+                    call.response = await litellm.acompletion(
+                        model=litellm_model,
+                        messages=messages,
+                        stream=stream,
+                        **model_config,
+                        **kwargs
+                    )
+            except TimeoutError:
+                raise _upstream_timeout(backend, deadline.stage(call.first_token_deadline, STAGE_FIRST_TOKEN)) from None
+            except litellm.Timeout as e:
+                # 未设置读取超时，LiteLLM报告的超时来自建立连接
+                raise _upstream_timeout(backend, STAGE_CONNECT) from e
+            call.opened_at = time.monotonic()
+            if stream:
+                # 流结束或被取消时先关闭上游连接，再释放准入名额
+                call.stack.push_async_callback(call.close)
+        except BaseException as e:
+            if isinstance(e, Exception):
+                call.refund(0)
+            else:
+                # 客户端断开（或对冲的另一路已完成）导致排队或等待响应时被取消
+                call.abandon(0)
+            await call.stack.__aexit__(type(e), e, e.__traceback__)
+            raise
+        return call
+    
+    async def _request_completion(self, model: str, messages: List[Dict], cache_key: Optional[str],
+                                  start_time: float, priority: int, **kwargs) -> GenerateResponse:
+        """向上游发送非流式请求"""
+        # 同一对话固定到同一后端和密钥
+        affinity = self._prefix_affinity(messages)
+        
+        async def attempt(backend: Backend) -> _UpstreamCall:
+            call = await self._open_completion(backend, model, messages, affinity, priority, False, **kwargs)
+            await call.stack.aclose()
+            return call
+        
+        call = await self._with_fallback(model, attempt, affinity)
+        latency_tracker.record(model, call.opened_at - call.started_at)
+        response = call.response
+        call.reconcile(response.usage)
         
         end_time = time.time()
-        duration_ns = int((end_time - start_time) * 1_000_000_000)
+        duration_ns = _ns(end_time - start_time)
+        
+        content = response.choices[0].message.content
+        done_reason = response.choices[0].finish_reason
+        # 提供商未返回usage时在本地估算
+        usage = response.usage
+        eval_count = getattr(usage, "completion_tokens", None)
+        if eval_count is None:
+            eval_count = estimate_tokens(content) if content else 0
+        prompt_eval_count = getattr(usage, "prompt_tokens", None)
+        if prompt_eval_count is None:
+            prompt_eval_count = self._estimate_prompt_tokens(messages)
+        prompt_cache_hit_count = self._cached_prompt_tokens(response.usage)
+        
+        if cache_key and content is not None:
+            response_cache.put(cache_key, content, done_reason, prompt_eval_count, eval_count)
         
         return GenerateResponse(
             model=model,
             created_at=datetime.now().isoformat(),
-            response=response.choices[0].message.content,
+            response=content,
             done=True,
+            done_reason=done_reason,
             total_duration=duration_ns,
-            eval_count=response.usage.completion_tokens if response.usage else None,
-            prompt_eval_count=response.usage.prompt_tokens if response.usage else None
+            load_duration=call.load_duration,
+            # 非流式响应无法区分预填充与生成阶段，上游耗时全部计入eval_duration
+            eval_duration=_ns(call.opened_at - call.started_at),
+            eval_count=eval_count,
+            prompt_eval_count=prompt_eval_count,
+            prompt_cache_hit_count=prompt_cache_hit_count
         )
     
-    async def _stream_completion(self, original_model: str, messages: List[Dict], **kwargs):
+    async def _stream_completion(self, original_model: str, messages: List[Dict], *,
+                                 priority: int = PRIORITY_DEFAULT, **kwargs):
         """流式完成"""
+        start_time = time.monotonic()
+        deadline = start_deadline(original_model, kwargs)
+        
+        # 增量合并参数可按请求通过options覆盖，不传给上游
+        coalesce_ms, coalesce_bytes = pop_coalesce_options(kwargs)
+        encoder = NDJSONStreamEncoder(original_model, coalesce_ms=coalesce_ms, coalesce_bytes=coalesce_bytes)
+        
+        # 命中响应缓存或语义缓存时直接以NDJSON流回放；共享的流使用首个请求的编码器和截止时间，
+        # 只合并这些设置相同的请求
+        cache_key, flight_key = self._get_request_keys(original_model, messages, kwargs, {
+            "timeout": deadline.timeout,
+            "stream_coalesce_ms": coalesce_ms,
+            "stream_coalesce_bytes": coalesce_bytes
+        })
+        cached = response_cache.get(cache_key) if cache_key else None
+        semantic = None
+        if cached is None:
+            semantic = await self._semantic_lookup(original_model, messages, kwargs)
+            cached = semantic.hit if semantic is not None else None
+        if cached:
+            yield encoder.encode_chunk(cached.content)
+            yield encoder.encode_done(
+                cached.done_reason,
+                total_duration=_ns(time.monotonic() - start_time),
+                prompt_eval_count=cached.prompt_eval_count,
+                eval_count=cached.eval_count
+            )
+            return
+        
+        # 相同的并发流式请求共享一个上游流，后加入者先收到已缓冲的前缀
+        if flight_key:
+            frames = single_flight.stream(
+                flight_key,
+                lambda: self._request_stream(original_model, messages, encoder, cache_key, semantic,
+                                             start_time, priority, **kwargs),
+                on_shared_chunk=self._record_shared_frame
+            )
+        else:
+            frames = self._request_stream(original_model, messages, encoder, cache_key, semantic,
+                                          start_time, priority, **kwargs)
+        
+        async for frame in frames:
+            yield frame
+    
+    async def _request_stream(self, original_model: str, messages: List[Dict],
+                              encoder: NDJSONStreamEncoder, cache_key: Optional[str],
+                              semantic: Optional[SemanticQuery], start_time: float, priority: int, **kwargs):
+        """向上游发送流式请求并编码为NDJSON帧"""
         try:
-            # 获取模型配置
-            litellm_model = self._get_litellm_model(original_model)
-            model_config = self._get_model_config(original_model)
-        
-            response = await litellm.acompletion(
-                model=litellm_model,
-                messages=messages,
-                stream=True,
-                **model_config,
-                **kwargs
+            # 首个token产生前出错时可回退到其他后端；同一对话固定到同一后端和密钥
+            affinity = self._prefix_affinity(messages)
+            call = await self._with_fallback(
+                original_model,
+                lambda backend: self._open_completion(backend, original_model, messages, affinity,
+                                                      priority, True, **kwargs),
+                affinity
             )
             
-            async for chunk in response:
-                if chunk.choices and chunk.choices[0].delta.content:
-                    content = chunk.choices[0].delta.content
-                    
-                    # 使用Ollama兼容的格式
-                    ollama_response = {
-                        "model": original_model,
-                        "created_at": datetime.now().isoformat(),
-                        "message": {
-                            "role": "assistant",
-                            "content": content
-                        },
-                        "done": False
-                    }
-                    
-                    yield json.dumps(ollama_response) + "\n"
+            metrics = current_request()
+            deadline = current_deadline()
+            timed_out = False
             
-            # 发送结束标记
-            final_response = {
-                "model": original_model,
-                "created_at": datetime.now().isoformat(),
-                "message": {
-                    "role": "assistant",
-                    "content": ""
-                },
-                "done": True
-            }
-            yield json.dumps(final_response) + "\n"
+            # 准入名额保持到流结束；客户端断开时在此处收到取消（或生成器被关闭），
+            # 退出stack即关闭上游连接，提供商随之停止生成
+            content_parts = []
+            done_reason = None
+            usage = None
+            first_token_at = None
+            chunk_count = 0
+            try:
+                async with call.stack:
+                    chunks = call.response.__aiter__()
+                    # 首token前按首token超时，之后每个token按token间超时，均不超过截止时间；
+                    # 超时只包住等待上游的部分，不包住yield，避免取消到消费方
+                    when = call.first_token_deadline
+                    # 合并窗口中有内容时在后台等待下一个增量，窗口到期即发送，不等上游返回
+                    next_chunk = None
+                    try:
+                        while True:
+                            flush_delay = encoder.flush_delay()
+                            try:
+                                async with asyncio.timeout_at(when):
+                                    if flush_delay is None and next_chunk is None:
+                                        chunk = await chunks.__anext__()
+                                    else:
+                                        if next_chunk is None:
+                                            next_chunk = asyncio.ensure_future(chunks.__anext__())
+                                        done, _ = await asyncio.wait((next_chunk,), timeout=flush_delay)
+                                        chunk = None
+                                        if done:
+                                            done_chunk, next_chunk = next_chunk, None
+                                            chunk = done_chunk.result()
+                            except StopAsyncIteration:
+                                break
+                            except TimeoutError:
+                                stage = STAGE_INTER_TOKEN if first_token_at is not None else STAGE_FIRST_TOKEN
+                                raise _upstream_timeout(call.backend, deadline.stage(when, stage)) from None
+                            if chunk is None:
+                                frame = encoder.flush()
+                                if frame:
+                                    yield frame
+                                continue
+                            if getattr(chunk, "usage", None):
+                                usage = chunk.usage
+                            if not chunk.choices:
+                                continue
+                            choice = chunk.choices[0]
+                            if choice.finish_reason:
+                                done_reason = choice.finish_reason
+                            content = choice.delta.content
+                            if content:
+                                if first_token_at is None:
+                                    first_token_at = time.monotonic()
+                                    call.permit.mark_first_token()
+                                    call.guard.mark_first_token()
+                                when = deadline.at(settings.inter_token_timeout)
+                                chunk_count += 1
+                                if metrics is not None:
+                                    metrics.on_token()
+                                if cache_key or semantic is not None:
+                                    content_parts.append(content)
+                                
+                                # 使用Ollama兼容的格式
+                                frame = encoder.feed(content)
+                                if frame:
+                                    yield frame
+                    except (asyncio.CancelledError, GeneratorExit):
+                        call.abandon(chunk_count)
+                        raise
+                    finally:
+                        # 超时、出错或被取消时不再等待上游，连接随后随stack关闭
+                        if next_chunk is not None:
+                            next_chunk.cancel()
+            except UpstreamTimeout:
+                # 上游挂起或截止时间已到：连接已随stack关闭，以done帧正常结束已输出的内容
+                timed_out = True
+                done_reason = "timeout"
+                call.refund(chunk_count)
+                if metrics is not None:
+                    metrics.status = 504
+            
+            finished_at = time.monotonic()
+            
+            frame = encoder.flush()
+            if frame:
+                yield frame
+            
+            # 提供商未返回usage时在本地计数：prompt按文本估算，生成按增量个数（通常每个增量一个token）
+            prompt_eval_count = getattr(usage, "prompt_tokens", None)
+            if prompt_eval_count is None:
+                prompt_eval_count = self._estimate_prompt_tokens(messages)
+            eval_count = getattr(usage, "completion_tokens", None)
+            if eval_count is None:
+                eval_count = chunk_count
+            if usage is not None:
+                call.reconcile(usage)
+            if metrics is not None:
+                metrics.set_usage(prompt_eval_count, eval_count)
             
+            if not timed_out:
+                if cache_key:
+                    response_cache.put(cache_key, "".join(content_parts), done_reason, prompt_eval_count, eval_count)
+                if semantic is not None:
+                    semantic_cache.put(semantic, "".join(content_parts), done_reason, prompt_eval_count, eval_count)
+            
+            # 发送结束标记：预填充时间为发出请求到首token，生成时间为首token到流结束
+            first_token_at = first_token_at or finished_at
+            yield encoder.encode_done(
+                done_reason,
+                total_duration=_ns(finished_at - start_time),
+                load_duration=call.load_duration,
+                prompt_eval_count=prompt_eval_count,
+                prompt_eval_duration=_ns(first_token_at - call.started_at),
+                eval_count=eval_count,
+                eval_duration=_ns(finished_at - first_token_at),
+                prompt_cache_hit_count=self._cached_prompt_tokens(usage)
+            )
+            
+        except HTTPException:
+            # 过载等需以HTTP状态码返回的错误交给上层处理
+            raise
+        except UpstreamTimeout:
+            # 所有后端都未能在超时内返回响应头，同样以done帧结束
+            metrics = current_request()
+            if metrics is not None:
+                metrics.status = 504
+            yield encoder.encode_done("timeout", total_duration=_ns(time.monotonic() - start_time))
         except Exception as e:
+            # 响应已开始，错误以帧的形式返回，指标中仍按错误类别记录
+            status_code = handle_litellm_error(e).status_code
+            metrics = current_request()
+            if metrics is not None:
+                metrics.status = status_code
             error_response = {
                 "error": str(e),
+                "code": status_code,
                 "model": original_model,
                 "done": True
             }
             yield json.dumps(error_response) + "\n"
     
+    def _record_shared_frame(self, frame: str):
+        """合并到已有上游流的订阅者按实际收到的帧记录自己的首token时间、token数与结果"""
+        metrics = current_request()
+        if metrics is None:
+            return
+        if frame.endswith(CHUNK_SUFFIX):
+            metrics.on_token()
+            return
+        final = json.loads(frame)
+        metrics.set_usage(final.get("prompt_eval_count"), final.get("eval_count"))
+        if "error" in final:
+            metrics.status = final.get("code") or 500
+        elif final.get("done_reason") == "timeout":
+            metrics.status = 504
+    
     async def generate(self, request) -> GenerateResponse:
         """生成文本（兼容GenerateRequest）"""
         return await self.generate_completion(
@@ -186,7 +858,7 @@ class LLMAdapter:
         ):
             yield chunk
     
-    async def create_embeddings(self, request) -> EmbeddingResponse:
+    async def create_embeddings(self, request) -> "np.ndarray":
         """创建嵌入向量（兼容EmbeddingRequest）"""
         return await self.generate_embedding(
             model=request.model,
@@ -195,40 +867,184 @@ class LLMAdapter:
                if k not in ['model', 'prompt'] and v is not None}
         )
 
-    async def generate_embedding(self, model: str, prompt: str, **kwargs) -> EmbeddingResponse:
-        """生成嵌入向量"""
+    async def generate_embedding(self, model: str, prompt: str, **kwargs) -> "np.ndarray":
+        """生成单个嵌入向量，返回float32数组
+
+        与/api/embed相同，经嵌入缓存、请求合并、准入控制、限速与熔断后发往上游。
+        """
+        metrics = track_request("embeddings", model, backend_router.backends(model)[0].provider)
         try:
-            litellm_model = self._get_litellm_model(model)
-            model_config = self._get_model_config(model)
+            _, flight_key = self._get_request_keys(model, [prompt], kwargs)
+            if flight_key:
+                embeddings = await single_flight.do(flight_key, lambda: self._embed_inputs(model, [prompt], **kwargs))
+            else:
+                embeddings = await self._embed_inputs(model, [prompt], **kwargs)
+            metrics.finish()
+            return embeddings[0]
+        except Exception as e:
+            error = handle_litellm_error(e)
+            metrics.finish(error.status_code)
+            raise error
+        except BaseException:
+            metrics.finish(499)
+            raise
+    
+    async def generate_embeddings(self, model: str, inputs: List[str], dimensions: Optional[int] = None,
+                                  **kwargs) -> "np.ndarray":
+        """批量生成嵌入向量，返回按inputs顺序排列的二维float32数组
+
+        指定dimensions时按模型的embedding_dimensions_mode传给上游，或取完整向量后在本地截断；
+        本地截断时缓存和请求合并都基于完整向量，不同维度的请求可共用。
+        """
+        metrics = track_request("embed", model, backend_router.backends(model)[0].provider)
+        try:
+            truncate_to = None
+            if dimensions is not None:
+                model_config = model_manager.get_model_config(model)
+                mode = model_config.embedding_dimensions_mode if model_config else None
+                if mode == "upstream":
+                    kwargs["dimensions"] = dimensions
+                elif mode == "truncate":
+                    truncate_to = dimensions
+                else:
+                    raise handle_validation_error(f"Model {model} does not support custom dimensions")
             
-            response = await litellm.aembedding(
-                model=litellm_model,
-                input=prompt,
-                **model_config,
-                **kwargs
-            )
+            _, flight_key = self._get_request_keys(model, inputs, kwargs)
+            if flight_key:
+                embeddings = await single_flight.do(flight_key, lambda: self._embed_inputs(model, inputs, **kwargs))
+            else:
+                embeddings = await self._embed_inputs(model, inputs, **kwargs)
             
-            # 根据用户反馈的格式处理响应
-            if hasattr(response, 'data') and len(response.data) > 0:
-                # 响应格式：EmbeddingResponse(data=[{'embedding': [...], 'index': 0, 'object': 'embedding'}])
-                embedding_data = response.data[0]
-
-                if isinstance(embedding_data, dict) and 'embedding' in embedding_data:
-                    embedding = embedding_data['embedding']
-                elif hasattr(embedding_data, 'embedding'):
-                    embedding = embedding_data.embedding
-                else:
-                    # 如果embedding_data本身就是列表
-                    embedding = embedding_data if isinstance(embedding_data, list) else []
+            if truncate_to is not None and len(embeddings):
+                if truncate_to > embeddings.shape[1]:
+                    raise handle_validation_error(
+                        f"Requested {truncate_to} dimensions but model {model} returns {embeddings.shape[1]}"
+                    )
+                embeddings = truncate_dimensions(embeddings, truncate_to)
+            metrics.finish()
+            return embeddings
+        except Exception as e:
+            error = handle_litellm_error(e)
+            metrics.finish(error.status_code)
+            raise error
+        except BaseException:
+            metrics.finish(499)
+            raise
+    
+    async def _embed_inputs(self, model: str, inputs: List[str], **kwargs) -> "np.ndarray":
+        """去重、查缓存并分批调用上游"""
+        # 请求内去重，并优先使用持久化缓存
+        results: Dict[str, "np.ndarray"] = {}
+        pending = []
+        for text in dict.fromkeys(inputs):
+            cached = embedding_cache.get(model, text, kwargs)
+            if cached is not None:
+                results[text] = cached
             else:
-                embedding = []
+                pending.append(text)
+        
+        if pending:
+            semaphore = asyncio.Semaphore(settings.embedding_max_concurrency)
             
-            return EmbeddingResponse(
-                embedding=embedding
-            )
+            async def run_batch(batch: List[str]):
+                async with semaphore:
+                    embeddings = await self._embed_batch(model, batch, **kwargs)
+                results.update(zip(batch, embeddings))
+                # 整批交给缓存的后台写入，一个事务完成
+                embedding_cache.put_many(model, batch, embeddings, kwargs)
             
-        except Exception as e:
-            raise handle_litellm_error(e)
+            # 任一批次失败时取消其余批次，不再占用上游配额或写入缓存
+            try:
+                async with asyncio.TaskGroup() as group:
+                    for batch in self._split_embedding_batches(model, pending):
+                        group.create_task(run_batch(batch))
+            except BaseExceptionGroup as group_error:
+                # 与单次调用一样向上抛出首个错误，由handle_litellm_error转换
+                raise group_error.exceptions[0] from None
+        
+        if not inputs:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([results[text] for text in inputs])
+    
+    def _split_embedding_batches(self, model: str, texts: List[str]) -> List[List[str]]:
+        """按模型的批大小和批token上限切分输入"""
+        model_config = model_manager.get_model_config(model)
+        batch_size = model_config.embedding_batch_size if model_config else 1
+        max_batch_tokens = model_config.embedding_max_batch_tokens if model_config else 0
+        
+        batches = []
+        batch, batch_tokens = [], 0
+        for text in texts:
+            tokens = estimate_tokens(text)
+            if batch and (len(batch) >= batch_size or
+                          (max_batch_tokens and batch_tokens + tokens > max_batch_tokens)):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+    
+    async def _embed_batch(self, model: str, batch: List[str], **kwargs) -> "np.ndarray":
+        """单次上游嵌入调用，单条输入时按字符串发送以兼容不支持批量的提供商"""
+        # 不同后端的向量空间不同，嵌入始终使用首个后端
+        backend = backend_router.backends(model)[0]
+        litellm_model = self._get_litellm_model(backend.target)
+        model_config = self._get_model_config(backend.target)
+        provider = backend.provider
+        api_key = model_config.get("api_key", "")
+        
+        estimated_tokens = sum(estimate_tokens(text) for text in batch)
+        reserved = sent = False
+        try:
+            with circuit_breakers.guard(provider, model) as guard:
+                reserved = True
+                await rate_limiter.acquire(provider, api_key, estimated_tokens)
+                async with admission_controller.admit(provider, backend.target, PRIORITY_BULK):
+                    guard.begin()
+                    sent = True
+                    response = await litellm.aembedding(
+                        model=litellm_model,
+                        input=batch if len(batch) > 1 else batch[0],
+                        **model_config,
+                        **self._embedding_options(litellm_model, kwargs)
+                    )
+        except BaseException:
+            # 熔断、排队超时或被取消而未发出时退还预约的配额
+            if reserved and not sent:
+                rate_limiter.release(provider, api_key, estimated_tokens)
+            raise
+        usage = getattr(response, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        rate_limiter.reconcile(provider, api_key, estimated_tokens,
+                               getattr(usage, "total_tokens", None) or prompt_tokens)
+        # 各批次的输入token累计到当前请求的指标
+        metrics = current_request()
+        if metrics is not None and prompt_tokens:
+            metrics.set_usage((metrics.prompt_tokens or 0) + prompt_tokens, None)
+        
+        data = list(getattr(response, 'data', None) or [])
+        if len(data) != len(batch):
+            raise ValueError(f"Embedding provider returned {len(data)} vectors for {len(batch)} inputs")
+        
+        # 按index字段还原顺序
+        def index_of(item):
+            if isinstance(item, dict):
+                return item.get('index', 0)
+            return getattr(item, 'index', 0)
+        
+        # 向量在此转换为float32矩阵，之后缓存、合并与编码都不再逐个元素处理
+        return np.stack([self._extract_embedding(item) for item in sorted(data, key=index_of)])
+    
+    def _extract_embedding(self, embedding_data) -> "np.ndarray":
+        """从提供商返回的数据项中取出向量，转换为float32数组"""
+        if isinstance(embedding_data, dict) and 'embedding' in embedding_data:
+            return decode_vector(embedding_data['embedding'])
+        elif hasattr(embedding_data, 'embedding'):
+            return decode_vector(embedding_data.embedding)
+        # 如果embedding_data本身就是列表
+        return decode_vector(embedding_data if isinstance(embedding_data, list) else [])
     
     def get_available_models(self) -> List[str]:
         """获取可用的模型列表"""
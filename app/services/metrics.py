@@ -0,0 +1,268 @@
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+from app.services.providers import model_key, provider_key
+
+# 所有指标只在事件循环线程中更新，不需要加锁；每次记录只是一次二分查找和几次加法
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+TTFT_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 30.0)
+INTER_TOKEN_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.03, 0.05, 0.075, 0.1, 0.2, 0.5, 1.0)
+THROUGHPUT_BUCKETS = (1, 5, 10, 20, 30, 50, 75, 100, 200, 500, 1000, 5000, 20000)
+SIMILARITY_BUCKETS = (0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.92, 0.94, 0.95, 0.96, 0.97, 0.98, 0.99, 1.0)
+
+LABELS = ("endpoint", "model", "provider")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str]):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...], amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels: Tuple[str, ...], amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], buckets: Sequence[float]):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # 每个标签组合：[各桶计数..., +Inf桶计数, 总和]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        bounds = [_format_value(bound) for bound in self.buckets] + ["+Inf"]
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(bounds, series):
+                cumulative += count
+                bucket_labels = _format_labels(self.labelnames + ("le",), labels + (bound,))
+                lines.append(f"{self.name}_bucket{bucket_labels} {_format_value(cumulative)}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{label_text} {_format_value(cumulative)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Prometheus文本格式导出"""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self._metrics: List[_Metric] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = LABELS) -> Counter:
+        return self._register(Counter(self.prefix + name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = LABELS) -> Gauge:
+        return self._register(Gauge(self.prefix + name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float],
+                  labelnames: Sequence[str] = LABELS) -> Histogram:
+        return self._register(Histogram(self.prefix + name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry("ollama_adapter_")
+
+requests_total = registry.counter(
+    "requests_total", "Completed requests by HTTP status", LABELS + ("status",))
+errors_total = registry.counter(
+    "errors_total", "Failed requests by error status class", LABELS + ("status",))
+requests_in_flight = registry.gauge(
+    "requests_in_flight", "Requests currently being processed")
+request_duration = registry.histogram(
+    "request_duration_seconds", "End-to-end request latency", LATENCY_BUCKETS)
+time_to_first_token = registry.histogram(
+    "time_to_first_token_seconds", "Time from request start to the first streamed token", TTFT_BUCKETS)
+inter_token_latency = registry.histogram(
+    "inter_token_latency_seconds", "Time between consecutive streamed tokens", INTER_TOKEN_BUCKETS)
+prompt_tokens_total = registry.counter(
+    "prompt_tokens_total", "Prompt tokens processed")
+completion_tokens_total = registry.counter(
+    "completion_tokens_total", "Completion tokens generated")
+prompt_throughput = registry.histogram(
+    "prompt_tokens_per_second", "Prompt processing throughput per request", THROUGHPUT_BUCKETS)
+completion_throughput = registry.histogram(
+    "completion_tokens_per_second", "Completion generation throughput per request", THROUGHPUT_BUCKETS)
+cancelled_requests_total = registry.counter(
+    "cancelled_requests_total", "Requests abandoned by the client before completion")
+cancelled_tokens_saved_total = registry.counter(
+    "cancelled_tokens_saved_total", "Estimated completion tokens not generated because the upstream call was closed early")
+upstream_timeouts_total = registry.counter(
+    "upstream_timeouts_total", "Upstream calls abandoned after a connect, first-token, inter-token or deadline timeout",
+    LABELS + ("stage",))
+semantic_cache_lookups_total = registry.counter(
+    "semantic_cache_lookups_total", "Semantic cache lookups by result (hit, miss, error)", ("model", "result"))
+semantic_cache_similarity = registry.histogram(
+    "semantic_cache_similarity", "Best cosine similarity among cached prompts sharing the same context, per lookup",
+    SIMILARITY_BUCKETS, ("model",))
+semantic_cache_verifications_total = registry.counter(
+    "semantic_cache_verifications_total", "Sampled semantic cache hits re-checked against the upstream (correct, false_hit)",
+    ("model", "result"))
+
+
+class RequestMetrics:
+    """单个请求的计时与计数，结束时一次性写入各指标"""
+    __slots__ = ("endpoint", "model", "provider", "labels", "started", "first_token_at", "last_token_at",
+                 "prompt_tokens", "completion_tokens", "tokens_saved", "status", "finished")
+
+    def __init__(self, endpoint: str, model: str, provider: str):
+        self.endpoint = endpoint
+        # 未配置的模型名与提供商统一记为other，避免任意请求造成标签基数膨胀
+        self.model = model_key(model)
+        self.provider = provider_key(provider)
+        self.labels = (endpoint, self.model, self.provider)
+        self.started = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.last_token_at = 0.0
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.tokens_saved = 0
+        self.status = 200
+        self.finished = False
+        requests_in_flight.inc(self.labels)
+
+    def set_provider(self, provider: str):
+        """记录实际处理请求的后端提供商"""
+        provider = provider_key(provider)
+        if provider != self.provider:
+            requests_in_flight.dec(self.labels)
+            self.provider = provider
+            self.labels = (self.endpoint, self.model, provider)
+            requests_in_flight.inc(self.labels)
+
+    def on_token(self):
+        """每个流式增量调用一次；请求已结束后（如首个订阅者断开而共享流继续）不再记录"""
+        if self.finished:
+            return
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+            time_to_first_token.observe(self.labels, now - self.started)
+        else:
+            inter_token_latency.observe(self.labels, now - self.last_token_at)
+        self.last_token_at = now
+
+    def set_usage(self, prompt_tokens: Optional[int], completion_tokens: Optional[int]):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+
+    def on_upstream_timeout(self, stage: str):
+        """上游调用超时被放弃，与请求结果分开统计"""
+        upstream_timeouts_total.inc(self.labels + (stage,))
+
+    def on_upstream_cancelled(self, tokens_saved: int):
+        """上游调用被提前关闭，记录预计少生成的token数，请求以499结束时计入指标"""
+        self.tokens_saved += max(0, tokens_saved)
+
+    def finish(self, status: Optional[int] = None):
+        """请求结束时调用，重复调用无效"""
+        if self.finished:
+            return
+        self.finished = True
+        if status is not None:
+            self.status = status
+        now = time.perf_counter()
+        labels = self.labels
+        requests_in_flight.dec(labels)
+        status_labels = labels + (str(self.status),)
+        requests_total.inc(status_labels)
+        if self.status >= 400:
+            errors_total.inc(status_labels)
+            if self.status == 499:
+                cancelled_requests_total.inc(labels)
+                if self.tokens_saved:
+                    cancelled_tokens_saved_total.inc(labels, self.tokens_saved)
+            return
+        duration = now - self.started
+        request_duration.observe(labels, duration)
+
+        # 预填充吞吐按首token前的时间计算，生成吞吐按首token之后的时间计算
+        prefill_time = (self.first_token_at - self.started) if self.first_token_at else duration
+        decode_time = (now - self.first_token_at) if self.first_token_at else duration
+        if self.prompt_tokens:
+            prompt_tokens_total.inc(labels, self.prompt_tokens)
+            if prefill_time > 0:
+                prompt_throughput.observe(labels, self.prompt_tokens / prefill_time)
+        if self.completion_tokens:
+            completion_tokens_total.inc(labels, self.completion_tokens)
+            if decode_time > 0:
+                completion_throughput.observe(labels, self.completion_tokens / decode_time)
+
+
+_current: ContextVar[Optional[RequestMetrics]] = ContextVar("request_metrics", default=None)
+
+
+def track_request(endpoint: str, model: str, provider: str) -> RequestMetrics:
+    """开始记录一个请求，同一上下文中的后续调用可通过current_request()取得"""
+    metrics = RequestMetrics(endpoint, model, provider)
+    _current.set(metrics)
+    return metrics
+
+
+def current_request() -> Optional[RequestMetrics]:
+    return _current.get()
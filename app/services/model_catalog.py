@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+from app.config.settings import settings
+from app.config.model_manager import model_manager
+from app.models.ollama_models import TagsResponse, ModelInfo, RunningModelInfo
+from app.services.circuit_breaker import circuit_breakers
+from app.services.backend_router import backend_router
+
+# 按参数规模估算的/api/ps模型大小（字节）
+_PARAMETER_SIZES = [
+    ("175B", 175000000000),
+    ("100B", 100000000000),
+    ("72B", 72000000000),
+    ("70B", 70000000000),
+    ("34B", 34000000000),
+    ("32B", 32000000000),
+]
+_DEFAULT_MODEL_SIZE = 7000000000  # 默认7B
+
+
+def _dumps(content) -> bytes:
+    # 与FastAPI JSONResponse的序列化方式一致
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+
+
+class _RunningEntry:
+    """/api/ps中单个模型不随请求变化的部分，预先序列化"""
+    __slots__ = ("name", "providers", "prefix")
+
+    def __init__(self, name: str, providers: List[str], prefix: str):
+        self.name = name
+        self.providers = providers
+        self.prefix = prefix
+
+
+class ModelCatalog:
+    """预计算的/api/tags与/api/ps响应，仅在model_manager变化时重建"""
+
+    def __init__(self):
+        self._version: Optional[int] = None
+        self._tags: Tuple[bytes, str] = (b"", "")
+        self._running: List[_RunningEntry] = []
+        self.rebuilds = 0
+
+    def _refresh(self):
+        if self._version == model_manager.version:
+            return
+        self._build()
+        self._version = model_manager.version
+        self.rebuilds += 1
+
+    def _modified_at(self) -> str:
+        try:
+            mtime = os.path.getmtime(model_manager.config_path)
+        except OSError:
+            mtime = time.time()
+        return datetime.fromtimestamp(mtime).astimezone().isoformat(timespec="milliseconds")
+
+    def _build(self):
+        modified_at = self._modified_at()
+        models = []
+        running = []
+
+        for model_name in model_manager.get_available_models():
+            model_config = model_manager.get_model_config(model_name)
+            if model_config:
+                family = model_config.family
+                families = model_config.families
+                parameter_size = model_config.parameter_size
+                quantization = model_config.quantization
+            else:
+                family = "unknown"
+                families = ["unknown"]
+                parameter_size = "7B"
+                quantization = "Q4_0"
+
+            digest = hashlib.sha256(model_name.encode()).hexdigest()
+            details = {
+                "parent_model": "",
+                "format": "gguf",
+                "family": family,
+                "families": families,
+                "parameter_size": parameter_size,
+                "quantization_level": quantization
+            }
+
+            # 由digest得到稳定的模拟大小（0.5-5GB范围），各进程一致
+            display_name = model_name + ":latest" if ":" not in model_name else model_name
+            models.append(ModelInfo(
+                name=display_name,
+                model=display_name,
+                modified_at=modified_at,
+                size=int(digest[:8], 16) % 5000000000 + 500000000,
+                digest=digest,
+                details=details
+            ))
+
+            model_size = next((size for label, size in _PARAMETER_SIZES if label in parameter_size),
+                              _DEFAULT_MODEL_SIZE)
+            # 校验静态字段后去掉结尾的"}"，请求时再拼接过期时间与健康状态
+            static = RunningModelInfo(
+                name=model_name,
+                model=model_name,
+                size=model_size,
+                digest=digest,
+                details=details,
+                expires_at="",
+                size_vram=model_size
+            ).model_dump(include={"name", "model", "size", "digest", "details", "size_vram"})
+            prefix = _dumps(static).decode("utf-8")[:-1]
+            providers = [backend.provider for backend in backend_router.backends(model_name)]
+            running.append(_RunningEntry(model_name, providers, prefix))
+
+        body = _dumps(TagsResponse(models=models).model_dump())
+        self._tags = (body, make_etag(body))
+        self._running = running
+
+    def tags(self) -> Tuple[bytes, str]:
+        """返回/api/tags的(响应体, ETag)"""
+        self._refresh()
+        return self._tags
+
+    def running(self) -> Tuple[bytes, str]:
+        """返回/api/ps的(响应体, ETag)：仅列出保活时间内调用过的模型"""
+        self._refresh()
+        now = time.time()
+        parts = []
+        for entry in self._running:
+            health = circuit_breakers.model_health(entry.name, entry.providers)
+            if health is None:
+                continue
+            expires = health["last_used"] + settings.ps_keep_alive
+            if expires < now:
+                continue
+            expires_at = datetime.fromtimestamp(expires).astimezone().isoformat(timespec="milliseconds")
+            parts.append(
+                f'{entry.prefix},"expires_at":"{expires_at}","breaker_state":"{health["breaker_state"]}",'
+                f'"error_rate":{round(health["error_rate"], 4)}}}'
+            )
+        body = ('{"models":[' + ",".join(parts) + ']}').encode("utf-8")
+        return body, make_etag(body)
+
+
+# 全局模型目录实例
+model_catalog = ModelCatalog()
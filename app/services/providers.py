@@ -0,0 +1,87 @@
+from typing import FrozenSet, List, Optional, Tuple
+from app.config.settings import settings
+from app.config.model_manager import model_manager, ModelConfig
+
+# 各提供商的OpenAI兼容接口地址及对应的API密钥配置项
+PROVIDER_ENDPOINTS = {
+    "dashscope": ("https://dashscope.aliyuncs.com/compatible-mode/v1", "dashscope_api_key"),
+    "siliconflow": ("https://api.siliconflow.cn/v1", "siliconflow_api_key"),
+    "deepseek": ("https://api.deepseek.com/v1", "deepseek_api_key"),
+    "volcengine": ("https://ark.cn-beijing.volces.com/api/v3", "volcengine_api_key"),
+}
+
+# 未配置的提供商、模型与后端统一归入该名称
+OTHER = "other"
+
+
+def provider_api_base(provider: str) -> str:
+    """提供商的接口地址，可通过<PROVIDER>_API_BASE覆盖"""
+    return getattr(settings, f"{provider}_api_base", "") or PROVIDER_ENDPOINTS[provider][0]
+
+
+def backend_specs(model: str, model_config: Optional[ModelConfig]) -> List[Tuple[str, str, float]]:
+    """模型的后端列表[(提供商, 提供商侧模型名, 权重)]；未配置backends时由模型名前缀推导出唯一后端"""
+    if model_config is not None and model_config.backends:
+        return [(b["provider"], b["model"], b.get("weight", 1.0)) for b in model_config.backends]
+    provider, _, model_name = model.partition("/")
+    if not model_name:
+        return [("openai", model, 1.0)]
+    return [(provider, model_name, 1.0)]
+
+
+def backend_target(provider: str, model: str) -> str:
+    """后端的寻址名，沿用单后端"提供商/模型"的格式"""
+    return f"{provider}/{model}" if provider != "openai" else model
+
+
+class _KnownNames:
+    """当前模型目录中出现的提供商与后端，目录变化时重新计算
+
+    指标标签、熔断器与准入控制按这些名称分别保存状态。名称来自客户端请求，
+    只为已知名称单独建立条目，其余归入OTHER，条目数不超过配置的规模。
+    """
+
+    def __init__(self):
+        self._version: Optional[int] = None
+        self._providers: FrozenSet[str] = frozenset()
+        self._targets: FrozenSet[str] = frozenset()
+
+    def _refresh(self):
+        version = model_manager.version
+        if version == self._version:
+            return
+        providers = set(PROVIDER_ENDPOINTS)
+        targets = set()
+        for name in model_manager.get_available_models():
+            for provider, model, _ in backend_specs(name, model_manager.get_model_config(name)):
+                providers.add(provider)
+                targets.add(backend_target(provider, model))
+        self._providers = frozenset(providers)
+        self._targets = frozenset(targets)
+        self._version = version
+
+    def provider(self, provider: str) -> str:
+        self._refresh()
+        return provider if provider in self._providers else OTHER
+
+    def target(self, target: str) -> str:
+        self._refresh()
+        return target if target in self._targets else OTHER
+
+
+_known = _KnownNames()
+
+
+def provider_key(provider: str) -> str:
+    """提供商的状态键：PROVIDER_ENDPOINTS或模型目录中出现过的提供商保留原名，其余为OTHER"""
+    return _known.provider(provider)
+
+
+def model_key(model: str) -> str:
+    """模型的状态键：模型目录中的模型名保留原名，其余为OTHER"""
+    return model if model_manager.get_model_config(model) is not None else OTHER
+
+
+def target_key(target: str) -> str:
+    """后端寻址名的状态键：已配置模型的后端保留原名，其余为OTHER"""
+    return _known.target(target)
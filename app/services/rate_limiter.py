@@ -0,0 +1,162 @@
+import asyncio
+import hashlib
+import time
+from typing import Any, Dict, Tuple
+from app.config.settings import settings
+from app.services.shared_state import SharedSlotTable, shared_table
+
+
+class TokenBucket:
+    """令牌桶，允许透支：预约后按欠额计算需要等待的时间，保证先到先得"""
+
+    def __init__(self, per_minute: float, burst_seconds: float):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """预约amount个令牌，返回需要等待的秒数"""
+        self._refill()
+        self.tokens -= amount
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def adjust(self, delta: float):
+        """按实际用量修正已预约的令牌数，delta为正表示多用"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+    def available(self) -> float:
+        self._refill()
+        return self.tokens
+
+
+class SharedTokenBucket:
+    """状态保存在共享槽位表中的令牌桶，多个工作进程共同消耗同一份配额"""
+
+    def __init__(self, table: SharedSlotTable, key: str, per_minute: float, burst_seconds: float):
+        self.table = table
+        self.key = key
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * burst_seconds)
+
+    def _refilled(self, values) -> Tuple[float, float]:
+        # time.monotonic在Linux上是系统级时钟，各进程可比较
+        now = time.monotonic()
+        if values is None:
+            return self.capacity, now
+        tokens, updated, _ = values
+        return min(self.capacity, tokens + (now - updated) * self.rate), now
+
+    def reserve(self, amount: float) -> float:
+        def fn(values):
+            tokens, now = self._refilled(values)
+            tokens -= amount
+            return (tokens, now, 0.0), (0.0 if tokens >= 0 else -tokens / self.rate)
+        return self.table.update(self.key, fn)
+
+    def adjust(self, delta: float):
+        def fn(values):
+            tokens, now = self._refilled(values)
+            return (min(self.capacity, tokens - delta), now, 0.0), None
+        self.table.update(self.key, fn)
+
+    def available(self) -> float:
+        return self._refilled(self.table.get(self.key))[0]
+
+
+class ProviderRateLimiter:
+    """按提供商和API密钥计量的请求数/token数限速器
+
+    配额取自 settings 中的 `<provider>_rpm` / `<provider>_tpm`，乘以余量系数后
+    作为令牌补充速率，使调用稳定在配额之下而不是触发429后再退避。
+    """
+
+    def __init__(self, headroom: float, burst_seconds: float):
+        self.headroom = headroom
+        self.burst_seconds = burst_seconds
+        self._buckets: Dict[Tuple[str, str, str], Any] = {}
+        self.paced = 0
+        self.total_wait = 0.0
+
+    def _bucket(self, provider: str, key_id: str, kind: str):
+        bucket_key = (provider, key_id, kind)
+        bucket = self._buckets.get(bucket_key)
+        if bucket is None:
+            quota = getattr(settings, f"{provider}_{kind}", 0)
+            if not quota:
+                return None
+            if shared_table is not None:
+                # 多进程模式下各工作进程共享同一个桶
+                bucket = SharedTokenBucket(shared_table, f"rate:{provider}:{key_id}:{kind}",
+                                           quota * self.headroom, self.burst_seconds)
+            else:
+                bucket = TokenBucket(quota * self.headroom, self.burst_seconds)
+            self._buckets[bucket_key] = bucket
+        return bucket
+
+    def _key_id(self, api_key: str) -> str:
+        # 统计中只保留密钥摘要
+        return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8] if api_key else "default"
+
+    async def acquire(self, provider: str, api_key: str, estimated_tokens: int):
+        """按请求数和预估token数预约配额，必要时等待"""
+        key_id = self._key_id(api_key)
+        wait = 0.0
+        request_bucket = self._bucket(provider, key_id, "rpm")
+        if request_bucket is not None:
+            wait = max(wait, request_bucket.reserve(1))
+        token_bucket = self._bucket(provider, key_id, "tpm")
+        if token_bucket is not None:
+            wait = max(wait, token_bucket.reserve(estimated_tokens))
+
+        if wait > 0:
+            self.paced += 1
+            self.total_wait += wait
+            await asyncio.sleep(wait)
+
+    def reconcile(self, provider: str, api_key: str, estimated_tokens: int, actual_tokens: int):
+        """用响应中的实际usage修正token预估"""
+        if actual_tokens is None:
+            return
+        token_bucket = self._bucket(provider, self._key_id(api_key), "tpm")
+        if token_bucket is not None:
+            token_bucket.adjust(actual_tokens - estimated_tokens)
+
+    def release(self, provider: str, api_key: str, estimated_tokens: int):
+        """退还一次未发出的请求预约的请求数和token数（排队中被取消、熔断、超时等）"""
+        key_id = self._key_id(api_key)
+        request_bucket = self._bucket(provider, key_id, "rpm")
+        if request_bucket is not None:
+            request_bucket.adjust(-1)
+        token_bucket = self._bucket(provider, key_id, "tpm")
+        if token_bucket is not None:
+            token_bucket.adjust(-estimated_tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        """限速统计"""
+        buckets = {}
+        for (provider, key_id, kind), bucket in self._buckets.items():
+            buckets.setdefault(f"{provider}:{key_id}", {})[kind] = {
+                "rate_per_minute": round(bucket.rate * 60, 2),
+                "available": round(bucket.available(), 2),
+                "capacity": round(bucket.capacity, 2)
+            }
+        return {
+            "shared": shared_table is not None,
+            "paced": self.paced,
+            "total_wait": self.total_wait,
+            "buckets": buckets
+        }
+
+
+# 全局限速器实例
+rate_limiter = ProviderRateLimiter(
+    headroom=settings.rate_limit_headroom,
+    burst_seconds=settings.rate_limit_burst_seconds
+)
@@ -0,0 +1,97 @@
+import logging
+import os
+import random
+import time
+from typing import Dict
+from app.config.settings import settings
+from app.config.logging_config import request_id_var
+from app.services.metrics import current_request
+
+logger = logging.getLogger("app.access")
+
+REQUEST_ID_HEADER = b"x-request-id"
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """解析 "路径=比例,路径=比例" 形式的按路由采样配置"""
+    rates = {}
+    for item in spec.split(","):
+        path, _, rate = item.strip().partition("=")
+        if path and rate:
+            rates[path.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class RequestLogMiddleware:
+    """为每个请求分配请求ID并记录访问日志
+
+    访问日志按路由采样；慢于SLOW_REQUEST_THRESHOLD或返回5xx的请求总是记录。
+    以纯ASGI中间件实现，流式响应的耗时计算到响应体发送完毕。
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.default_rate = settings.access_log_sample_rate
+        self.rates = parse_sample_rates(settings.access_log_sample_rates)
+
+    def sample_rate(self, path: str) -> float:
+        return self.rates.get(path, self.default_rate)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get("headers", ()):
+            if name == REQUEST_ID_HEADER:
+                request_id = value.decode("latin-1")[:64]
+                break
+        if not request_id:
+            request_id = os.urandom(8).hex()
+        token = request_id_var.set(request_id)
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_request_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", ())) + [
+                    (REQUEST_ID_HEADER, request_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            self.log(scope, status, time.perf_counter() - started)
+            request_id_var.reset(token)
+
+    def log(self, scope, status: int, duration: float):
+        path = scope["path"]
+        slow = settings.slow_request_threshold > 0 and duration >= settings.slow_request_threshold
+        if status >= 500:
+            level = logging.ERROR
+        elif slow:
+            level = logging.WARNING
+        else:
+            rate = self.sample_rate(path)
+            if rate <= 0 or (rate < 1 and random.random() >= rate) or not logger.isEnabledFor(logging.INFO):
+                return
+            level = logging.INFO
+
+        fields = {
+            "method": scope["method"],
+            "path": path,
+            "status": status,
+            "duration_ms": round(duration * 1000, 2),
+        }
+        metrics = current_request()
+        if metrics is not None:
+            fields["model"] = metrics.model
+            fields["provider"] = metrics.provider
+        if slow:
+            fields["slow"] = True
+        logger.log(level, "%s %s %s", scope["method"], path, status, extra=fields)
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from app.config.settings import settings
+
+
+def make_request_key(model: str, messages: List[Dict], options: Optional[Dict[str, Any]] = None) -> str:
+    """根据(模型, 消息, 生成参数)生成规范化的请求指纹"""
+    normalized_options = {k: v for k, v in (options or {}).items() if v is not None}
+    payload = json.dumps(
+        [model, messages, normalized_options],
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CachedResponse:
+    """缓存的完整生成结果"""
+
+    __slots__ = ("content", "done_reason", "prompt_eval_count", "eval_count", "size", "expires_at")
+
+    def __init__(self, content: str, done_reason: Optional[str],
+                 prompt_eval_count: Optional[int], eval_count: Optional[int],
+                 expires_at: float):
+        self.content = content
+        self.done_reason = done_reason
+        self.prompt_eval_count = prompt_eval_count
+        self.eval_count = eval_count
+        # 以UTF-8编码后的长度近似占用字节数
+        self.size = len(content.encode("utf-8"))
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    """进程内精确匹配响应缓存（LRU + TTL）"""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """查找缓存，命中时将条目移到LRU队尾"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if entry.expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, content: str, done_reason: Optional[str] = None,
+            prompt_eval_count: Optional[int] = None, eval_count: Optional[int] = None):
+        """写入缓存，超出条目数或字节数上限时按LRU淘汰"""
+        entry = CachedResponse(
+            content=content,
+            done_reason=done_reason,
+            prompt_eval_count=prompt_eval_count,
+            eval_count=eval_count,
+            expires_at=time.monotonic() + self.ttl
+        )
+
+        # 单条结果超过总容量时不缓存
+        if entry.size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = entry
+        self._bytes += entry.size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def clear(self):
+        """清空缓存"""
+        self._entries.clear()
+        self._bytes = 0
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+# 全局响应缓存实例
+response_cache = ResponseCache(
+    max_entries=settings.response_cache_max_entries,
+    max_bytes=settings.response_cache_max_bytes,
+    ttl=settings.response_cache_ttl
+)
@@ -0,0 +1,288 @@
+import math
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+from app.config.settings import settings
+from app.config.model_manager import model_manager
+from app.services.lazy_import import numpy as np
+from app.services.response_cache import CachedResponse, make_request_key
+from app.services.metrics import (
+    semantic_cache_lookups_total, semantic_cache_similarity, semantic_cache_verifications_total
+)
+
+# 索引初始槽位数，写满后成倍扩容到SEMANTIC_CACHE_MAX_ENTRIES
+INITIAL_CAPACITY = 64
+# 与已有条目相似度达到该值视为同一提问，写入时覆盖而不是新增
+DUPLICATE_SIMILARITY = 0.999
+
+
+def normalize_prompt(text: str) -> str:
+    """归一化提问文本：统一全半角与大小写，合并空白"""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def unit_vector(vector: List[float]):
+    """转换为单位长度的float32向量，点积即余弦相似度；零向量返回None"""
+    array = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(array))
+    if not norm or not math.isfinite(norm):
+        return None
+    return array / norm
+
+
+class SemanticQuery:
+    """一次语义缓存查询：上下文指纹与最后一条用户消息的向量
+
+    上下文（模型、之前的消息、生成参数）必须完全相同，只有最后一条用户消息按语义匹配，
+    避免在不同的系统提示或对话历史之间复用回答。
+    """
+    __slots__ = ("model", "context", "text", "threshold", "vector", "hit", "slot", "similarity")
+
+    def __init__(self, model: str, context: int, text: str, threshold: float):
+        self.model = model
+        self.context = context
+        self.text = text
+        self.threshold = threshold
+        self.vector = None
+        self.hit: Optional[CachedResponse] = None
+        self.slot = -1
+        self.similarity = 0.0
+
+
+class _SemanticIndex:
+    """单个模型的向量索引
+
+    归一化后的提问向量按槽位存放在预分配的float32矩阵中，查询时一次矩阵乘法得到
+    与全部条目的余弦相似度，上下文与过期时间同样以数组按槽位保存，整个查询向量化完成。
+    """
+
+    def __init__(self, dim: int, max_entries: int, max_bytes: int):
+        self.dim = dim
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        capacity = min(INITIAL_CAPACITY, max_entries)
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.contexts = np.zeros(capacity, dtype=np.int64)
+        # 空槽位的过期时间为0、最近使用时间为inf，淘汰时不会被当作最久未用的条目
+        self.expires_at = np.zeros(capacity, dtype=np.float64)
+        self.last_used = np.full(capacity, np.inf)
+        self.entries: List[Optional[CachedResponse]] = [None] * capacity
+        # 已使用过的槽位上界，查询只扫描[0, size)
+        self.size = 0
+        self.count = 0
+        self.bytes = 0
+        self.evictions = 0
+
+    @property
+    def entry_overhead(self) -> int:
+        return self.dim * 4
+
+    def search(self, vector, context: int, now: float) -> Tuple[int, float]:
+        """同一上下文中未过期条目里相似度最高的(槽位, 相似度)，没有候选时槽位为-1"""
+        size = self.size
+        if not size:
+            return -1, 0.0
+        candidates = (self.contexts[:size] == context) & (self.expires_at[:size] > now)
+        if not candidates.any():
+            return -1, 0.0
+        scores = np.where(candidates, self.vectors[:size] @ vector, -np.inf)
+        slot = int(scores.argmax())
+        return slot, float(scores[slot])
+
+    def touch(self, slot: int, now: float):
+        self.last_used[slot] = now
+
+    def put(self, vector, context: int, entry: CachedResponse, now: float):
+        cost = entry.size + self.entry_overhead
+        if cost > self.max_bytes:
+            return
+
+        slot, similarity = self.search(vector, context, now)
+        if slot < 0 or similarity < DUPLICATE_SIMILARITY:
+            slot = self._allocate(now)
+        else:
+            self.remove(slot)
+
+        self.vectors[slot] = vector
+        self.contexts[slot] = context
+        self.expires_at[slot] = entry.expires_at
+        self.last_used[slot] = now
+        self.entries[slot] = entry
+        self.count += 1
+        self.bytes += cost
+
+        while self.bytes > self.max_bytes:
+            self._evict_lru()
+
+    def remove(self, slot: int):
+        entry = self.entries[slot]
+        if entry is None:
+            return
+        self.entries[slot] = None
+        self.expires_at[slot] = 0
+        self.last_used[slot] = np.inf
+        self.count -= 1
+        self.bytes -= entry.size + self.entry_overhead
+
+    def _allocate(self, now: float) -> int:
+        """依次使用空闲或过期的槽位、新槽位（必要时扩容）、最久未用的槽位"""
+        size = self.size
+        if size:
+            slot = int(self.expires_at[:size].argmin())
+            if self.expires_at[slot] <= now:
+                self.remove(slot)
+                return slot
+        if size == len(self.entries) and size < self.max_entries:
+            self._grow(min(size * 2, self.max_entries))
+        if size < len(self.entries):
+            self.size += 1
+            return size
+        return self._evict_lru()
+
+    def _evict_lru(self) -> int:
+        slot = int(self.last_used[:self.size].argmin())
+        self.remove(slot)
+        self.evictions += 1
+        return slot
+
+    def _grow(self, capacity: int):
+        extra = capacity - len(self.entries)
+        self.vectors = np.concatenate([self.vectors, np.zeros((extra, self.dim), dtype=np.float32)])
+        self.contexts = np.concatenate([self.contexts, np.zeros(extra, dtype=np.int64)])
+        self.expires_at = np.concatenate([self.expires_at, np.zeros(extra)])
+        self.last_used = np.concatenate([self.last_used, np.full(extra, np.inf)])
+        self.entries.extend([None] * extra)
+
+
+class SemanticCache:
+    """进程内语义响应缓存，每个模型一个向量索引（条目数与字节数有上限，LRU + TTL淘汰）"""
+
+    def __init__(self, embedding_model: str, threshold: float, max_entries: int, max_bytes: int,
+                 ttl: float, max_prompt_chars: int):
+        self.embedding_model = embedding_model
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_prompt_chars = max_prompt_chars
+        self._indexes: Dict[str, _SemanticIndex] = {}
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.verified = 0
+        self.false_hits = 0
+
+    def query(self, model: str, messages: List[Dict], options: Dict[str, Any]) -> Optional[SemanticQuery]:
+        """为请求构造查询；模型未开启语义缓存或最后一条不是用户提问时返回None"""
+        if not self.embedding_model or not messages:
+            return None
+        model_config = model_manager.get_model_config(model)
+        if model_config is None or not model_config.semantic_cache:
+            return None
+        last = messages[-1]
+        content = last.get("content")
+        if last.get("role") != "user" or not isinstance(content, str) or len(content) > self.max_prompt_chars:
+            return None
+        text = normalize_prompt(content)
+        if not text:
+            return None
+        context = int(make_request_key(model, messages[:-1], options)[:15], 16)
+        threshold = model_config.semantic_cache_threshold or self.threshold
+        return SemanticQuery(model, context, text, threshold)
+
+    def get(self, query: SemanticQuery, embedding: List[float]) -> Optional[CachedResponse]:
+        """按提问向量查找，命中时记录在query.hit中返回"""
+        query.vector = unit_vector(embedding)
+        index = self._indexes.get(query.model)
+        if query.vector is None or index is None or index.dim != len(query.vector):
+            return self._miss(query)
+
+        now = time.monotonic()
+        slot, similarity = index.search(query.vector, query.context, now)
+        if slot < 0:
+            return self._miss(query)
+        semantic_cache_similarity.observe((query.model,), min(similarity, 1.0))
+        query.similarity = similarity
+        if similarity < query.threshold:
+            return self._miss(query)
+
+        index.touch(slot, now)
+        query.slot = slot
+        query.hit = index.entries[slot]
+        self.hits += 1
+        semantic_cache_lookups_total.inc((query.model, "hit"))
+        return query.hit
+
+    def _miss(self, query: SemanticQuery) -> None:
+        self.misses += 1
+        semantic_cache_lookups_total.inc((query.model, "miss"))
+        return None
+
+    def record_error(self, query: SemanticQuery):
+        """嵌入失败或超时，请求照常发往上游"""
+        self.errors += 1
+        semantic_cache_lookups_total.inc((query.model, "error"))
+
+    def put(self, query: SemanticQuery, content: str, done_reason: Optional[str] = None,
+            prompt_eval_count: Optional[int] = None, eval_count: Optional[int] = None):
+        """把上游返回的回答写入该提问向量对应的条目"""
+        if query.vector is None or query.hit is not None:
+            return
+        index = self._indexes.get(query.model)
+        if index is None or index.dim != len(query.vector):
+            # 首次写入或嵌入模型改变了维度时重建索引
+            index = self._indexes[query.model] = _SemanticIndex(len(query.vector), self.max_entries, self.max_bytes)
+        now = time.monotonic()
+        entry = CachedResponse(content, done_reason, prompt_eval_count, eval_count, now + self.ttl)
+        index.put(query.vector, query.context, entry, now)
+
+    def record_verification(self, query: SemanticQuery, answer_similarity: float, threshold: float):
+        """抽样复核的结果：缓存回答与上游新回答相差过大时记为误命中并淘汰该条目"""
+        self.verified += 1
+        if answer_similarity >= threshold:
+            semantic_cache_verifications_total.inc((query.model, "correct"))
+            return
+        self.false_hits += 1
+        semantic_cache_verifications_total.inc((query.model, "false_hit"))
+        index = self._indexes.get(query.model)
+        # 复核期间槽位可能已被淘汰并复用
+        if index is not None and query.slot < len(index.entries) and index.entries[query.slot] is query.hit:
+            index.remove(query.slot)
+
+    def clear(self):
+        """清空缓存"""
+        self._indexes.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": bool(self.embedding_model),
+            "embedding_model": self.embedding_model,
+            "threshold": self.threshold,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "verified": self.verified,
+            "false_hits": self.false_hits,
+            "false_hit_rate": self.false_hits / self.verified if self.verified else 0.0,
+            "models": {
+                model: {"entries": index.count, "bytes": index.bytes, "dim": index.dim, "evictions": index.evictions}
+                for model, index in self._indexes.items()
+            }
+        }
+
+
+# 全局语义缓存实例
+semantic_cache = SemanticCache(
+    embedding_model=settings.semantic_cache_embedding_model,
+    threshold=settings.semantic_cache_threshold,
+    max_entries=settings.semantic_cache_max_entries,
+    max_bytes=settings.semantic_cache_max_bytes,
+    ttl=settings.semantic_cache_ttl,
+    max_prompt_chars=settings.semantic_cache_max_prompt_chars
+)
@@ -0,0 +1,115 @@
+import hashlib
+import mmap
+import os
+import struct
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+from app.config.settings import settings
+
+# 跨进程字节范围锁依赖fcntl，Windows上不可用时各进程使用本地状态
+try:
+    import fcntl
+    SHARED_STATE_AVAILABLE = True
+except ImportError:
+    fcntl = None
+    SHARED_STATE_AVAILABLE = False
+
+T = TypeVar("T")
+
+Values = Tuple[float, float, float]
+
+
+class SharedSlotTable:
+    """多个工作进程共享的定长槽位表，基于mmap文件（通常位于/dev/shm）
+
+    每个槽位保存一个键摘要和三个float64值，按键摘要开放寻址；槽位只会从空变为
+    已占用、不会释放，因此查找不需要加锁。修改时对槽位所在的字节范围加fcntl锁，
+    不同键之间互不阻塞。持锁期间不会await，事件循环中直接调用即可。
+    """
+
+    SLOT = struct.Struct("<Q3d")
+
+    def __init__(self, path: str, slots: int):
+        self.path = path
+        self.slots = slots
+        size = self.SLOT.size * slots
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        self._indexes: Dict[str, int] = {}
+
+    @staticmethod
+    def _digest(key: str) -> int:
+        # 0表示空槽位
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little") or 1
+
+    def _lock(self, index: int):
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, self.SLOT.size, index * self.SLOT.size)
+
+    def _unlock(self, index: int):
+        fcntl.lockf(self._fd, fcntl.LOCK_UN, self.SLOT.size, index * self.SLOT.size)
+
+    def _find(self, key: str, claim: bool) -> Optional[int]:
+        index = self._indexes.get(key)
+        if index is not None:
+            return index
+        digest = self._digest(key)
+        start = digest % self.slots
+        for probe in range(self.slots):
+            index = (start + probe) % self.slots
+            slot_key = self.SLOT.unpack_from(self._map, index * self.SLOT.size)[0]
+            if slot_key == 0 and claim:
+                # 加锁后再确认，其他进程可能刚刚占用了同一槽位
+                self._lock(index)
+                try:
+                    slot_key = self.SLOT.unpack_from(self._map, index * self.SLOT.size)[0]
+                    if slot_key == 0:
+                        self.SLOT.pack_into(self._map, index * self.SLOT.size, digest, 0.0, 0.0, 0.0)
+                        slot_key = digest
+                finally:
+                    self._unlock(index)
+            if slot_key == digest:
+                self._indexes[key] = index
+                return index
+            if slot_key == 0:
+                return None
+        if claim:
+            raise RuntimeError(f"共享状态表已满（{self.slots}个槽位），请增大SHARED_STATE_SLOTS")
+        return None
+
+    def get(self, key: str) -> Optional[Values]:
+        """不加锁地读取键的当前值，键不存在时返回None"""
+        index = self._find(key, claim=False)
+        if index is None:
+            return None
+        return self.SLOT.unpack_from(self._map, index * self.SLOT.size)[1:]
+
+    def update(self, key: str, fn: Callable[[Optional[Values]], Tuple[Values, T]]) -> T:
+        """在槽位锁内读取-修改-写回；fn接收当前值（新键为None），返回(新值, 结果)"""
+        index = self._find(key, claim=True)
+        offset = index * self.SLOT.size
+        self._lock(index)
+        try:
+            slot = self.SLOT.unpack_from(self._map, offset)
+            # 新占用的槽位三个值均为0且尚未写入过
+            current = slot[1:] if slot[1:] != (0.0, 0.0, 0.0) else None
+            values, result = fn(current)
+            self.SLOT.pack_into(self._map, offset, slot[0], *values)
+        finally:
+            self._unlock(index)
+        return result
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+def _open_shared_table() -> Optional[SharedSlotTable]:
+    """多进程模式下由启动器通过SHARED_STATE_PATH指定共享文件"""
+    if not settings.shared_state_path or not SHARED_STATE_AVAILABLE:
+        return None
+    return SharedSlotTable(settings.shared_state_path, settings.shared_state_slots)
+
+
+# 全局共享状态表，单进程运行时为None
+shared_table = _open_shared_table()
@@ -0,0 +1,134 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+
+class _SharedStream:
+    """一个上游流的多订阅者广播，缓存已产生的帧供后加入者回放"""
+
+    def __init__(self, source: AsyncIterator[str]):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[str]):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    def _notify(self):
+        # 唤醒当前等待者，后续等待使用新的事件
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        index = 0
+        while True:
+            changed = self._changed
+            if index < len(self.chunks):
+                chunk = self.chunks[index]
+                index += 1
+                yield chunk
+                continue
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await changed.wait()
+
+
+class SingleFlight:
+    """合并相同的并发请求，只向上游发送一次"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+        self._streams: Dict[str, _SharedStream] = {}
+        self.leaders = 0
+        self.shared = 0
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """执行非流式调用，相同key的并发调用方共享同一个结果"""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda _: self._forget_call(key, task))
+            self.leaders += 1
+        else:
+            self.shared += 1
+
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if key in self._waiters and self._calls.get(key) is task:
+                self._waiters[key] -= 1
+                # 所有调用方都已离开时取消上游调用
+                if self._waiters[key] == 0 and not task.done():
+                    task.cancel()
+
+    def _forget_call(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+            del self._waiters[key]
+        if not task.cancelled():
+            # 避免无人等待时出现未获取异常的警告
+            task.exception()
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[str]],
+                     on_shared_chunk: Optional[Callable[[str], None]] = None) -> AsyncIterator[str]:
+        """订阅流式调用，相同key的并发订阅者共享同一个上游流
+
+        上游流在首个订阅者的上下文中运行；后加入的订阅者每收到一帧（含回放的已缓冲帧）
+        调用一次on_shared_chunk，在自己的上下文中记录指标。
+        """
+        shared = self._streams.get(key)
+        if shared is None:
+            shared = _SharedStream(factory())
+            self._streams[key] = shared
+            shared.task.add_done_callback(lambda _: self._forget_stream(key, shared))
+            self.leaders += 1
+            on_shared_chunk = None
+        else:
+            self.shared += 1
+
+        shared.subscribers += 1
+        try:
+            async for chunk in shared.subscribe():
+                if on_shared_chunk is not None:
+                    on_shared_chunk(chunk)
+                yield chunk
+        finally:
+            shared.subscribers -= 1
+            if shared.subscribers == 0 and not shared.done:
+                shared.task.cancel()
+
+    def _forget_stream(self, key: str, shared: _SharedStream):
+        if self._streams.get(key) is shared:
+            del self._streams[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """合并统计信息"""
+        return {
+            "in_flight_calls": len(self._calls),
+            "in_flight_streams": len(self._streams),
+            "leaders": self.leaders,
+            "shared": self.shared
+        }
+
+
+# 全局请求合并实例
+single_flight = SingleFlight()
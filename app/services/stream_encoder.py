@@ -0,0 +1,134 @@
+import json
+import math
+import time
+from datetime import datetime
+from json.encoder import encode_basestring
+from typing import Any, Dict, List, Optional, Tuple
+from app.config.settings import settings
+from app.services.error_handler import handle_validation_error
+
+# created_at 时间戳的缓存粒度（秒）
+TIMESTAMP_RESOLUTION = 0.1
+
+# 内容增量帧的固定结尾，用于区分内容帧与结束帧
+CHUNK_SUFFIX = '},"done":false}\n'
+
+# 可在请求options中覆盖的增量合并参数
+COALESCE_MS_OPTION = "stream_coalesce_ms"
+COALESCE_BYTES_OPTION = "stream_coalesce_bytes"
+
+_timestamp_tick = None
+_timestamp_text = ""
+
+
+def coarse_timestamp() -> str:
+    """返回按TIMESTAMP_RESOLUTION缓存的ISO格式时间戳"""
+    global _timestamp_tick, _timestamp_text
+    now = time.time()
+    tick = int(now / TIMESTAMP_RESOLUTION)
+    if tick != _timestamp_tick:
+        _timestamp_tick = tick
+        _timestamp_text = datetime.fromtimestamp(now).isoformat()
+    return _timestamp_text
+
+
+def _parse_coalesce_option(name: str, value) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise handle_validation_error(f"Invalid {name}: {value!r}")
+    if not math.isfinite(value) or value < 0:
+        raise handle_validation_error(f"Invalid {name}: {value!r}")
+    return value
+
+
+def pop_coalesce_options(options: Dict) -> Tuple[float, int]:
+    """取出options中的增量合并参数（不传给上游），返回(coalesce_ms, coalesce_bytes)
+
+    未指定时使用STREAM_COALESCE_MS / STREAM_COALESCE_BYTES；不是非负数时返回422，
+    在请求发往上游之前失败。
+    """
+    coalesce_ms = options.pop(COALESCE_MS_OPTION, None)
+    coalesce_bytes = options.pop(COALESCE_BYTES_OPTION, None)
+    coalesce_ms = (settings.stream_coalesce_ms if coalesce_ms is None
+                   else _parse_coalesce_option(COALESCE_MS_OPTION, coalesce_ms))
+    coalesce_bytes = (settings.stream_coalesce_bytes if coalesce_bytes is None
+                      else int(_parse_coalesce_option(COALESCE_BYTES_OPTION, coalesce_bytes)))
+    return coalesce_ms, coalesce_bytes
+
+
+class NDJSONStreamEncoder:
+    """Ollama流式响应编码器
+
+    预先渲染帧中不变的部分，每个增量只需转义content；可选地把多个增量
+    合并为一帧（按时间窗口或字节数），减少帧数和写操作。
+    """
+
+    def __init__(self, model: str, coalesce_ms: float = 0, coalesce_bytes: int = 0):
+        self.model = model
+        self.coalesce_ms = coalesce_ms or 0
+        self.coalesce_bytes = coalesce_bytes or 0
+        self._prefix = '{"model":' + encode_basestring(model) + ',"created_at":"'
+        self._content_prefix = '","message":{"role":"assistant","content":'
+        self._chunk_suffix = CHUNK_SUFFIX
+        self._buffer: List[str] = []
+        self._buffered_size = 0
+        self._buffer_started = 0.0
+
+    @property
+    def coalescing(self) -> bool:
+        return self.coalesce_ms > 0 or self.coalesce_bytes > 0
+
+    def encode_chunk(self, content: str) -> str:
+        """编码一个内容增量帧"""
+        return (self._prefix + coarse_timestamp() + self._content_prefix +
+                encode_basestring(content) + self._chunk_suffix)
+
+    def feed(self, content: str) -> Optional[str]:
+        """输入一个增量，返回需要立即发送的帧；合并窗口未满时返回None"""
+        if not self.coalescing:
+            return self.encode_chunk(content)
+
+        if not self._buffer:
+            self._buffer_started = time.monotonic()
+        self._buffer.append(content)
+        # 以字符数近似字节数，避免逐块编码
+        self._buffered_size += len(content)
+
+        if self.coalesce_bytes and self._buffered_size >= self.coalesce_bytes:
+            return self.flush()
+        if self.coalesce_ms and (time.monotonic() - self._buffer_started) * 1000 >= self.coalesce_ms:
+            return self.flush()
+        return None
+
+    def flush_delay(self) -> Optional[float]:
+        """距合并窗口按时间到期的秒数；窗口为空或未按时间合并时为None
+
+        上游长时间不返回下一个增量时，调用方应在此时刻调用flush()，不等到下一个增量到达。
+        """
+        if not self._buffer or not self.coalesce_ms:
+            return None
+        return max(0.0, self._buffer_started + self.coalesce_ms / 1000 - time.monotonic())
+
+    def flush(self) -> Optional[str]:
+        """输出合并窗口中剩余的内容"""
+        if not self._buffer:
+            return None
+        content = "".join(self._buffer)
+        self._buffer.clear()
+        self._buffered_size = 0
+        return self.encode_chunk(content)
+
+    def encode_done(self, done_reason: Optional[str] = None, **fields: Any) -> str:
+        """编码结束帧，fields中非空的字段会附加到帧中"""
+        final_response = {
+            "model": self.model,
+            "created_at": coarse_timestamp(),
+            "message": {
+                "role": "assistant",
+                "content": ""
+            },
+            "done": True
+        }
+        if done_reason:
+            final_response["done_reason"] = done_reason
+        final_response.update({k: v for k, v in fields.items() if v is not None})
+        return json.dumps(final_response, ensure_ascii=False) + "\n"
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+from app.config.settings import settings
+from app.config.model_manager import model_manager
+from app.services.lazy_import import litellm, openai
+from app.services.http_pool import upstream_pool
+from app.services.model_catalog import model_catalog
+
+logger = logging.getLogger(__name__)
+
+
+class StartupWarmup:
+    """启动预热：在后台导入重型模块、加载模型目录并预先建立上游连接
+
+    进程启动后立即开始接受连接（存活检查可用），预热完成后 /api/ready 才返回200，
+    负载均衡据此决定何时把流量切到新实例。单个提供商预热失败不影响就绪。
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.duration: Optional[float] = None
+        self.steps: Dict[str, float] = {}
+        self.upstreams: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def _step(self, name: str, coro):
+        started = time.monotonic()
+        result = await coro
+        self.steps[name] = round((time.monotonic() - started) * 1000, 1)
+        return result
+
+    async def _load_catalog(self):
+        # 只有配置文件读取在线程池中进行；模型目录的缓存与请求处理共享，在事件循环中构建
+        await model_manager.load_async()
+        model_catalog.tags()
+
+    async def _prewarm(self, api_base: str):
+        try:
+            self.upstreams[api_base] = await upstream_pool.prewarm(api_base, settings.upstream_prewarm_timeout)
+        except Exception as e:
+            # 提供商暂时不可达时照常就绪，首个请求再建立连接
+            self.upstreams[api_base] = {"error": str(e) or type(e).__name__}
+            logger.warning("Failed to prewarm %s: %s", api_base, e)
+
+    async def run(self, api_bases: List[str]):
+        self.started_at = time.monotonic()
+        try:
+            # 导入在线程池中进行，期间事件循环仍可响应存活检查
+            await self._step("imports", asyncio.to_thread(lambda: (litellm.load(), openai.load())))
+            await self._step("model_catalog", self._load_catalog())
+            if settings.upstream_prewarm and api_bases:
+                await self._step("upstreams", asyncio.gather(*(self._prewarm(api_base) for api_base in api_bases)))
+        except Exception as e:
+            self.error = str(e)
+            logger.exception("Startup warmup failed: %s", e)
+            return
+        self.duration = time.monotonic() - self.started_at
+        self.ready = True
+        logger.info("Warmup finished in %.0f ms (%d models, %d upstreams)",
+                    self.duration * 1000, len(model_manager.get_available_models()), len(self.upstreams))
+
+    def start(self, api_bases: List[str]):
+        """在后台开始预热"""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run(api_bases))
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "error": self.error,
+            "duration_ms": round(self.duration * 1000, 1) if self.duration is not None else None,
+            "steps": self.steps,
+            "upstreams": self.upstreams
+        }
+
+
+# 全局启动预热实例
+startup_warmup = StartupWarmup()
@@ -0,0 +1,138 @@
+"""/api/tags 与 /api/ps 响应生成耗时对比
+
+对比逐次构建（原实现：每个模型计算SHA-256、格式化时间并经pydantic校验、
+FastAPI序列化）与预计算响应（model_catalog）的单次调用耗时。
+
+用法：
+    python benchmarks/bench_catalog.py [--models 500] [--number 200]
+"""
+import argparse
+import hashlib
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse, Response  # noqa: E402
+from app.config.model_manager import model_manager  # noqa: E402
+from app.models.ollama_models import TagsResponse, ModelInfo, RunningModelsResponse, RunningModelInfo  # noqa: E402
+from app.services.circuit_breaker import circuit_breakers  # noqa: E402
+from app.services.model_catalog import model_catalog  # noqa: E402
+
+
+def legacy_tags() -> Response:
+    """原/api/tags实现"""
+    models = []
+    for model_name in model_manager.get_available_models():
+        model_size = hash(model_name) % 5000000000 + 500000000
+        digest = hashlib.sha256(model_name.encode()).hexdigest()
+        days_ago = hash(model_name) % 30 + 1
+        modified_at = (datetime.now() - timedelta(days=days_ago)).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "-07:00"
+        model_config = model_manager.get_model_config(model_name)
+        display_name = model_name + ":latest" if ":" not in model_name else model_name
+        models.append(ModelInfo(
+            name=display_name,
+            model=display_name,
+            modified_at=modified_at,
+            size=model_size,
+            digest=digest,
+            details={
+                "parent_model": "",
+                "format": "gguf",
+                "family": model_config.family,
+                "families": model_config.families,
+                "parameter_size": model_config.parameter_size,
+                "quantization_level": model_config.quantization
+            }
+        ))
+    return JSONResponse(jsonable_encoder(TagsResponse(models=models)))
+
+
+def legacy_ps() -> Response:
+    """原/api/ps实现"""
+    running_models = []
+    for model_name in model_manager.get_available_models():
+        model_config = model_manager.get_model_config(model_name)
+        param_size = model_config.parameter_size
+        if "175B" in param_size:
+            model_size = 175000000000
+        elif "100B" in param_size:
+            model_size = 100000000000
+        elif "72B" in param_size:
+            model_size = 72000000000
+        elif "70B" in param_size:
+            model_size = 70000000000
+        elif "34B" in param_size:
+            model_size = 34000000000
+        elif "32B" in param_size:
+            model_size = 32000000000
+        else:
+            model_size = 7000000000
+        digest = hashlib.sha256(model_name.encode()).hexdigest()[:64]
+        expires_at = (datetime.now() + timedelta(minutes=5)).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "-07:00"
+        running_models.append(RunningModelInfo(
+            name=model_name,
+            model=model_name,
+            size=model_size,
+            digest=digest,
+            details={
+                "parent_model": "",
+                "format": "gguf",
+                "family": model_config.family,
+                "families": model_config.families,
+                "parameter_size": model_config.parameter_size,
+                "quantization_level": model_config.quantization
+            },
+            expires_at=expires_at,
+            size_vram=model_size
+        ))
+    return JSONResponse(jsonable_encoder(RunningModelsResponse(models=running_models)))
+
+
+def precomputed_tags() -> Response:
+    body, etag = model_catalog.tags()
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+
+def precomputed_ps() -> Response:
+    body, etag = model_catalog.running()
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+
+def not_modified() -> Response:
+    _, etag = model_catalog.tags()
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--models", type=int, default=500, help="目录中的模型总数（不足时补充合成模型）")
+    parser.add_argument("--number", type=int, default=200, help="每项计时的调用次数")
+    args = parser.parse_args()
+
+    for i in range(len(model_manager.get_available_models()), args.models):
+        model_manager.add_model(f"siliconflow/bench-model-{i}", {
+            "provider": "siliconflow", "family": "qwen2", "families": ["qwen2"], "parameter_size": "7B"
+        })
+    # 让/api/ps列出全部模型，与原实现的条目数一致
+    for model_name in model_manager.get_available_models():
+        circuit_breakers.model_window(model_name).add(False)
+
+    print(f"models: {len(model_manager.get_available_models())}, calls per case: {args.number}")
+    cases = [
+        ("/api/tags", legacy_tags, precomputed_tags),
+        ("/api/ps", legacy_ps, precomputed_ps),
+        ("/api/tags (304)", legacy_tags, not_modified),
+    ]
+    for name, legacy, precomputed in cases:
+        precomputed()
+        legacy_ms = timeit.timeit(legacy, number=args.number) / args.number * 1000
+        new_ms = timeit.timeit(precomputed, number=args.number) / args.number * 1000
+        print(f"{name:<18} legacy {legacy_ms:8.3f} ms   precomputed {new_ms:8.3f} ms   speedup {legacy_ms / new_ms:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
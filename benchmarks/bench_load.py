@@ -0,0 +1,380 @@
+"""端到端负载基准测试
+
+启动本地模拟提供商（fake_provider.py）和适配器，按给定并发驱动 /api/generate、
+/api/chat（流式与非流式）、/api/embed 与 /api/tags，输出吞吐、p50/p95/p99延迟、
+首token延迟、适配器开销（端到端延迟减去模拟提供商的服务耗时）与每请求CPU时间。
+
+结果可用 --json 保存，之后以 --compare 对比，任一场景的p50/p95或吞吐退化超过
+--max-regression 时以非零状态退出，便于在CI中做回归检查。
+
+用法：
+    python benchmarks/bench_load.py [--concurrency 16] [--requests 200]
+        [--scenarios chat,chat_stream,generate,generate_stream,embed,tags]
+        [--latency 0.05] [--token-rate 200] [--tokens 64] [--error-rate 0]
+        [--json result.json] [--compare baseline.json] [--max-regression 0.1]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+CHAT_MODEL = "siliconflow/Yi-34B-Chat"
+EMBED_MODEL = "siliconflow/text-embedding-ada-002"
+SCENARIOS = ("generate", "generate_stream", "chat", "chat_stream", "embed", "tags")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """最近秩百分位，values需已排序"""
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(p / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def _proc_stat(pid: int) -> Optional[List[str]]:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # 第3个字段起，进程名可能包含空格
+            return f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+
+
+def process_cpu_seconds(pid: int) -> Optional[float]:
+    """从/proc读取进程及其所有子进程（含已回收的）的用户态+内核态CPU时间，非Linux时返回None"""
+    fields = _proc_stat(pid)
+    if fields is None:
+        return None
+    # utime、stime、cutime、cstime分别是第14-17个字段
+    ticks = sum(int(value) for value in fields[11:15])
+    # 多进程模式下工作进程仍在运行，需逐个累加
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            child = _proc_stat(int(entry))
+            if child is not None and child[1] == str(pid):
+                ticks += sum(int(value) for value in child[11:15])
+    return ticks / os.sysconf("SC_CLK_TCK")
+
+
+def request_for(scenario: str, index: int, args) -> Dict:
+    """构造第index个请求；每个请求内容不同，避免命中缓存或请求合并"""
+    options = {"max_tokens": args.tokens}
+    if scenario.startswith("generate"):
+        return {"method": "POST", "url": "/api/generate", "json": {
+            "model": args.model, "prompt": f"benchmark prompt {index}",
+            "stream": scenario.endswith("_stream"), "options": options}}
+    if scenario.startswith("chat"):
+        return {"method": "POST", "url": "/api/chat", "json": {
+            "model": args.model,
+            "messages": [{"role": "system", "content": "You are a benchmark."},
+                         {"role": "user", "content": f"benchmark message {index}"}],
+            "stream": scenario.endswith("_stream"), "options": options}}
+    if scenario == "embed":
+        return {"method": "POST", "url": "/api/embed", "json": {
+            "model": args.embed_model,
+            "input": [f"benchmark text {index} {i}" for i in range(args.embed_batch)]}}
+    return {"method": "GET", "url": "/api/tags"}
+
+
+async def send(client: httpx.AsyncClient, request: Dict, stream: bool):
+    """发送一个请求，返回(是否成功, 总延迟, 首token延迟)"""
+    started = time.perf_counter()
+    if not stream:
+        response = await client.request(**request)
+        return response.status_code == 200, time.perf_counter() - started, None
+
+    first_token = None
+    ok = False
+    async with client.stream(**request) as response:
+        if response.status_code != 200:
+            await response.aread()
+            return False, time.perf_counter() - started, None
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            frame = json.loads(line)
+            if "error" in frame:
+                break
+            if first_token is None and frame.get("message", {}).get("content"):
+                first_token = time.perf_counter() - started
+            if frame.get("done"):
+                ok = True
+    return ok, time.perf_counter() - started, first_token
+
+
+async def run_scenario(client: httpx.AsyncClient, provider: httpx.AsyncClient, scenario: str,
+                       adapter_pid: Optional[int], args) -> Dict:
+    stream = scenario.endswith("_stream")
+
+    # 预热连接与各级缓存的预计算部分
+    for index in range(min(args.warmup, args.requests)):
+        await send(client, request_for(scenario, -1 - index, args), stream)
+
+    await provider.post("/stats/reset")
+    cpu_before = process_cpu_seconds(adapter_pid) if adapter_pid else None
+    latencies: List[float] = []
+    ttfts: List[float] = []
+    errors = 0
+    indices = iter(range(args.requests))
+
+    async def worker():
+        nonlocal errors
+        for index in indices:
+            try:
+                ok, latency, ttft = await send(client, request_for(scenario, index, args), stream)
+            except httpx.HTTPError:
+                ok, latency, ttft = False, 0.0, None
+            if not ok:
+                errors += 1
+                continue
+            latencies.append(latency)
+            if ttft is not None:
+                ttfts.append(ttft)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    cpu_after = process_cpu_seconds(adapter_pid) if adapter_pid else None
+    provider_stats = (await provider.get("/stats")).json()
+
+    latencies.sort()
+    ttfts.sort()
+    upstream_requests = provider_stats["requests"]
+    # 每个成功请求平均对应的上游服务时间（embed一次请求可能对应多个批次，重试也会计入）
+    provider_ms = (provider_stats["service_seconds"] / len(latencies) * 1000) if latencies else 0.0
+    mean = (sum(latencies) / len(latencies)) if latencies else None
+
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        "requests": args.requests,
+        "errors": errors,
+        "upstream_requests": upstream_requests,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "latency_ms": {"mean": ms(mean),
+                       "p50": ms(percentile(latencies, 50)),
+                       "p95": ms(percentile(latencies, 95)),
+                       "p99": ms(percentile(latencies, 99))},
+        "ttft_ms": {"p50": ms(percentile(ttfts, 50)),
+                    "p95": ms(percentile(ttfts, 95)),
+                    "p99": ms(percentile(ttfts, 99))} if stream else None,
+        "provider_ms": round(provider_ms, 3),
+        "overhead_ms": round(mean * 1000 - provider_ms, 3) if mean is not None else None,
+        "cpu_ms_per_request": (round((cpu_after - cpu_before) / args.requests * 1000, 3)
+                               if cpu_before is not None and cpu_after is not None else None)
+    }
+
+
+def start_process(command: List[str], env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(command, cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_ready(url: str, process: Optional[subprocess.Popen], timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"进程提前退出（退出码 {process.returncode}）: {url}")
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"等待服务启动超时: {url}")
+
+
+async def wait_workers(url: str, workers: int, timeout: float = 60.0):
+    """等待所有工作进程都能处理请求（每次新建连接，由内核分配到不同进程）"""
+    deadline = time.monotonic() + timeout
+    pids = set()
+    while time.monotonic() < deadline and len(pids) < workers:
+        async with httpx.AsyncClient() as client:
+            try:
+                pids.add((await client.get(url + "/api/stats")).json()["process"]["pid"])
+            except (httpx.HTTPError, KeyError, ValueError):
+                await asyncio.sleep(0.1)
+    if len(pids) < workers:
+        raise RuntimeError(f"{timeout}秒内只有{len(pids)}个工作进程就绪")
+
+
+def format_table(results: Dict[str, Dict]) -> str:
+    header = (f"{'scenario':<16}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'ttft50':>9}"
+              f"{'ovh':>8}{'cpu':>8}{'err':>6}")
+    lines = [header, "-" * len(header)]
+    for name, result in results.items():
+        latency = result["latency_ms"]
+        ttft = (result["ttft_ms"] or {}).get("p50")
+
+        def cell(value, width):
+            return f"{value:>{width}.1f}" if value is not None else f"{'-':>{width}}"
+
+        lines.append(f"{name:<16}{cell(result['throughput_rps'], 9)}{cell(latency['p50'], 9)}"
+                     f"{cell(latency['p95'], 9)}{cell(latency['p99'], 9)}{cell(ttft, 9)}"
+                     f"{cell(result['overhead_ms'], 8)}{cell(result['cpu_ms_per_request'], 8)}"
+                     f"{result['errors']:>6}")
+    lines.append("延迟单位为ms；ovh为适配器开销（平均延迟减去上游服务耗时），cpu为每请求适配器CPU时间")
+    return "\n".join(lines)
+
+
+def compare(results: Dict[str, Dict], baseline_path: str, max_regression: float) -> bool:
+    """与基线对比，返回是否存在超过阈值的退化"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    regressed = False
+    print(f"\n与基线 {baseline_path} 对比（阈值 {max_regression:.0%}）：")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        checks = [
+            ("p50", base["latency_ms"]["p50"], result["latency_ms"]["p50"], False),
+            ("p95", base["latency_ms"]["p95"], result["latency_ms"]["p95"], False),
+            ("rps", base["throughput_rps"], result["throughput_rps"], True),
+        ]
+        for metric, before, after, higher_is_better in checks:
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            worse = -change if higher_is_better else change
+            flag = "  <-- 退化" if worse > max_regression else ""
+            regressed = regressed or bool(flag)
+            print(f"  {name:<16}{metric:<5}{before:>10.2f} -> {after:>10.2f} ({change:+.1%}){flag}")
+    return regressed
+
+
+async def run(args) -> Dict:
+    provider_port = args.provider_port or free_port()
+    provider_url = f"http://127.0.0.1:{provider_port}"
+    processes = []
+    env = dict(os.environ)
+    try:
+        processes.append(start_process([
+            sys.executable, os.path.join("benchmarks", "fake_provider.py"),
+            "--port", str(provider_port), "--latency", str(args.latency),
+            "--token-rate", str(args.token_rate), "--tokens", str(args.tokens),
+            "--error-rate", str(args.error_rate), "--error-status", str(args.error_status),
+            "--embedding-latency", str(args.embedding_latency), "--embedding-dim", str(args.embedding_dim)
+        ], env))
+        await wait_ready(provider_url + "/stats", processes[-1])
+
+        adapter_pid = None
+        if args.adapter_url:
+            adapter_url = args.adapter_url.rstrip("/")
+        else:
+            adapter_port = free_port()
+            adapter_url = f"http://127.0.0.1:{adapter_port}"
+            env.update({
+                "SILICONFLOW_API_BASE": provider_url + "/v1",
+                "SILICONFLOW_API_KEY": "benchmark",
+                "SILICONFLOW_RPM": "0",
+                "SILICONFLOW_TPM": "0",
+            })
+            if args.workers:
+                command = [sys.executable, "-m", "app.server", "--workers", str(args.workers),
+                           "--host", "127.0.0.1", "--port", str(adapter_port)]
+                env["LOG_LEVEL"] = "WARNING"
+            else:
+                command = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+                           "--port", str(adapter_port), "--log-level", "warning", "--no-access-log"]
+            processes.append(start_process(command, env))
+            adapter_pid = processes[-1].pid
+        await wait_ready(adapter_url + "/api/ready", processes[-1] if not args.adapter_url else None)
+        if args.workers > 1:
+            await wait_workers(adapter_url, args.workers)
+
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        results = {}
+        async with httpx.AsyncClient(base_url=adapter_url, limits=limits, timeout=args.timeout) as client, \
+                httpx.AsyncClient(base_url=provider_url) as provider:
+            for scenario in args.scenarios:
+                results[scenario] = await run_scenario(client, provider, scenario, adapter_pid, args)
+        return results
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def build_parser(description: str = __doc__) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"逗号分隔的场景，可选 {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="每个场景的请求数")
+    parser.add_argument("--warmup", type=int, default=10, help="每个场景的预热请求数")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--model", default=CHAT_MODEL)
+    parser.add_argument("--embed-model", default=EMBED_MODEL)
+    parser.add_argument("--embed-batch", type=int, default=8, help="每个/api/embed请求的输入条数")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="通过python -m app.server以多个工作进程启动适配器，0表示单个uvicorn进程")
+    parser.add_argument("--adapter-url", help="测试已运行的适配器（需已指向模拟提供商），此时不统计CPU")
+    parser.add_argument("--provider-port", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟提供商首token延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="模拟提供商每秒生成token数")
+    parser.add_argument("--tokens", type=int, default=64, help="每次生成的token数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟提供商注入错误的比例")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--embedding-latency", type=float, default=0.01)
+    parser.add_argument("--embedding-dim", type=int, default=1024)
+    parser.add_argument("--json", help="将结果写入JSON文件")
+    parser.add_argument("--compare", help="与之前保存的JSON结果对比")
+    parser.add_argument("--max-regression", type=float, default=0.1, help="允许的退化比例")
+    return parser
+
+
+def parse_args(parser: argparse.ArgumentParser):
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"未知场景: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main():
+    args = parse_args(build_parser())
+
+    results = asyncio.run(run(args))
+    print(format_table(results))
+
+    if args.json:
+        output = {
+            "config": {key: value for key, value in vars(args).items() if key not in ("json", "compare")},
+            "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                            "cpus": os.cpu_count()},
+            "results": results
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(output, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.json}")
+
+    if args.compare and compare(results, args.compare, args.max_regression):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
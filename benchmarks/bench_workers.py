@@ -0,0 +1,79 @@
+"""多进程扩展性基准测试
+
+依次以1、2、4…个工作进程（python -m app.server）启动适配器，用与 bench_load.py
+相同的模拟提供商和负载驱动各场景，输出吞吐随工作进程数的变化及扩展效率
+（N个进程的吞吐 / (单进程吞吐 × N)）。
+
+压测客户端本身是单个进程，"client_cpu" 接近100%时结果受客户端限制，
+应减少场景或改用多台压测机。
+
+用法：
+    python benchmarks/bench_workers.py [--worker-counts 1,2,4,8] [--scenarios chat,tags]
+        [--concurrency 64] [--requests 1000] [--json scaling.json]
+"""
+import asyncio
+import json
+import os
+import time
+
+from bench_load import build_parser, parse_args, run
+
+
+def default_worker_counts() -> str:
+    counts = [1]
+    cpus = os.cpu_count() or 1
+    while counts[-1] * 2 <= cpus:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cpus:
+        counts.append(cpus)
+    return ",".join(str(count) for count in counts)
+
+
+def main():
+    parser = build_parser(__doc__)
+    parser.add_argument("--worker-counts", default=default_worker_counts(),
+                        help="逗号分隔的工作进程数，默认从1倍增到CPU核数")
+    parser.set_defaults(scenarios="chat,tags", concurrency=64, requests=1000,
+                        latency=0.02, token_rate=0.0, tokens=16)
+    args = parse_args(parser)
+    counts = [int(count) for count in args.worker_counts.split(",")]
+
+    runs = {}
+    for workers in counts:
+        args.workers = workers
+        cpu_before = time.process_time()
+        started = time.perf_counter()
+        results = asyncio.run(run(args))
+        client_cpu = (time.process_time() - cpu_before) / (time.perf_counter() - started)
+        runs[workers] = {"client_cpu": round(client_cpu, 3), "results": results}
+
+    baseline = runs[counts[0]]["results"]
+    header = f"{'scenario':<16}{'workers':>8}{'rps':>10}{'p50':>9}{'p99':>9}{'scaling':>9}{'eff':>7}{'client':>8}"
+    print(header)
+    print("-" * len(header))
+    for scenario in args.scenarios:
+        base_rps = baseline[scenario]["throughput_rps"] or 0
+        for workers in counts:
+            result = runs[workers]["results"][scenario]
+            rps = result["throughput_rps"] or 0
+            scaling = rps / base_rps if base_rps else 0.0
+            result["scaling"] = round(scaling, 3)
+            result["efficiency"] = round(scaling / (workers / counts[0]), 3)
+            print(f"{scenario:<16}{workers:>8}{rps:>10.1f}{result['latency_ms']['p50']:>9.1f}"
+                  f"{result['latency_ms']['p99']:>9.1f}{scaling:>9.2f}{result['efficiency']:>7.0%}"
+                  f"{runs[workers]['client_cpu']:>8.0%}")
+    print(f"CPU核数: {os.cpu_count()}；延迟单位为ms，client为压测客户端CPU占用")
+
+    if args.json:
+        output = {
+            "config": {key: value for key, value in vars(args).items() if key not in ("json", "compare")},
+            "cpus": os.cpu_count(),
+            "runs": {str(workers): run_result for workers, run_result in runs.items()}
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(output, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""本地模拟的OpenAI兼容提供商，供负载基准测试使用
+
+支持 /v1/chat/completions（流式与非流式）与 /v1/embeddings，可配置首token延迟、
+生成速率、输出长度与错误注入；/stats 返回累计的服务耗时，用于从端到端延迟中
+扣除上游时间、得到适配器自身的开销。
+
+用法：
+    python benchmarks/fake_provider.py [--port 18000] [--latency 0.05] [--token-rate 100]
+        [--tokens 64] [--error-rate 0] [--error-status 503] [--stall-after -1]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import random
+import struct
+import time
+import uuid
+import zlib
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def embed_text(text: str, dim: int):
+    """词袋哈希向量：措辞相近的文本得到相近的向量，便于测试语义缓存"""
+    vector = [0.001 * (i % 997) for i in range(dim)]
+    for word in text.lower().split():
+        vector[zlib.crc32(word.encode("utf-8")) % dim] += 1.0
+    return vector
+
+
+def encode_embedding(vector, encoding_format: str):
+    """与OpenAI一致：encoding_format为base64时返回小端float32的base64字符串"""
+    if encoding_format == "base64":
+        return base64.b64encode(struct.pack(f"<{len(vector)}f", *vector)).decode("ascii")
+    return vector
+
+
+class ProviderConfig:
+    """模拟提供商的行为参数"""
+
+    def __init__(self, latency: float = 0.05, token_rate: float = 100.0, tokens: int = 64,
+                 error_rate: float = 0.0, error_status: int = 503, stall_after: int = -1,
+                 embedding_latency: float = 0.01, embedding_dim: int = 1024):
+        self.latency = latency  # 首token延迟（秒）
+        self.token_rate = token_rate  # 每秒生成的token数，0表示不限
+        self.tokens = tokens  # 每次生成的token数（max_tokens更小时以其为准）
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stall_after = stall_after  # 生成该数量的token后不再输出，模拟挂起的上游；-1表示不挂起
+        self.embedding_latency = embedding_latency
+        self.embedding_dim = embedding_dim
+
+
+class ProviderStats:
+    """累计的请求数、注入错误数、服务耗时，以及生成的token数与被客户端中断的请求数"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.errors = 0
+        self.service_seconds = 0.0
+        self.tokens_generated = 0
+        self.cancelled = 0
+
+    def to_dict(self):
+        return {"requests": self.requests, "errors": self.errors, "service_seconds": self.service_seconds,
+                "tokens_generated": self.tokens_generated, "cancelled": self.cancelled}
+
+
+def create_app(config: ProviderConfig) -> FastAPI:
+    app = FastAPI()
+    stats = ProviderStats()
+
+    def inject_error():
+        if config.error_rate and random.random() < config.error_rate:
+            stats.errors += 1
+            return JSONResponse(
+                status_code=config.error_status,
+                content={"error": {"message": "injected error", "type": "server_error"}}
+            )
+        return None
+
+    async def generate_tokens(count: int):
+        try:
+            await asyncio.sleep(config.latency)
+            for index in range(count):
+                if index == config.stall_after:
+                    await asyncio.Event().wait()
+                if index and config.token_rate:
+                    await asyncio.sleep(1 / config.token_rate)
+                stats.tokens_generated += 1
+                yield f"tok{index} "
+        except asyncio.CancelledError:
+            # 调用方断开连接，剩余的token不再生成
+            stats.cancelled += 1
+            raise
+
+    async def collect_tokens(count: int) -> str:
+        return "".join([token async for token in generate_tokens(count)])
+
+    async def wait_disconnect(request: Request):
+        while (await request.receive())["type"] != "http.disconnect":
+            pass
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        started = time.perf_counter()
+        stats.requests += 1
+        body = await request.json()
+        error = inject_error()
+        if error is not None:
+            stats.service_seconds += time.perf_counter() - started
+            return error
+
+        model = body.get("model", "fake")
+        count = min(config.tokens, body.get("max_tokens") or config.tokens)
+        prompt_tokens = sum(len(str(message.get("content") or "")) // 4 + 1 for message in body.get("messages", []))
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": count,
+                 "total_tokens": prompt_tokens + count}
+        completion_id = "chatcmpl-" + uuid.uuid4().hex
+        created = int(time.time())
+
+        if not body.get("stream"):
+            # 与真实提供商一样，调用方断开连接后停止生成
+            generation = asyncio.ensure_future(collect_tokens(count))
+            disconnect = asyncio.ensure_future(wait_disconnect(request))
+            await asyncio.wait((generation, disconnect), return_when=asyncio.FIRST_COMPLETED)
+            disconnect.cancel()
+            stats.service_seconds += time.perf_counter() - started
+            if not generation.done():
+                generation.cancel()
+                return JSONResponse(status_code=499, content={"error": {"message": "client disconnected"}})
+            content = generation.result()
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": usage
+            }
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        def event(choices, **extra):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                     "model": model, "choices": choices, **extra}
+            return "data: " + json.dumps(chunk) + "\n\n"
+
+        async def events():
+            try:
+                async for token in generate_tokens(count):
+                    yield event([{"index": 0, "delta": {"content": token}, "finish_reason": None}])
+                yield event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+                if include_usage:
+                    yield event([], usage=usage)
+                yield "data: [DONE]\n\n"
+            finally:
+                stats.service_seconds += time.perf_counter() - started
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        started = time.perf_counter()
+        stats.requests += 1
+        body = await request.json()
+        error = inject_error()
+        if error is None:
+            inputs = body.get("input")
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            encoding_format = body.get("encoding_format") or "float"
+            dim = body.get("dimensions") or config.embedding_dim
+            await asyncio.sleep(config.embedding_latency)
+            tokens = sum(len(text) // 4 + 1 for text in inputs)
+            response = {
+                "object": "list",
+                "model": body.get("model", "fake"),
+                "data": [{"object": "embedding", "index": i,
+                          "embedding": encode_embedding(embed_text(text, dim), encoding_format)}
+                         for i, text in enumerate(inputs)],
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+            }
+        else:
+            response = error
+        stats.service_seconds += time.perf_counter() - started
+        return response
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats.to_dict()
+
+    @app.post("/stats/reset")
+    async def reset_stats():
+        stats.reset()
+        return stats.to_dict()
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--latency", type=float, default=0.05, help="首token延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=100.0, help="每秒生成token数，0表示不限")
+    parser.add_argument("--tokens", type=int, default=64, help="每次生成的token数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入错误的比例")
+    parser.add_argument("--error-status", type=int, default=503, help="注入错误的HTTP状态码")
+    parser.add_argument("--stall-after", type=int, default=-1, help="生成该数量的token后挂起，-1表示不挂起")
+    parser.add_argument("--embedding-latency", type=float, default=0.01)
+    parser.add_argument("--embedding-dim", type=int, default=1024)
+    args = parser.parse_args()
+
+    config = ProviderConfig(
+        latency=args.latency,
+        token_rate=args.token_rate,
+        tokens=args.tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        stall_after=args.stall_after,
+        embedding_latency=args.embedding_latency,
+        embedding_dim=args.embedding_dim
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
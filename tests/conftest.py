@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+测试公用夹具
+"""
+
+import importlib
+import time
+from types import SimpleNamespace
+
+import pytest
+
+
+class FakeClock:
+    """手动推进的时钟，同时替换time.monotonic与time.time"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(time, "monotonic", clock)
+    monkeypatch.setattr(time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def add_model(monkeypatch):
+    """向全局模型目录临时添加模型（合并默认设置），测试结束后恢复原目录"""
+    from app.config.model_manager import model_manager
+    monkeypatch.setattr(model_manager, "_current", model_manager._snapshot)
+    return model_manager.add_model
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """上游调用路径使用新的准入控制、限速器与熔断器实例，测试之间不共享状态"""
+    from app.services import backend_router, rate_limiter
+    from app.services.admission import AdmissionController
+    from app.services.circuit_breaker import CircuitBreakerRegistry
+
+    services = SimpleNamespace(
+        admission=AdmissionController(
+            enabled=True, provider_concurrency=4, model_concurrency=4, max_concurrency=8,
+            max_queue=10, max_wait=5.0, latency_tolerance=2.0
+        ),
+        rate_limiter=rate_limiter.ProviderRateLimiter(headroom=1.0, burst_seconds=60.0),
+        breakers=CircuitBreakerRegistry(enabled=True),
+    )
+    # app.services导出的llm_adapter是适配器实例，按模块路径取模块本身
+    llm_adapter = importlib.import_module("app.services.llm_adapter")
+    monkeypatch.setattr(rate_limiter, "shared_table", None)
+    monkeypatch.setattr(llm_adapter, "admission_controller", services.admission)
+    monkeypatch.setattr(llm_adapter, "rate_limiter", services.rate_limiter)
+    monkeypatch.setattr(llm_adapter, "circuit_breakers", services.breakers)
+    monkeypatch.setattr(backend_router, "circuit_breakers", services.breakers)
+    return services
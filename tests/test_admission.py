@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+准入控制测试：AIMD并发上限、优先级排队、队列满与排队超时时卸载
+"""
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.admission import (
+    PRIORITY_BULK, PRIORITY_INTERACTIVE, AdaptiveLimit, AdmissionController
+)
+from app.services.providers import OTHER
+
+
+def make_controller(max_queue: int = 10, max_wait: float = 5.0) -> AdmissionController:
+    """提供商并发上限为1的准入控制"""
+    return AdmissionController(
+        enabled=True, provider_concurrency=1, model_concurrency=8, max_concurrency=8,
+        max_queue=max_queue, max_wait=max_wait, latency_tolerance=2.0
+    )
+
+
+def test_limit_grows_additively_and_shrinks_on_slow_calls():
+    limit = AdaptiveLimit(initial=4, min_limit=1, max_limit=8, latency_tolerance=2.0)
+    limit.on_success(0.1)
+    assert limit.limit == pytest.approx(4.25)
+    for _ in range(100):
+        limit.on_success(0.1)
+    assert limit.limit == 8
+
+    # 近期延迟明显高于基线时乘性下降
+    limit.on_success(10.0)
+    assert limit.limit == pytest.approx(7.2)
+
+
+def test_limit_overload_respects_minimum():
+    limit = AdaptiveLimit(initial=4, min_limit=1, max_limit=8, latency_tolerance=2.0)
+    limit.on_overload(0.5)
+    assert limit.limit == 2
+    for _ in range(5):
+        limit.on_overload(0.5)
+    assert limit.limit == 1
+    assert limit.available()
+    limit.in_flight = 1
+    assert not limit.available()
+
+
+def test_queued_requests_granted_by_priority():
+    controller = make_controller()
+    order = []
+
+    async def request(name: str, priority: int):
+        async with controller.admit("dashscope", "dashscope/qwen-turbo", priority):
+            order.append(name)
+            await asyncio.sleep(0)
+
+    async def main():
+        async with controller.admit("dashscope", "dashscope/qwen-turbo"):
+            bulk = asyncio.create_task(request("bulk", PRIORITY_BULK))
+            await asyncio.sleep(0)
+            interactive = asyncio.create_task(request("interactive", PRIORITY_INTERACTIVE))
+            await asyncio.sleep(0)
+            assert controller.stats()["queue_depth"] == {"dashscope": 2}
+        await asyncio.gather(bulk, interactive)
+
+    asyncio.run(main())
+    assert order == ["interactive", "bulk"]
+    stats = controller.stats()
+    assert stats["admitted"] == 3
+    assert stats["queued"] == 2
+    assert stats["providers"]["dashscope"]["in_flight"] == 0
+
+
+def test_full_queue_sheds():
+    controller = make_controller(max_queue=1)
+
+    async def main():
+        async with controller.admit("dashscope", "dashscope/qwen-turbo"):
+            waiting = asyncio.create_task(controller.admit("dashscope", "dashscope/qwen-turbo").__aenter__())
+            await asyncio.sleep(0)
+            with pytest.raises(HTTPException) as exc_info:
+                await controller.admit("dashscope", "dashscope/qwen-turbo").__aenter__()
+            waiting.cancel()
+            await asyncio.gather(waiting, return_exceptions=True)
+            return exc_info.value
+
+    error = asyncio.run(main())
+    assert error.status_code == 503
+    assert "Retry-After" in error.headers
+    assert controller.shed == 1
+
+
+def test_wait_timeout_sheds_and_leaves_queue():
+    controller = make_controller(max_wait=0.01)
+
+    async def main():
+        async with controller.admit("dashscope", "dashscope/qwen-turbo"):
+            with pytest.raises(HTTPException) as exc_info:
+                async with controller.admit("dashscope", "dashscope/qwen-turbo"):
+                    pass
+            return exc_info.value
+
+    error = asyncio.run(main())
+    assert error.status_code == 503
+    assert controller.shed == 1
+    assert controller.stats()["queue_depth"] == {"dashscope": 0}
+    assert controller.stats()["providers"]["dashscope"]["in_flight"] == 0
+
+
+def test_cancelled_waiter_leaves_queue():
+    """排队中被取消的等待方离开队列，不占用之后释放的名额"""
+    controller = make_controller()
+
+    async def main():
+        async with controller.admit("dashscope", "dashscope/qwen-turbo"):
+            waiting = asyncio.create_task(controller.admit("dashscope", "dashscope/qwen-turbo").__aenter__())
+            await asyncio.sleep(0)
+            waiting.cancel()
+            await asyncio.gather(waiting, return_exceptions=True)
+            assert controller.stats()["queue_depth"] == {"dashscope": 0}
+
+    asyncio.run(main())
+    assert controller.stats()["providers"]["dashscope"]["in_flight"] == 0
+    assert controller.stats()["models"]["dashscope/qwen-turbo"]["in_flight"] == 0
+
+
+def test_unknown_names_share_one_entry():
+    """客户端传入的任意提供商与模型名共用OTHER的上限和队列"""
+    controller = make_controller()
+
+    async def main():
+        for index in range(5):
+            async with controller.admit(f"made-up-{index}", f"made-up-{index}/model"):
+                pass
+        async with controller.admit("dashscope", "dashscope/qwen-turbo"):
+            pass
+
+    asyncio.run(main())
+    stats = controller.stats()
+    assert set(stats["providers"]) == {OTHER, "dashscope"}
+    assert set(stats["models"]) == {OTHER, "dashscope/qwen-turbo"}
+    assert set(stats["queue_depth"]) == {OTHER, "dashscope"}
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+多后端路由测试：得分只为已配置的后端保存、上游503时回退到下一个后端
+"""
+
+import asyncio
+import importlib
+from types import SimpleNamespace
+
+from app.services.backend_router import Backend, BackendRouter
+from app.services.lazy_import import litellm
+from app.services.llm_adapter import llm_adapter
+
+
+def test_scores_only_kept_for_configured_backends():
+    router = BackendRouter(explore_ratio=0)
+    router.record(Backend("dashscope", "qwen-turbo"), 0.5, failed=False)
+    router.record(Backend("made-up", "model-1"), 0.5, failed=False)
+    router.record(Backend("openai", "made-up-model"), 0.5, failed=True)
+    assert list(router.stats()["backends"]) == ["dashscope/qwen-turbo"]
+
+
+def test_unavailable_backend_falls_over_to_next(upstream, add_model, monkeypatch):
+    add_model("test/multi", {"capabilities": ["chat"], "backends": [
+        {"provider": "dashscope", "model": "model-a"},
+        {"provider": "deepseek", "model": "model-b"},
+    ]})
+    router = BackendRouter(explore_ratio=0)
+    monkeypatch.setattr(importlib.import_module("app.services.llm_adapter"), "backend_router", router)
+    calls = []
+
+    async def acompletion(model, messages, stream, **kwargs):
+        calls.append(model)
+        if len(calls) == 1:
+            raise litellm.ServiceUnavailableError(message="overloaded", llm_provider="openai", model=model)
+        message = SimpleNamespace(content="ok")
+        usage = SimpleNamespace(prompt_tokens=1, completion_tokens=1, total_tokens=2)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=usage)
+
+    monkeypatch.setattr(litellm, "acompletion", acompletion)
+    response = asyncio.run(llm_adapter.chat_completion("test/multi", [{"role": "user", "content": "hi"}]))
+    assert response.response == "ok"
+    assert sorted(calls) == ["openai/model-a", "openai/model-b"]
+    assert router.fallbacks == 1
+    # 返回503的后端记一次失败
+    failed = "dashscope/model-a" if calls[0] == "openai/model-a" else "deepseek/model-b"
+    assert router.stats()["backends"][failed]["failures"] == 1
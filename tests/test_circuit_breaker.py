@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+熔断器测试：closed -> open -> half_open -> closed 状态转换与试探名额
+"""
+
+import pytest
+from fastapi import HTTPException
+
+from app.config.settings import settings
+from app.services import circuit_breaker as circuit_breaker_module
+from app.services.circuit_breaker import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakerRegistry
+)
+from app.services.providers import OTHER
+
+
+@pytest.fixture(autouse=True)
+def breaker_settings(monkeypatch, clock):
+    """单进程模式，窗口内至少4个请求、错误率达到50%时熔断，30秒后半开放行2个试探请求"""
+    monkeypatch.setattr(circuit_breaker_module, "shared_table", None)
+    monkeypatch.setattr(settings, "circuit_window", 60.0)
+    monkeypatch.setattr(settings, "circuit_min_requests", 4)
+    monkeypatch.setattr(settings, "circuit_failure_rate", 0.5)
+    monkeypatch.setattr(settings, "circuit_open_seconds", 30.0)
+    monkeypatch.setattr(settings, "circuit_half_open_max_calls", 2)
+    monkeypatch.setattr(settings, "circuit_slow_call_seconds", 0)
+
+
+def open_breaker(breaker):
+    for failed in (False, False, True, True):
+        breaker.record(failed)
+
+
+def test_opens_after_failure_rate_reached():
+    breaker = CircuitBreaker("dashscope")
+    for failed in (False, True, True):
+        breaker.record(failed)
+    # 请求数不足circuit_min_requests时不判断错误率
+    assert breaker.state == CLOSED
+    breaker.record(True)
+    assert breaker.state == OPEN
+    assert breaker.times_opened == 1
+    assert not breaker.allow()
+
+
+def test_old_failures_leave_window(clock):
+    breaker = CircuitBreaker("dashscope")
+    for _ in range(3):
+        breaker.record(True)
+    clock.now += 61
+    breaker.record(True)
+    assert breaker.state == CLOSED
+    assert breaker.window.counts() == (1, 1)
+
+
+def test_half_open_trials_close_breaker(clock):
+    breaker = CircuitBreaker("dashscope")
+    open_breaker(breaker)
+    clock.now += 29
+    assert not breaker.available()
+    assert breaker.retry_after() == 1
+
+    clock.now += 1
+    assert breaker.available()
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    # 试探名额用完后拒绝
+    assert not breaker.allow()
+    assert not breaker.available()
+
+    breaker.record(False)
+    assert breaker.state == HALF_OPEN
+    breaker.record(False)
+    assert breaker.state == CLOSED
+    assert breaker.window.counts() == (0, 0)
+
+
+def test_half_open_failure_reopens(clock):
+    breaker = CircuitBreaker("dashscope")
+    open_breaker(breaker)
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == OPEN
+    assert breaker.times_opened == 2
+    assert breaker.retry_after() == 30
+
+
+def test_release_trial_returns_slot(clock):
+    breaker = CircuitBreaker("dashscope")
+    open_breaker(breaker)
+    clock.now += 30
+    assert breaker.allow() and breaker.allow()
+    breaker.release_trial()
+    assert breaker.allow()
+
+
+def test_guard_rejects_when_open():
+    registry = CircuitBreakerRegistry(enabled=True)
+    open_breaker(registry.get("dashscope"))
+    with pytest.raises(HTTPException) as exc_info:
+        with registry.guard("dashscope", "dashscope/qwen-turbo"):
+            pass
+    assert exc_info.value.status_code == 503
+
+
+def test_guard_records_outcomes():
+    registry = CircuitBreakerRegistry(enabled=True)
+    with registry.guard("dashscope", "dashscope/qwen-turbo") as guard:
+        guard.begin()
+    # 未发出上游请求或本地拒绝不计入统计
+    with registry.guard("dashscope", "dashscope/qwen-turbo"):
+        pass
+    with pytest.raises(HTTPException):
+        with registry.guard("dashscope", "dashscope/qwen-turbo") as guard:
+            guard.begin()
+            raise HTTPException(status_code=422)
+
+    assert registry.get("dashscope").window.counts() == (1, 0)
+    health = registry.model_health("dashscope/qwen-turbo", ["dashscope"])
+    assert health["breaker_state"] == CLOSED
+    assert health["error_rate"] == 0.0
+    assert registry.model_health("unknown", ["dashscope"]) is None
+
+
+def test_disabled_registry_never_rejects():
+    registry = CircuitBreakerRegistry(enabled=False)
+    open_breaker(registry.get("dashscope"))
+    with registry.guard("dashscope", "dashscope/qwen-turbo") as guard:
+        guard.begin()
+
+
+def test_unknown_names_share_one_entry():
+    """客户端传入的任意提供商与模型名不会无限创建熔断器"""
+    registry = CircuitBreakerRegistry(enabled=True)
+    assert registry.get("made-up-1") is registry.get("made-up-2")
+    assert registry.get("made-up-1").name == OTHER
+    assert registry.get("dashscope") is not registry.get("made-up-1")
+    assert registry.model_window("made-up/1") is registry.model_window("made-up/2")
+    assert registry.model_window("dashscope/qwen-turbo") is not registry.model_window("made-up/1")
+    assert set(registry.stats()["providers"]) == {"dashscope", OTHER}
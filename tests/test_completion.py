@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+对话调用测试：流式超时以done帧结束、客户端断开时返回499并退还配额、
+对冲请求取先返回的结果（上游以桩函数代替）
+"""
+
+import asyncio
+import importlib
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app.config.settings import settings
+from app.services.disconnect import cancel_on_disconnect
+from app.services.hedging import LatencyTracker, RetryBudget
+from app.services.lazy_import import litellm
+from app.services.llm_adapter import llm_adapter
+
+CHAT_MODEL = "dashscope/test-chat"
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+def stream_chunk(content):
+    delta = SimpleNamespace(content=content)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=None)], usage=None)
+
+
+def completion_response(content):
+    message = SimpleNamespace(content=content)
+    usage = SimpleNamespace(prompt_tokens=1, completion_tokens=1, total_tokens=2)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=usage)
+
+
+def collect(frames):
+    async def main():
+        stream = await frames
+        return [json.loads(frame) async for frame in stream]
+
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def chat_model(upstream, add_model):
+    add_model(CHAT_MODEL, {"provider": "dashscope", "capabilities": ["chat"]})
+    return CHAT_MODEL
+
+
+def test_stream_inter_token_timeout_ends_with_done_frame(chat_model, monkeypatch):
+    """上游输出一个增量后挂起，超过token间超时后以done_reason为timeout的done帧结束"""
+    monkeypatch.setattr(settings, "inter_token_timeout", 0.05)
+
+    async def acompletion(model, messages, stream, **kwargs):
+        async def chunks():
+            yield stream_chunk("hello")
+            await asyncio.sleep(10)
+
+        return chunks()
+
+    monkeypatch.setattr(litellm, "acompletion", acompletion)
+    frames = collect(llm_adapter.chat_completion(chat_model, MESSAGES, stream=True))
+    assert "".join(frame["message"]["content"] for frame in frames[:-1]) == "hello"
+    assert frames[-1]["done"] is True
+    assert frames[-1]["done_reason"] == "timeout"
+
+
+def test_stream_first_token_timeout_ends_with_done_frame(chat_model, monkeypatch):
+    monkeypatch.setattr(settings, "first_token_timeout", 0.05)
+
+    async def acompletion(model, messages, stream, **kwargs):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(litellm, "acompletion", acompletion)
+    frames = collect(llm_adapter.chat_completion(chat_model, MESSAGES, stream=True))
+    assert len(frames) == 1
+    assert frames[0]["done"] is True
+    assert frames[0]["done_reason"] == "timeout"
+
+
+def test_client_disconnect_cancels_upstream_call(chat_model, upstream, monkeypatch):
+    """等待上游响应时客户端断开：返回499，释放准入名额并退还未生成部分的token配额"""
+    monkeypatch.setattr(settings, "dashscope_tpm", 60000)
+    monkeypatch.setattr(settings, "rate_limit_default_completion_tokens", 1000)
+    cancelled = []
+
+    async def main():
+        sent = asyncio.Event()
+
+        async def acompletion(model, messages, stream, **kwargs):
+            sent.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(model)
+                raise
+
+        async def receive():
+            await sent.wait()
+            return {"type": "http.disconnect"}
+
+        monkeypatch.setattr(litellm, "acompletion", acompletion)
+        request = Request({"type": "http"}, receive)
+        await cancel_on_disconnect(request, llm_adapter.chat_completion(chat_model, MESSAGES))
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(asyncio.wait_for(main(), timeout=5))
+    assert exc_info.value.status_code == 499
+    assert cancelled == ["openai/test-chat"]
+    assert upstream.admission.stats()["providers"]["dashscope"]["in_flight"] == 0
+    # 已发出的请求只按prompt计，预约的1000个输出token已退还
+    [tpm] = [bucket["tpm"] for key, bucket in upstream.rate_limiter.stats()["buckets"].items()
+             if key.startswith("dashscope:")]
+    assert tpm["available"] > tpm["capacity"] - 100
+
+
+def test_hedged_completion_first_response_wins(chat_model, add_model, monkeypatch):
+    """主请求超过延迟百分位仍未返回时发出对冲请求，先返回的对冲请求胜出，主请求被取消"""
+    add_model(chat_model, {"provider": "dashscope", "capabilities": ["chat"], "hedge": True})
+    llm_adapter_module = importlib.import_module("app.services.llm_adapter")
+    tracker = LatencyTracker()
+    tracker.record(chat_model, 0.01)
+    budget = RetryBudget(ratio=0.1, min_per_second=0, max_tokens=10)
+    monkeypatch.setattr(settings, "hedge_min_samples", 1)
+    monkeypatch.setattr(settings, "hedge_min_delay", 0.01)
+    monkeypatch.setattr(llm_adapter_module, "latency_tracker", tracker)
+    monkeypatch.setattr(llm_adapter_module, "retry_budget", budget)
+    calls = []
+    cancelled = []
+
+    async def acompletion(model, messages, stream, **kwargs):
+        calls.append(model)
+        if len(calls) == 1:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(model)
+                raise
+        return completion_response("hedged")
+
+    monkeypatch.setattr(litellm, "acompletion", acompletion)
+    response = asyncio.run(asyncio.wait_for(llm_adapter.chat_completion(chat_model, MESSAGES), timeout=5))
+    assert response.response == "hedged"
+    assert len(calls) == 2
+    assert cancelled == calls[:1]
+    assert budget.hedges == 1
+    assert budget.hedge_wins == 1
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+嵌入缓存测试：写入、后台落盘、从mmap数据文件读取、跨实例共享与按模型失效
+"""
+
+import asyncio
+
+import numpy as np
+
+from app.services.embedding_cache import EmbeddingCache
+
+VECTORS = np.array([[0.5, -1.0, 0.25], [3.0, 4.0, 0.0]], dtype=np.float32)
+
+
+def test_round_trip(tmp_path):
+    async def main():
+        cache = EmbeddingCache(str(tmp_path), max_bytes=1 << 20)
+        reader = EmbeddingCache(str(tmp_path), max_bytes=1 << 20, read_only=True)
+        try:
+            cache.put_many("m", ["a", "b"], VECTORS)
+            cache.put("other", "a", VECTORS[1])
+            # 落盘前查找命中等待写入的条目
+            assert np.array_equal(cache.get("m", "a"), VECTORS[0])
+
+            await cache.flush()
+            stats = cache.stats()
+            assert stats["pending_writes"] == 0
+            assert stats["writes"] == 3
+            assert stats["entries"] == 3
+
+            for instance in (cache, reader):
+                assert np.array_equal(instance.get("m", "a"), VECTORS[0])
+                assert np.array_equal(instance.get("m", "b"), VECTORS[1])
+                assert instance.get("m", "a", {"dimensions": 2}) is None
+                assert instance.get("m", "c") is None
+
+            assert await cache.invalidate("m") == 2
+            assert cache.get("m", "a") is None
+            assert reader.get("m", "b") is None
+            assert np.array_equal(cache.get("other", "a"), VECTORS[1])
+        finally:
+            reader.close()
+            cache.close()
+
+    asyncio.run(main())
+
+
+def test_invalidate_drops_pending_writes(tmp_path):
+    async def main():
+        cache = EmbeddingCache(str(tmp_path), max_bytes=1 << 20)
+        try:
+            cache.put("m", "a", VECTORS[0])
+            await cache.invalidate("m")
+            await cache.flush()
+            assert cache.get("m", "a") is None
+        finally:
+            cache.close()
+
+    asyncio.run(main())
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+嵌入编码测试：Accept协商、JSON、base64与二进制响应、量化与Matryoshka截断
+"""
+
+import base64
+import json
+
+import numpy as np
+import pytest
+
+from app.services.embedding_encoding import (
+    BINARY_HEADER, BINARY_MEDIA_TYPE, DTYPE_BINARY, DTYPE_FLOAT16, DTYPE_INT8,
+    ENCODING_BASE64, ENCODING_BINARY, ENCODING_JSON,
+    decode_vector, encode_embeddings, negotiate_encoding, quantize, truncate_dimensions
+)
+
+MATRIX = np.array([[0.5, -1.0, 0.25, 0.0], [3.0, 4.0, 0.0, 0.0]], dtype=np.float32)
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, ENCODING_JSON),
+    ("application/json", ENCODING_JSON),
+    ("*/*", ENCODING_JSON),
+    ("application/octet-stream", ENCODING_BINARY),
+    ("application/json; encoding=base64", ENCODING_BASE64),
+    ("application/json;q=0.5, application/octet-stream", ENCODING_BINARY),
+    ("application/octet-stream;q=0.1, application/json; encoding=base64;q=0.9", ENCODING_BASE64),
+    ("application/octet-stream;q=0", ENCODING_JSON),
+    ("application/octet-stream;q=bad, application/json", ENCODING_JSON),
+    ("text/html", ENCODING_JSON),
+])
+def test_negotiate_encoding(accept, expected):
+    assert negotiate_encoding(accept) == expected
+
+
+def test_decode_vector_accepts_base64():
+    vector = np.array([1.5, -2.0], dtype="<f4")
+    encoded = base64.b64encode(vector.tobytes()).decode("ascii")
+    assert decode_vector(encoded).tolist() == [1.5, -2.0]
+    assert decode_vector([1.5, -2.0]).dtype == np.float32
+
+
+def test_encode_base64_single():
+    response = encode_embeddings(MATRIX[0], ENCODING_BASE64, field="embedding", single=True)
+    payload = json.loads(response.body)
+    assert payload["encoding"] == ENCODING_BASE64
+    assert decode_vector(payload["embedding"]).tolist() == MATRIX[0].tolist()
+
+
+def test_encode_json():
+    payload = json.loads(encode_embeddings(MATRIX, ENCODING_JSON, model="m").body)
+    assert payload == {"model": "m", "embeddings": MATRIX.tolist()}
+
+
+def test_encode_binary_float32():
+    response = encode_embeddings(MATRIX, ENCODING_BINARY, model="m", total_duration=5)
+    assert response.media_type == BINARY_MEDIA_TYPE
+    assert response.headers["X-Embedding-Model"] == "m"
+    assert response.headers["X-Embedding-Total-Duration"] == "5"
+
+    body = response.body
+    count, dim = BINARY_HEADER.unpack_from(body)
+    assert (count, dim) == (2, 4)
+    data = np.frombuffer(body, dtype="<f4", offset=BINARY_HEADER.size).reshape(count, dim)
+    assert np.array_equal(data, MATRIX)
+
+
+def test_truncate_dimensions_renormalizes():
+    truncated = truncate_dimensions(MATRIX, 2)
+    assert truncated.shape == (2, 2)
+    assert np.allclose(np.linalg.norm(truncated, axis=1), 1.0)
+    assert np.allclose(truncated[1], [0.6, 0.8])
+
+
+def test_truncate_dimensions_zero_vector():
+    truncated = truncate_dimensions(np.zeros((1, 4), dtype=np.float32), 2)
+    assert truncated.tolist() == [[0.0, 0.0]]
+
+
+def test_quantize_int8_round_trip():
+    data, scales = quantize(MATRIX, DTYPE_INT8)
+    assert data.dtype == np.int8
+    assert data[0].tolist() == [64, -127, 32, 0]
+    assert data[1].tolist() == [95, 127, 0, 0]
+    assert np.allclose(data * scales[:, None], MATRIX, atol=scales.max() / 2)
+
+
+def test_quantize_int8_zero_vector_scale():
+    _, scales = quantize(np.zeros((1, 4), dtype=np.float32), DTYPE_INT8)
+    assert scales.tolist() == [1.0]
+
+
+def test_quantize_binary_packs_sign_bits():
+    data, scales = quantize(MATRIX, DTYPE_BINARY)
+    assert scales is None
+    # 第一维为首字节最高位
+    assert data.tolist() == [[0b10100000], [0b11000000]]
+
+
+def test_encode_json_float16():
+    response = encode_embeddings(MATRIX, ENCODING_JSON, dtype=DTYPE_FLOAT16, model="m")
+    payload = json.loads(response.body)
+    assert payload["model"] == "m"
+    assert payload["dtype"] == DTYPE_FLOAT16
+    assert payload["embeddings"] == MATRIX.tolist()
+
+
+def test_encode_binary_int8():
+    response = encode_embeddings(MATRIX, ENCODING_BINARY, dtype=DTYPE_INT8, model="m", total_duration=5)
+    assert response.media_type == BINARY_MEDIA_TYPE
+    assert response.headers["X-Embedding-Dtype"] == DTYPE_INT8
+    assert response.headers["X-Embedding-Model"] == "m"
+    assert response.headers["X-Embedding-Total-Duration"] == "5"
+
+    body = response.body
+    count, dim = BINARY_HEADER.unpack_from(body)
+    assert (count, dim) == (2, 4)
+    offset = BINARY_HEADER.size
+    data = np.frombuffer(body, dtype=np.int8, count=count * dim, offset=offset).reshape(count, dim)
+    scales = np.frombuffer(body, dtype="<f4", offset=offset + count * dim)
+    expected_data, expected_scales = quantize(MATRIX, DTYPE_INT8)
+    assert np.array_equal(data, expected_data)
+    assert np.array_equal(scales, expected_scales)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+嵌入调用测试：分批、请求内去重、按index还原顺序、失败时取消其余批次、
+单条嵌入经过准入控制、限速、熔断与请求合并（上游以桩函数代替）
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from app.config.settings import settings
+from app.services.lazy_import import litellm
+from app.services.llm_adapter import llm_adapter
+
+EMBED_MODEL = "dashscope/test-embedding"
+
+
+def embedding_response(texts):
+    """向量为[文本长度, 1]；data故意倒序返回，由index字段还原"""
+    data = [{"index": i, "embedding": [float(len(text)), 1.0]} for i, text in enumerate(texts)]
+    usage = SimpleNamespace(prompt_tokens=len(texts), total_tokens=len(texts))
+    return SimpleNamespace(data=data[::-1], usage=usage)
+
+
+@pytest.fixture
+def embed_calls(monkeypatch, upstream, add_model):
+    """每批最多2条输入的嵌入模型，返回记录各次上游调用输入的列表"""
+    add_model(EMBED_MODEL, {"provider": "dashscope", "capabilities": ["embedding"], "embedding_batch_size": 2})
+    calls = []
+
+    async def aembedding(model, input, **kwargs):
+        calls.append(input)
+        await asyncio.sleep(0.01)
+        return embedding_response(input if isinstance(input, list) else [input])
+
+    monkeypatch.setattr(litellm, "aembedding", aembedding)
+    return calls
+
+
+def test_inputs_split_into_batches(embed_calls):
+    inputs = ["a", "bb", "ccc", "dddd", "eeeee"]
+    embeddings = asyncio.run(llm_adapter.generate_embeddings(EMBED_MODEL, inputs))
+    assert embeddings.dtype == np.float32
+    assert embeddings[:, 0].tolist() == [1, 2, 3, 4, 5]
+    # 单条输入的批次按字符串发送
+    assert sorted(embed_calls, key=str) == [["a", "bb"], ["ccc", "dddd"], "eeeee"]
+
+
+def test_duplicate_inputs_sent_once(embed_calls):
+    embeddings = asyncio.run(llm_adapter.generate_embeddings(EMBED_MODEL, ["a", "bb", "a"]))
+    assert embed_calls == [["a", "bb"]]
+    assert embeddings[:, 0].tolist() == [1, 2, 1]
+
+
+def test_batches_limited_by_tokens(embed_calls, add_model):
+    add_model(EMBED_MODEL, {"provider": "dashscope", "capabilities": ["embedding"],
+                            "embedding_batch_size": 10, "embedding_max_batch_tokens": 15})
+    inputs = ["x" * 30, "y" * 30, "z" * 3]
+    asyncio.run(llm_adapter.generate_embeddings(EMBED_MODEL, inputs))
+    assert sorted(embed_calls, key=str) == [["y" * 30, "z" * 3], "x" * 30]
+
+
+def test_failed_batch_cancels_siblings(embed_calls, monkeypatch):
+    cancelled = []
+
+    async def aembedding(model, input, **kwargs):
+        if input == ["a", "bb"]:
+            raise ValueError("upstream error")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(input)
+            raise
+
+    monkeypatch.setattr(litellm, "aembedding", aembedding)
+    with pytest.raises(HTTPException):
+        asyncio.run(asyncio.wait_for(
+            llm_adapter.generate_embeddings(EMBED_MODEL, ["a", "bb", "ccc", "dddd", "eeeee"]), timeout=5
+        ))
+    assert sorted(cancelled, key=str) == [["ccc", "dddd"], "eeeee"]
+
+
+def test_single_embedding_goes_through_upstream_controls(embed_calls, upstream, monkeypatch):
+    """/api/embeddings与/api/embed一样经过准入控制、限速与熔断"""
+    monkeypatch.setattr(settings, "dashscope_rpm", 60)
+    vector = asyncio.run(llm_adapter.generate_embedding(EMBED_MODEL, "hello"))
+    assert vector.tolist() == [5.0, 1.0]
+    assert embed_calls == ["hello"]
+    assert upstream.admission.admitted == 1
+    assert upstream.rate_limiter.stats()["buckets"]
+    assert upstream.breakers.get("dashscope").window.counts() == (1, 0)
+
+
+def test_single_embedding_rejected_when_breaker_open(embed_calls, upstream):
+    upstream.breakers.get("dashscope")._open()
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(llm_adapter.generate_embedding(EMBED_MODEL, "hello"))
+    assert exc_info.value.status_code == 503
+    assert embed_calls == []
+
+
+def test_single_embedding_coalesced(embed_calls, add_model):
+    add_model(EMBED_MODEL, {"provider": "dashscope", "capabilities": ["embedding"], "single_flight": True})
+
+    async def main():
+        return await asyncio.gather(*(llm_adapter.generate_embedding(EMBED_MODEL, "hello") for _ in range(3)))
+
+    vectors = asyncio.run(main())
+    assert [vector.tolist() for vector in vectors] == [[5.0, 1.0]] * 3
+    assert embed_calls == ["hello"]
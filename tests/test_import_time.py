@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+冷启动导入耗时测试：import app.main 不应导入LiteLLM等重型模块，且耗时在预算内
+"""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+# 导入耗时预算（秒），较慢的CI机器可通过环境变量放宽
+IMPORT_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", "1.5"))
+
+SCRIPT = """
+import sys, time
+started = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - started
+print(elapsed)
+print(",".join(name for name in ("litellm", "openai") if name in sys.modules))
+"""
+
+
+def run_import():
+    result = subprocess.run(
+        [sys.executable, "-c", SCRIPT],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    lines = result.stdout.splitlines()
+    return float(lines[-2]), lines[-1]
+
+
+def test_heavy_modules_not_imported():
+    """LiteLLM与openai在启动预热或首次使用时才导入"""
+    _, heavy_modules = run_import()
+    assert heavy_modules == ""
+
+
+def test_import_time_budget():
+    """取多次运行的最小值，避免偶发抖动"""
+    elapsed = min(run_import()[0] for _ in range(3))
+    assert elapsed < IMPORT_BUDGET, f"import app.main 耗时 {elapsed:.2f}s，超过预算 {IMPORT_BUDGET}s"
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+请求指标测试：未配置的模型与提供商归入other，标签基数以配置为上限
+"""
+
+from app.services.metrics import RequestMetrics, inter_token_latency, requests_total, time_to_first_token
+from app.services.providers import OTHER
+
+
+def test_known_names_kept():
+    metrics = RequestMetrics("chat", "dashscope/qwen-turbo", "dashscope")
+    assert metrics.labels == ("chat", "dashscope/qwen-turbo", "dashscope")
+    metrics.finish()
+
+
+def test_unknown_model_and_provider_folded():
+    metrics = RequestMetrics("chat", "made-up/model-1", "made-up")
+    assert metrics.labels == ("chat", OTHER, OTHER)
+    metrics.set_provider("another-made-up")
+    assert metrics.labels == ("chat", OTHER, OTHER)
+    metrics.finish(404)
+    assert not any("made-up" in value for labels in requests_total._values for value in labels)
+
+
+def test_configured_backend_provider_is_known(add_model):
+    add_model("test/multi", {"backends": [{"provider": "selfhosted", "model": "llama"}]})
+    metrics = RequestMetrics("chat", "test/multi", "selfhosted")
+    assert metrics.labels == ("chat", "test/multi", "selfhosted")
+    metrics.finish()
+
+
+def test_tokens_after_finish_ignored():
+    """首个订阅者断开后共享流继续产生增量，已结束的请求不再记录TTFT与token间隔"""
+    metrics = RequestMetrics("finished-test", "dashscope/qwen-plus", "dashscope")
+    metrics.finish(499)
+    metrics.on_token()
+    metrics.on_token()
+    assert metrics.first_token_at is None
+    assert metrics.labels not in time_to_first_token._series
+    assert metrics.labels not in inter_token_latency._series
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+模型目录测试：/api/tags的ETag与条件请求，模型配置变化后ETag随之改变
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routers.models import router
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
+
+
+def test_matching_etag_not_modified(client):
+    response = client.get("/api/tags")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert response.json()["models"]
+
+    for if_none_match in (etag, f"W/{etag}", f'"stale", {etag}', "*"):
+        response = client.get("/api/tags", headers={"If-None-Match": if_none_match})
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+        assert response.content == b""
+
+
+def test_stale_etag_returns_body(client, add_model):
+    etag = client.get("/api/tags").headers["ETag"]
+    response = client.get("/api/tags", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 200
+    assert response.headers["ETag"] == etag
+
+    add_model("dashscope/test-etag", {"provider": "dashscope"})
+    response = client.get("/api/tags", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert "dashscope/test-etag:latest" in [model["name"] for model in response.json()["models"]]
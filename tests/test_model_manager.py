@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+模型配置测试：单个模型的校验、合并默认设置后的校验、启动时跳过无效模型、重新加载失败时保留当前配置
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from app.config.model_manager import ModelManager, _validate_model
+
+VALID = {
+    "provider": "dashscope",
+    "capabilities": ["text", "chat"],
+    "response_cache": True,
+    "embedding_batch_size": 8,
+    "embedding_max_batch_tokens": 0,
+    "timeout": 30,
+    "semantic_cache_threshold": 0.9,
+    "embedding_dimensions_mode": "truncate",
+    "backends": [{"provider": "dashscope", "model": "qwen-turbo", "weight": 2.5}],
+}
+
+
+def write_config(path, models, default_settings=None):
+    path.write_text(json.dumps({"default_settings": default_settings or {}, "models": models}), encoding="utf-8")
+
+
+def test_valid_model():
+    _validate_model("qwen", VALID)
+    _validate_model("minimal", {})
+
+
+@pytest.mark.parametrize("key, value", [
+    ("capabilities", "chat"),
+    ("backends", {"provider": "dashscope"}),
+    ("response_cache", "false"),
+    ("single_flight", 1),
+    ("hedge", None),
+    ("semantic_cache", "yes"),
+    ("embedding_batch_size", 0),
+    ("embedding_batch_size", 2.0),
+    ("embedding_batch_size", True),
+    ("embedding_max_batch_tokens", -1),
+    ("embedding_max_batch_tokens", "8192"),
+    ("timeout", -1),
+    ("timeout", "30"),
+    ("semantic_cache_threshold", 0),
+    ("semantic_cache_threshold", 1.5),
+    ("embedding_dimensions_mode", "local"),
+    ("backends", [{"provider": "dashscope"}]),
+    ("backends", [{"provider": "dashscope", "model": "qwen-turbo", "weight": 0}]),
+    ("backends", [{"provider": "dashscope", "model": "qwen-turbo", "weight": "1"}]),
+])
+def test_invalid_field(key, value):
+    with pytest.raises(ValueError):
+        _validate_model("qwen", {**VALID, key: value})
+
+
+def test_non_dict_config():
+    with pytest.raises(ValueError):
+        _validate_model("qwen", ["dashscope"])
+
+
+def test_invalid_default_settings_rejected(tmp_path):
+    """默认设置合并后整体校验，默认设置中的无效值同样拒绝"""
+    path = tmp_path / "models.json"
+    write_config(path, {"qwen": {"provider": "dashscope"}}, {"response_cache": "false"})
+    with pytest.raises(ValueError):
+        ModelManager(str(path))._parse_config()
+
+
+def test_load_skips_invalid_model(tmp_path):
+    """启动时只跳过无效的模型条目，不以内置默认目录替代实际配置"""
+    path = tmp_path / "models.json"
+    write_config(path, {"qwen": {"provider": "dashscope"}, "broken": {"timeout": "30"}})
+    manager = ModelManager(str(path))
+    manager.load_config()
+    assert set(manager._snapshot.models) == {"qwen"}
+
+
+def test_load_rejects_invalid_structure(tmp_path):
+    path = tmp_path / "models.json"
+    path.write_text(json.dumps({"models": ["qwen"]}), encoding="utf-8")
+    with pytest.raises(ValueError):
+        ModelManager(str(path)).load_config()
+
+
+@pytest.mark.parametrize("content", [None, "{not json"])
+def test_load_falls_back_when_file_unreadable(tmp_path, content):
+    """文件不存在或无法解析时使用内置默认目录"""
+    path = tmp_path / "models.json"
+    if content is not None:
+        path.write_text(content, encoding="utf-8")
+    manager = ModelManager(str(path))
+    manager.load_config()
+    assert "dashscope/qwen-turbo" in manager._snapshot.models
+
+
+def test_load_async_reads_file_once(tmp_path):
+    path = tmp_path / "models.json"
+    write_config(path, {"qwen": {"provider": "dashscope"}})
+    manager = ModelManager(str(path))
+    asyncio.run(manager.load_async())
+    assert set(manager._snapshot.models) == {"qwen"}
+    version = manager.version
+
+    # 已加载时不再读取文件，也不改变版本
+    write_config(path, {"other": {"provider": "dashscope"}})
+    asyncio.run(manager.load_async())
+    assert manager.version == version
+    assert set(manager._snapshot.models) == {"qwen"}
+
+
+def test_reload_keeps_current_config_on_error(tmp_path):
+    path = tmp_path / "models.json"
+    write_config(path, {"qwen": {"provider": "dashscope"}}, {"embedding_batch_size": 4})
+    manager = ModelManager(str(path))
+    manager.load_config()
+    version = manager.version
+    assert manager._snapshot.models["qwen"].embedding_batch_size == 4
+
+    write_config(path, {"qwen": {"provider": "dashscope", "embedding_batch_size": -1}})
+    with pytest.raises(ValueError):
+        asyncio.run(manager.reload_async())
+    assert manager.version == version
+    assert manager._snapshot.models["qwen"].embedding_batch_size == 4
+
+    write_config(path, {"qwen": {"provider": "dashscope", "embedding_batch_size": 2}})
+    asyncio.run(manager.reload_async())
+    assert manager.version == version + 1
+    assert manager._snapshot.models["qwen"].embedding_batch_size == 2
+
+
+def test_add_model_validates_merged_config(tmp_path):
+    path = tmp_path / "models.json"
+    write_config(path, {}, {"hedge": False})
+    manager = ModelManager(str(path))
+    with pytest.raises(ValueError):
+        manager.add_model("qwen", {"provider": "dashscope", "hedge": "true"})
+    assert "qwen" not in manager._snapshot.models
+
+    manager.add_model("qwen", {"provider": "dashscope"})
+    assert manager._snapshot.models["qwen"].hedge is False
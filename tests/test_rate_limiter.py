@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+令牌桶限速测试：预约等待时间、透支与修正、未发出请求的退还、输出token预估的校验
+"""
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.config.settings import settings
+from app.services import rate_limiter as rate_limiter_module
+from app.services.llm_adapter import llm_adapter
+from app.services.rate_limiter import ProviderRateLimiter, TokenBucket
+
+
+@pytest.fixture
+def limiter(monkeypatch, clock):
+    """单进程模式下的限速器，dashscope配额为每分钟60次请求、6000个token"""
+    monkeypatch.setattr(rate_limiter_module, "shared_table", None)
+    monkeypatch.setattr(settings, "dashscope_rpm", 60)
+    monkeypatch.setattr(settings, "dashscope_tpm", 6000)
+    return ProviderRateLimiter(headroom=1.0, burst_seconds=1.0)
+
+
+def test_bucket_paces_after_burst(clock):
+    """突发容量用完后按补充速率排队，等待时间随欠额累加"""
+    bucket = TokenBucket(per_minute=60, burst_seconds=2)
+    assert bucket.capacity == 2
+    assert bucket.reserve(1) == 0
+    assert bucket.reserve(1) == 0
+    assert bucket.reserve(1) == pytest.approx(1.0)
+    assert bucket.reserve(1) == pytest.approx(2.0)
+
+    clock.now += 2
+    assert bucket.available() == pytest.approx(0.0)
+
+
+def test_bucket_refill_capped_at_capacity(clock):
+    bucket = TokenBucket(per_minute=60, burst_seconds=2)
+    bucket.reserve(2)
+    clock.now += 60
+    assert bucket.available() == pytest.approx(2.0)
+
+
+def test_bucket_adjust(clock):
+    """实际用量少于预估时退还差额，多于预估时继续透支"""
+    bucket = TokenBucket(per_minute=600, burst_seconds=1)
+    bucket.reserve(10)
+    bucket.adjust(-4)
+    assert bucket.available() == pytest.approx(4.0)
+    bucket.adjust(6)
+    assert bucket.available() == pytest.approx(-2.0)
+    bucket.adjust(-100)
+    assert bucket.available() == pytest.approx(bucket.capacity)
+
+
+def test_reconcile_uses_actual_usage(limiter):
+    asyncio.run(limiter.acquire("dashscope", "key", 50))
+    tokens = limiter._bucket("dashscope", limiter._key_id("key"), "tpm")
+    limiter.reconcile("dashscope", "key", 50, 30)
+    assert tokens.available() == pytest.approx(70.0)
+    # 上游未返回usage时保持预估
+    limiter.reconcile("dashscope", "key", 50, None)
+    assert tokens.available() == pytest.approx(70.0)
+
+
+def test_release_returns_reservation(limiter):
+    """排队中被取消等未发出的请求退还请求数和token数"""
+    asyncio.run(limiter.acquire("dashscope", "key", 80))
+    key_id = limiter._key_id("key")
+    requests = limiter._bucket("dashscope", key_id, "rpm")
+    tokens = limiter._bucket("dashscope", key_id, "tpm")
+    assert requests.available() == pytest.approx(0.0)
+    assert tokens.available() == pytest.approx(20.0)
+
+    limiter.release("dashscope", "key", 80)
+    assert requests.available() == pytest.approx(1.0)
+    assert tokens.available() == pytest.approx(100.0)
+
+
+def test_acquire_waits_when_over_quota(limiter, monkeypatch):
+    sleeps = []
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(rate_limiter_module.asyncio, "sleep", fake_sleep)
+
+    async def acquire_twice():
+        await limiter.acquire("dashscope", "key", 10)
+        await limiter.acquire("dashscope", "key", 10)
+
+    asyncio.run(acquire_twice())
+    assert sleeps == [pytest.approx(1.0)]
+    assert limiter.paced == 1
+
+
+def test_unconfigured_provider_is_not_limited(limiter):
+    assert limiter._bucket("deepseek", "default", "rpm") is None
+
+
+@pytest.mark.parametrize("options", [{"max_tokens": "256"}, {"num_predict": [1]}, {"max_tokens": True}])
+def test_completion_budget_rejects_non_numeric(options):
+    """预估token数前先校验类型，非数字的输出上限返回422而不是500"""
+    with pytest.raises(HTTPException) as exc_info:
+        llm_adapter._completion_budget(options)
+    assert exc_info.value.status_code == 422
+
+
+def test_completion_budget_defaults(monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_default_completion_tokens", 100)
+    assert llm_adapter._completion_budget({"num_predict": 50}) == 50
+    assert llm_adapter._completion_budget({"max_tokens": -1}) == 100
+    assert llm_adapter._completion_budget({}) == 100
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+响应缓存测试：按条目数与字节数的LRU淘汰、TTL过期
+"""
+
+import pytest
+
+from app.services.response_cache import ResponseCache
+
+
+def test_cache_lru_by_entries(clock):
+    cache = ResponseCache(max_entries=2, max_bytes=1000, ttl=60)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a").content == "1"
+    cache.put("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.evictions == 1
+
+
+def test_cache_lru_by_bytes(clock):
+    cache = ResponseCache(max_entries=10, max_bytes=10, ttl=60)
+    cache.put("big", "x" * 11)
+    assert cache.get("big") is None
+    cache.put("a", "x" * 6)
+    cache.put("b", "你")
+    cache.put("c", "x" * 4)
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 7
+
+
+def test_cache_ttl(clock):
+    cache = ResponseCache(max_entries=10, max_bytes=1000, ttl=60)
+    cache.put("a", "1", done_reason="stop", eval_count=1)
+    clock.now += 59
+    assert cache.get("a").done_reason == "stop"
+    clock.now += 1
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert stats["expirations"] == 1
+    assert stats["entries"] == 0
+    assert stats["hits"] == 1 and stats["misses"] == 1
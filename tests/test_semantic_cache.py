@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+语义缓存索引测试：相似度查找、重复提问覆盖、扩容、LRU与过期淘汰、字节上限
+"""
+
+import math
+
+import numpy as np
+import pytest
+
+from app.services.response_cache import CachedResponse
+from app.services.semantic_cache import INITIAL_CAPACITY, _SemanticIndex, normalize_prompt, unit_vector
+
+NOW = 1000.0
+
+
+def entry(content: str = "answer", ttl: float = 60) -> CachedResponse:
+    return CachedResponse(content, "stop", None, None, expires_at=NOW + ttl)
+
+
+def direction(degrees: float):
+    radians = math.radians(degrees)
+    return unit_vector([math.cos(radians), math.sin(radians)])
+
+
+def test_normalize_prompt():
+    assert normalize_prompt("  ＨＥＬＬＯ\n  World ") == "hello world"
+
+
+def test_unit_vector_rejects_zero():
+    assert unit_vector([0.0, 0.0]) is None
+    assert np.allclose(unit_vector([3.0, 4.0]), [0.6, 0.8])
+
+
+def test_search_matches_same_context_only():
+    index = _SemanticIndex(dim=2, max_entries=10, max_bytes=10_000)
+    index.put(direction(0), 1, entry("a"), NOW)
+    index.put(direction(90), 1, entry("b"), NOW)
+    index.put(direction(10), 2, entry("c"), NOW)
+
+    slot, similarity = index.search(direction(5), 1, NOW)
+    assert index.entries[slot].content == "a"
+    assert similarity == pytest.approx(math.cos(math.radians(5)), abs=1e-6)
+    assert index.search(direction(0), 3, NOW) == (-1, 0.0)
+
+
+def test_expired_entries_not_returned():
+    index = _SemanticIndex(dim=2, max_entries=10, max_bytes=10_000)
+    index.put(direction(0), 1, entry("a", ttl=10), NOW)
+    assert index.search(direction(0), 1, NOW + 10)[0] == -1
+
+
+def test_duplicate_prompt_overwrites():
+    index = _SemanticIndex(dim=2, max_entries=10, max_bytes=10_000)
+    index.put(direction(0), 1, entry("old"), NOW)
+    index.put(direction(0.01), 1, entry("new"), NOW)
+    assert index.count == 1
+    assert index.bytes == len("new") + index.entry_overhead
+    slot, _ = index.search(direction(0), 1, NOW)
+    assert index.entries[slot].content == "new"
+
+
+def test_grows_up_to_max_entries():
+    max_entries = INITIAL_CAPACITY + 10
+    index = _SemanticIndex(dim=2, max_entries=max_entries, max_bytes=10_000_000)
+    for context in range(max_entries):
+        index.put(direction(0), context, entry(), NOW)
+    assert len(index.entries) == max_entries
+    assert index.count == max_entries
+    assert index.evictions == 0
+
+    index.put(direction(0), max_entries, entry(), NOW)
+    assert len(index.entries) == max_entries
+    assert index.count == max_entries
+    assert index.evictions == 1
+
+
+def test_evicts_least_recently_used():
+    index = _SemanticIndex(dim=2, max_entries=2, max_bytes=10_000)
+    index.put(direction(0), 1, entry("a"), NOW)
+    index.put(direction(0), 2, entry("b"), NOW + 1)
+    slot, _ = index.search(direction(0), 1, NOW + 2)
+    index.touch(slot, NOW + 2)
+
+    index.put(direction(0), 3, entry("c"), NOW + 3)
+    assert index.search(direction(0), 1, NOW + 3)[0] >= 0
+    assert index.search(direction(0), 2, NOW + 3)[0] == -1
+    assert index.evictions == 1
+
+
+def test_expired_slot_reused_before_eviction():
+    index = _SemanticIndex(dim=2, max_entries=2, max_bytes=10_000)
+    index.put(direction(0), 1, entry("a", ttl=1), NOW)
+    index.put(direction(0), 2, entry("b"), NOW)
+    index.put(direction(0), 3, entry("c"), NOW + 5)
+    assert index.evictions == 0
+    assert index.count == 2
+    assert index.search(direction(0), 2, NOW + 5)[0] >= 0
+
+
+def test_byte_limit():
+    overhead = _SemanticIndex(dim=2, max_entries=1, max_bytes=1).entry_overhead
+    index = _SemanticIndex(dim=2, max_entries=10, max_bytes=2 * (10 + overhead))
+    # 单条超过上限时不缓存
+    index.put(direction(0), 1, entry("x" * 100), NOW)
+    assert index.count == 0
+
+    for context in range(3):
+        index.put(direction(0), context, entry("x" * 10), NOW + context)
+    assert index.count == 2
+    assert index.bytes <= index.max_bytes
+    assert index.search(direction(0), 0, NOW + 3)[0] == -1
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+请求合并测试：并发请求共享结果、错误与流，全部调用方离开时取消上游
+"""
+
+import asyncio
+
+from app.services.single_flight import SingleFlight
+
+
+def test_single_flight_shares_result():
+    flight = SingleFlight()
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", factory) for _ in range(3)))
+
+    assert asyncio.run(main()) == ["result"] * 3
+    assert len(calls) == 1
+    assert flight.leaders == 1 and flight.shared == 2
+    assert flight.stats()["in_flight_calls"] == 0
+
+
+def test_single_flight_shares_error():
+    flight = SingleFlight()
+
+    async def factory():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream")
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", factory) for _ in range(2)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_single_flight_cancels_when_all_callers_leave():
+    flight = SingleFlight()
+    cancelled = []
+
+    async def factory():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def main():
+        callers = [asyncio.create_task(flight.do("key", factory)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        callers[0].cancel()
+        await asyncio.sleep(0.01)
+        assert not cancelled
+        callers[1].cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert cancelled == [1]
+
+
+def test_single_flight_stream_replays_for_late_subscriber():
+    flight = SingleFlight()
+    shared_chunks = []
+    started = 0
+
+    async def source():
+        nonlocal started
+        started += 1
+        for chunk in ("a", "b", "c"):
+            yield chunk
+            await asyncio.sleep(0.01)
+
+    async def consume(on_shared_chunk=None):
+        return [chunk async for chunk in flight.stream("key", source, on_shared_chunk)]
+
+    async def main():
+        leader = asyncio.create_task(consume(shared_chunks.append))
+        await asyncio.sleep(0.015)
+        follower = asyncio.create_task(consume(shared_chunks.append))
+        return await asyncio.gather(leader, follower)
+
+    assert asyncio.run(main()) == [["a", "b", "c"], ["a", "b", "c"]]
+    assert started == 1
+    # 回调只在后加入的订阅者中调用，包括回放的帧
+    assert shared_chunks == ["a", "b", "c"]
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+流式编码器测试：帧格式、按字节数与时间窗口合并增量、合并参数校验
+"""
+
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from app.config.settings import settings
+from app.services.stream_encoder import CHUNK_SUFFIX, NDJSONStreamEncoder, pop_coalesce_options
+
+
+def content_of(frame: str) -> str:
+    return json.loads(frame)["message"]["content"]
+
+
+def test_chunk_frame_is_valid_json():
+    encoder = NDJSONStreamEncoder('qwen"turbo')
+    frame = encoder.feed('你好\n"世界"')
+    assert frame.endswith(CHUNK_SUFFIX)
+    data = json.loads(frame)
+    assert data["model"] == 'qwen"turbo'
+    assert data["done"] is False
+    assert data["message"] == {"role": "assistant", "content": '你好\n"世界"'}
+
+
+def test_done_frame_skips_empty_fields():
+    encoder = NDJSONStreamEncoder("qwen-turbo")
+    data = json.loads(encoder.encode_done("stop", eval_count=3, prompt_eval_count=None))
+    assert data["done"] is True
+    assert data["done_reason"] == "stop"
+    assert data["eval_count"] == 3
+    assert "prompt_eval_count" not in data
+
+
+def test_coalesce_by_bytes():
+    encoder = NDJSONStreamEncoder("qwen-turbo", coalesce_bytes=5)
+    assert encoder.feed("ab") is None
+    assert encoder.feed("cd") is None
+    assert content_of(encoder.feed("ef")) == "abcdef"
+    assert encoder.flush() is None
+    assert encoder.feed("g") is None
+    assert content_of(encoder.flush()) == "g"
+
+
+def test_coalesce_by_time_window(clock):
+    encoder = NDJSONStreamEncoder("qwen-turbo", coalesce_ms=50)
+    assert encoder.flush_delay() is None
+    assert encoder.feed("a") is None
+    assert encoder.flush_delay() == pytest.approx(0.05)
+
+    clock.now += 0.03
+    assert encoder.feed("b") is None
+    assert encoder.flush_delay() == pytest.approx(0.02)
+
+    clock.now += 0.03
+    assert content_of(encoder.feed("c")) == "abc"
+    assert encoder.flush_delay() is None
+
+
+def test_flush_delay_expired_window(clock):
+    """上游停顿时窗口到期，调用方按flush_delay主动刷新"""
+    encoder = NDJSONStreamEncoder("qwen-turbo", coalesce_ms=50)
+    encoder.feed("a")
+    clock.now += 1
+    assert encoder.flush_delay() == 0.0
+    assert content_of(encoder.flush()) == "a"
+
+
+def test_flush_delay_without_time_window():
+    encoder = NDJSONStreamEncoder("qwen-turbo", coalesce_bytes=100)
+    encoder.feed("a")
+    assert encoder.flush_delay() is None
+
+
+def test_pop_coalesce_options_defaults(monkeypatch):
+    monkeypatch.setattr(settings, "stream_coalesce_ms", 20)
+    monkeypatch.setattr(settings, "stream_coalesce_bytes", 0)
+    options = {"temperature": 0.5}
+    assert pop_coalesce_options(options) == (20, 0)
+    assert options == {"temperature": 0.5}
+
+
+def test_pop_coalesce_options_removes_overrides():
+    options = {"temperature": 0.5, "stream_coalesce_ms": 15.5, "stream_coalesce_bytes": 64.0}
+    coalesce_ms, coalesce_bytes = pop_coalesce_options(options)
+    assert coalesce_ms == 15.5
+    assert coalesce_bytes == 64 and isinstance(coalesce_bytes, int)
+    assert options == {"temperature": 0.5}
+
+
+@pytest.mark.parametrize("value", [-1, "10", True, float("nan"), float("inf"), [10]])
+def test_pop_coalesce_options_rejects_invalid(value):
+    with pytest.raises(HTTPException) as exc_info:
+        pop_coalesce_options({"stream_coalesce_ms": value})
+    assert exc_info.value.status_code == 422
+    with pytest.raises(HTTPException):
+        pop_coalesce_options({"stream_coalesce_bytes": value})
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""
+启动预热测试：模型目录在事件循环中构建，不与请求处理并发修改目录缓存
+"""
+
+import asyncio
+import threading
+
+from app.services import warmup
+from app.services.warmup import StartupWarmup
+
+
+def test_catalog_built_on_event_loop(monkeypatch):
+    threads = []
+    monkeypatch.setattr(warmup.model_catalog, "tags", lambda: threads.append(threading.get_ident()))
+    startup = StartupWarmup()
+    asyncio.run(startup.run([]))
+    assert startup.ready
+    assert "model_catalog" in startup.steps
+    assert threads == [threading.get_ident()]